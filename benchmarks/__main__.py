@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from . import _harness, bench_config, bench_extract, bench_import, bench_persistence, bench_tunnel  # noqa: F401
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Offline micro-benchmarks of bjut_tech hot paths.'
+    )
+    parser.add_argument('-k', '--filter', help='only run benchmarks whose name contains this string')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='samples per benchmark (default: 5)')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file instead of stdout')
+    parser.add_argument('-c', '--compare', help='JSON results of a previous run to compare against')
+    parser.add_argument('-l', '--list', action='store_true', help='list benchmarks and exit')
+    parser.add_argument(
+        '--check-imports',
+        action='store_true',
+        help='fail if importing bjut_tech loads heavy dependencies or exceeds the time budget, then exit'
+    )
+    args = parser.parse_args(argv)
+
+    if args.check_imports:
+        problems = bench_import.check_imports(args.repeat)
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        return 1 if problems else 0
+
+    names = _harness.get_benchmarks(args.filter)
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    results = []
+    try:
+        for name in names:
+            result = _harness.run(name, args.repeat)
+            print(f'{name:<52} {result["median"] * 1e6:>12.3f} us', file=sys.stderr)
+            results.append(result)
+    finally:
+        bench_persistence.cleanup()
+
+    report = {
+        'meta': _harness.get_metadata(),
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(file=sys.stderr)
+        for name, old, new, ratio in _harness.compare(baseline, report):
+            print(f'{name:<52} {old * 1e6:>12.3f} -> {new * 1e6:>12.3f} us  x{ratio:.2f}', file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_BENCHMARKS: Dict[str, Tuple[Callable[[], Callable[[], Any]], Optional[int], bool]] = {}
+
+_MIN_SAMPLE_TIME = 0.2
+
+
+def benchmark(name: str, number: Optional[int] = None, self_timed: bool = False):
+    # the decorated function does the setup and returns the callable that is timed,
+    # self timed callables return their own duration instead
+    def decorator(setup: Callable[[], Callable[[], Any]]):
+        if name in _BENCHMARKS:
+            raise ValueError(f'Duplicate benchmark: {name}')
+        _BENCHMARKS[name] = (setup, number, self_timed)
+        return setup
+    return decorator
+
+
+def get_benchmarks(pattern: Optional[str] = None) -> List[str]:
+    return [name for name in _BENCHMARKS if pattern is None or pattern in name]
+
+
+def _calibrate(func: Callable[[], Any]) -> int:
+    number = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - started_at >= _MIN_SAMPLE_TIME:
+            return number
+        number *= 2
+
+
+def run(name: str, repeat: int = 5) -> Dict[str, Any]:
+    setup, number, self_timed = _BENCHMARKS[name]
+    func = setup()
+    if number is None:
+        number = _calibrate(func)
+
+    samples = []
+    for _ in range(repeat):
+        if self_timed:
+            samples.append(sum(func() for _ in range(number)) / number)
+            continue
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started_at) / number)
+
+    return {
+        'name': name,
+        'unit': 's',
+        'number': number,
+        'repeat': repeat,
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.mean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0
+    }
+
+
+def get_metadata() -> Dict[str, Any]:
+    try:
+        from importlib.metadata import version
+        package_version = version('bjut-tech')
+    except Exception:
+        package_version = None
+
+    return {
+        'package_version': package_version,
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Tuple[str, float, float, float]]:
+    baseline_results = {result['name']: result for result in baseline['results']}
+
+    rows = []
+    for result in current['results']:
+        old = baseline_results.get(result['name'])
+        if old is None:
+            continue
+        rows.append((result['name'], old['median'], result['median'], result['median'] / old['median']))
+    return rows
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+
+from bjut_tech import ConfigRegistry
+
+from ._harness import benchmark
+
+_SCOPED_BATCH = 1000
+
+
+@benchmark('config.get.env')
+def config_get_env():
+    config = ConfigRegistry()
+    return lambda: config.get('PERSISTENCE_TYPE', 'temp')
+
+
+@benchmark('config.get.override')
+def config_get_override():
+    config = ConfigRegistry()
+    config.set_overrides({'PERSISTENCE_TYPE': 'temp'})
+    return lambda: config.get('PERSISTENCE_TYPE')
+
+
+@benchmark('config.get.bool')
+def config_get_bool():
+    config = ConfigRegistry()
+    return lambda: config.get('PERSISTENCE_CACHE', False)
+
+
+@benchmark('config.get.scoped', self_timed=True)
+def config_get_scoped():
+    config = ConfigRegistry()
+
+    def run():
+        # only the lookups are timed, entering and leaving the scope once per batch is left out
+        with config.override({'PERSISTENCE_TYPE': 'temp'}):
+            started_at = time.perf_counter()
+            for _ in range(_SCOPED_BATCH):
+                config.get('PERSISTENCE_TYPE')
+            return (time.perf_counter() - started_at) / _SCOPED_BATCH
+
+    return run
+
+
+@benchmark('config.snapshot')
+def config_snapshot():
+    config = ConfigRegistry()
+    return config.snapshot
+
+
+@benchmark('config.snapshot.get')
+def config_snapshot_get():
+    snapshot = ConfigRegistry().snapshot()
+    return lambda: snapshot.get('PERSISTENCE_CACHE', False)
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from bjut_tech._extract import HtmlExtractor, XmlExtractor
+
+from ._harness import benchmark
+
+_CHUNK_SIZE = 4096
+
+# shaped like the jwglxt login page, stylesheets and scripts ahead of the form
+_LOGIN_PAGE = (
+    '<!DOCTYPE html><html><head><meta charset="utf-8"><title>教学管理信息服务平台</title>'
+    + ''.join(f'<link rel="stylesheet" href="/zftal-ui-v5-1.0.2/css/style{i}.css?ver=25988391">' for i in range(20))
+    + '<script type="text/javascript">' + 'var _path = "/jwglxt"; ' * 400 + '</script>'
+    + '</head><body><div class="container"><form id="ajaxForm" method="post">'
+    + '<input type="hidden" id="csrftoken" name="csrftoken" value="6bd1fc3e-0fd0-4a86-9e6e-0a42c8d9a1b1,6bd1fc3e0fd04a86"/>'
+    + '<input type="text" id="yhm" name="yhm"/><input type="password" id="hidMm" name="mm"/>'
+    + '</form>'
+    + ''.join(f'<div class="row"><p>{i}</p></div>' for i in range(600))
+    + '</div></body></html>'
+)
+
+_LOGIN_AUTH = (
+    '<?xml version="1.0" encoding="UTF-8"?><Auth>'
+    '<CSRF_RAND_CODE>1843201827</CSRF_RAND_CODE>'
+    '<RSA_ENCRYPT_KEY>' + 'A1B2C3D4' * 64 + '</RSA_ENCRYPT_KEY>'
+    '<RSA_ENCRYPT_EXP>65537</RSA_ENCRYPT_EXP>'
+    + ''.join(f'<Item{i}>value</Item{i}>' for i in range(200))
+    + '</Auth>'
+).encode()
+
+
+def _chunks(data, size: int = _CHUNK_SIZE) -> list:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _feed(extractor, chunks: list):
+    for chunk in chunks:
+        extractor.feed(chunk)
+        if extractor.done:
+            break
+
+
+@benchmark('extract.html.csrftoken')
+def extract_html_csrftoken():
+    chunks = _chunks(_LOGIN_PAGE)
+    return lambda: _feed(HtmlExtractor({'csrftoken': ('input', {'id': 'csrftoken'}, 'value')}), chunks)
+
+
+@benchmark('extract.xml.login_auth')
+def extract_xml_login_auth():
+    chunks = _chunks(_LOGIN_AUTH)
+    return lambda: _feed(XmlExtractor(['CSRF_RAND_CODE', 'RSA_ENCRYPT_KEY', 'RSA_ENCRYPT_EXP']), chunks)
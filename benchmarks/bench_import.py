@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import json
+import statistics
+import subprocess
+import sys
+from typing import List
+
+from ._harness import benchmark
+
+_IMPORT_SCRIPT = 'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+_MODULES_SCRIPT = 'import json, sys; import {module}; print(json.dumps(sorted(sys.modules)))'
+
+# packages that must not be loaded by a bare `import bjut_tech`, they are only needed once used
+HEAVY_MODULES = ('httpx', 'Crypto', 'bs4', 'rsa', 'dill', 'environs', 'oss2')
+LIGHT_IMPORTS = ('bjut_tech', 'bjut_tech.utils')
+IMPORT_BUDGET = 0.05
+
+
+def _import_time(module: str) -> float:
+    # every sample needs a fresh interpreter, the module cache would hide the cost otherwise
+    output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT.format(module=module)])
+    return float(output)
+
+
+@benchmark('import.bjut_tech', number=1, self_timed=True)
+def import_bjut_tech():
+    return lambda: _import_time('bjut_tech')
+
+
+@benchmark('import.bjut_tech.tunnel', number=1, self_timed=True)
+def import_bjut_tech_tunnel():
+    return lambda: _import_time('bjut_tech.tunnel')
+
+
+def check_imports(repeat: int = 5, budget: float = IMPORT_BUDGET) -> List[str]:
+    problems = []
+    for module in LIGHT_IMPORTS:
+        output = subprocess.check_output([sys.executable, '-c', _MODULES_SCRIPT.format(module=module)])
+        loaded = {name.split('.', 1)[0] for name in json.loads(output)}
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        if heavy:
+            problems.append(f'import {module} loads {", ".join(heavy)}')
+
+        median = statistics.median(_import_time(module) for _ in range(repeat))
+        if median > budget:
+            problems.append(f'import {module} takes {median * 1e3:.1f} ms, budget is {budget * 1e3:.1f} ms')
+    return problems
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import secrets
+import shutil
+import tempfile
+import time
+from http.cookiejar import Cookie, CookieJar
+
+from bjut_tech.persistence import NoopPersistenceProvider, TemporaryFilePersistenceProvider
+
+from ._harness import benchmark
+
+_COOKIES = [
+    ('webvpn.bjut.edu.cn', ['wengine_vpn_ticketwebvpn_bjut_edu_cn', 'show_vpn', 'heartbeat', 'refresh']),
+    ('.bjut.edu.cn', ['CASTGC', 'route', 'SERVERID']),
+    ('cas.bjut.edu.cn', ['JSESSIONID', 'TGC', 'insert_cookie']),
+    ('jwglxt.bjut.edu.cn', ['JSESSIONID', 'route', 'BIGipServerjwglxt']),
+    ('xgxt.bjut.edu.cn', ['JSESSIONID', 'SESSION', 'route', 'language']),
+    ('my.bjut.edu.cn', ['JSESSIONID', 'MOD_AUTH_CAS', 'route'])
+]
+
+_temp_dirs = []
+
+
+def _cookie_jar() -> CookieJar:
+    jar = CookieJar()
+    expires = int(time.time()) + 86400
+    for domain, names in _COOKIES:
+        for name in names:
+            jar.set_cookie(Cookie(
+                version=0,
+                name=name,
+                value=secrets.token_hex(24),
+                port=None,
+                port_specified=False,
+                domain=domain,
+                domain_specified=domain.startswith('.'),
+                domain_initial_dot=domain.startswith('.'),
+                path='/',
+                path_specified=True,
+                secure=True,
+                expires=expires,
+                discard=False,
+                comment=None,
+                comment_url=None,
+                rest={'HttpOnly': None}
+            ))
+    return jar
+
+
+def _webvpn_state() -> dict:
+    return {
+        'cookies': _cookie_jar(),
+        'iv': b'wrdvpnisthebest!',
+        'key': b'wrdvpnisthebest!'
+    }
+
+
+def _provider(compression: str) -> NoopPersistenceProvider:
+    provider = NoopPersistenceProvider()
+    provider.compression = compression
+    return provider
+
+
+def _temp_provider() -> TemporaryFilePersistenceProvider:
+    provider = TemporaryFilePersistenceProvider()
+    provider.dir = tempfile.mkdtemp(prefix='bjut-tech-benchmark-')
+    _temp_dirs.append(provider.dir)
+    return provider
+
+
+for _compression in ['none', 'zlib']:
+
+    @benchmark(f'persistence.serialize.cookie_jar.{_compression}')
+    def serialize_cookie_jar(compression=_compression):
+        provider = _provider(compression)
+        jar = _cookie_jar()
+        return lambda: provider._serialize(jar)
+
+    @benchmark(f'persistence.deserialize.cookie_jar.{_compression}')
+    def deserialize_cookie_jar(compression=_compression):
+        provider = _provider(compression)
+        data = provider._serialize(_cookie_jar())
+        return lambda: provider._deserialize(data)
+
+    @benchmark(f'persistence.serialize.webvpn_state.{_compression}')
+    def serialize_webvpn_state(compression=_compression):
+        provider = _provider(compression)
+        state = _webvpn_state()
+        return lambda: provider._serialize(state)
+
+    @benchmark(f'persistence.deserialize.webvpn_state.{_compression}')
+    def deserialize_webvpn_state(compression=_compression):
+        provider = _provider(compression)
+        data = provider._serialize(_webvpn_state())
+        return lambda: provider._deserialize(data)
+
+
+@benchmark('persistence.temp.save')
+def temp_save():
+    provider = _temp_provider()
+    state = _webvpn_state()
+    return lambda: provider.save('temp/webvpn_session_benchmark', state)
+
+
+@benchmark('persistence.temp.load')
+def temp_load():
+    provider = _temp_provider()
+    provider.save('temp/webvpn_session_benchmark', _webvpn_state())
+    return lambda: provider.load('temp/webvpn_session_benchmark')
+
+
+@benchmark('persistence.temp.load.missing')
+def temp_load_missing():
+    provider = _temp_provider()
+    return lambda: provider.load('temp/webvpn_session_missing')
+
+
+def cleanup():
+    while _temp_dirs:
+        shutil.rmtree(_temp_dirs.pop(), ignore_errors=True)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import random
+
+from httpx import Client
+
+from bjut_tech.tunnel import LibraryTunnel, WebvpnTunnel
+from bjut_tech.tunnel._base import AbstractTunnel
+
+from ._harness import benchmark
+
+_HOSTS = [
+    'https://cas.bjut.edu.cn',
+    'https://jwglxt.bjut.edu.cn',
+    'https://xgxt.bjut.edu.cn',
+    'https://my.bjut.edu.cn',
+    'https://lib.bjut.edu.cn',
+    'http://172.21.96.50:8080',
+    'https://jw-api.bjut.edu.cn:8443'
+]
+
+_PATHS = [
+    '/',
+    '/xtgl/index_initMenu.html?_t=1700000000000',
+    '/jwglxt/xsxxxggl/xsgrxxwh_cxXsgrxx.html?gnmkdm=N100801&layout=default',
+    '/index/summary/personal.htm',
+    '/static/js/app.8f3e2c.js'
+]
+
+
+def _urls(count: int = 256):
+    rng = random.Random(0)
+    return [rng.choice(_HOSTS) + rng.choice(_PATHS) for _ in range(count)]
+
+
+class _OfflineWebvpnTunnel(WebvpnTunnel):
+
+    def authenticate(self):
+        pass
+
+
+class _OfflineLibraryTunnel(LibraryTunnel):
+
+    def __init__(self, session: Client):
+        AbstractTunnel.__init__(self, session)
+
+
+def _cycle(tunnel_method, urls):
+    iterator = iter(())
+
+    def func():
+        nonlocal iterator
+        try:
+            url = next(iterator)
+        except StopIteration:
+            iterator = iter(urls)
+            url = next(iterator)
+        return tunnel_method(url)
+    return func
+
+
+@benchmark('tunnel.webvpn.transform_url')
+def webvpn_transform_url():
+    tunnel = _OfflineWebvpnTunnel(Client(), 'benchmark', 'benchmark')
+    return _cycle(tunnel.transform_url, _urls())
+
+
+@benchmark('tunnel.webvpn.transform_url.cold')
+def webvpn_transform_url_cold():
+    tunnel = _OfflineWebvpnTunnel(Client(), 'benchmark', 'benchmark')
+    urls = _urls()
+
+    def func():
+        # a changed cipher drops every cached origin
+        tunnel._origin_cache = {}
+        return tunnel.transform_url(urls[0])
+    return func
+
+
+@benchmark('tunnel.webvpn.transform_urls')
+def webvpn_transform_urls():
+    tunnel = _OfflineWebvpnTunnel(Client(), 'benchmark', 'benchmark')
+    urls = _urls()
+    return lambda: tunnel.transform_urls(urls)
+
+
+@benchmark('tunnel.webvpn.recover_url')
+def webvpn_recover_url():
+    tunnel = _OfflineWebvpnTunnel(Client(), 'benchmark', 'benchmark')
+    return _cycle(tunnel.recover_url, tunnel.transform_urls(_urls()))
+
+
+@benchmark('tunnel.library.transform_url')
+def library_transform_url():
+    tunnel = _OfflineLibraryTunnel(Client())
+    return _cycle(tunnel.transform_url, _urls())
+
+
+@benchmark('tunnel.library.recover_url')
+def library_recover_url():
+    tunnel = _OfflineLibraryTunnel(Client())
+    return _cycle(tunnel.recover_url, tunnel.transform_urls(_urls()))
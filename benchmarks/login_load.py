@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from httpx import BaseTransport, Client
+
+from bjut_tech import ConfigRegistry, metrics, ratelimit
+from bjut_tech.auth import CasAuthentication, JwglxtAuthentication
+from bjut_tech.client import create_client
+from bjut_tech.testing import FakeCampus
+from bjut_tech.tunnel import NoTunnel, WebvpnTunnel
+
+from ._harness import get_metadata
+
+_JWGLXT_URL = 'https://jwglxt.bjut.edu.cn'
+
+
+def _login_cas(session: Client, username: str, password: str):
+    response = CasAuthentication(NoTunnel(session), username, password).authenticate(
+        f'{_JWGLXT_URL}/xtgl/index_initMenu.html'
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f'CAS login ended with {response.status_code}')
+
+
+def _login_webvpn(session: Client, username: str, password: str):
+    WebvpnTunnel(session, username, password)
+
+
+def _login_jwglxt(session: Client, username: str, password: str):
+    JwglxtAuthentication(NoTunnel(session), _JWGLXT_URL, username, password).authenticate()
+
+
+_TARGETS: Dict[str, Callable[[Client, str, str], None]] = {
+    'cas': _login_cas,
+    'webvpn': _login_webvpn,
+    'jwglxt': _login_jwglxt
+}
+
+
+def _percentile(samples: List[float], percent: float) -> float:
+    # nearest rank
+    index = max(0, min(len(samples) - 1, round(percent / 100 * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+def run_target(
+    campus: FakeCampus,
+    target: str,
+    transport: BaseTransport,
+    logins: int,
+    workers: int,
+    accounts: int
+) -> Dict[str, Any]:
+    login = _TARGETS[target]
+
+    def job(index: int):
+        username = f'user{index % accounts}'
+        started_at = time.perf_counter()
+        # sessions share the transport, creating one per login costs more than the login itself
+        session = create_client(transport=transport)
+        try:
+            login(session, username, 'password')
+            error = None
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        return time.perf_counter() - started_at, error
+
+    campus.reset_stats()
+    metrics.REGISTRY.reset()
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(job, range(logins)))
+    elapsed = time.perf_counter() - started_at
+
+    latencies = sorted(latency for latency, error in outcomes if error is None)
+    errors: Dict[str, int] = {}
+    for _, error in outcomes:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+
+    stats = campus.stats()
+    requests = sum(count for key, count in stats.items() if key.endswith((' GET', ' POST', ' DELETE')))
+    result = {
+        'target': target,
+        'logins': logins,
+        'succeeded': len(latencies),
+        'failed': logins - len(latencies),
+        'errors': errors,
+        'elapsed': elapsed,
+        'logins_per_second': len(latencies) / elapsed,
+        'requests_per_login': requests / logins,
+        'retries': sum(value for _, value in metrics.REGISTRY.collect().get(metrics.HTTP_RETRIES.name, [])),
+        'server': stats
+    }
+    if latencies:
+        result['latency'] = {
+            'min': latencies[0],
+            'p50': _percentile(latencies, 50),
+            'p90': _percentile(latencies, 90),
+            'p99': _percentile(latencies, 99),
+            'max': latencies[-1]
+        }
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.login_load',
+        description='Login throughput against a local fake of CAS, WebVPN and jwglxt.'
+    )
+    parser.add_argument('targets', nargs='*', help=f'any of {", ".join(_TARGETS)} (default: all)')
+    parser.add_argument('-n', '--logins', type=int, default=200, help='logins per target (default: 200)')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='concurrent logins (default: 8)')
+    parser.add_argument('-a', '--accounts', type=int, default=50, help='distinct accounts (default: 50)')
+    parser.add_argument('--latency', type=float, default=0.0, help='server latency per request in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of requests that fail')
+    parser.add_argument('--failure-status', type=int, default=503, help='status of failed requests')
+    parser.add_argument(
+        '--server-rate',
+        type=float,
+        default=0.0,
+        help='requests per second each fake host serves before answering 429 (default: unlimited)'
+    )
+    parser.add_argument('--http', action='store_true', help='serve over local HTTP instead of in-process WSGI')
+    parser.add_argument(
+        '--rate-limit',
+        action='store_true',
+        help='pace requests with the adaptive rate limiter and retry throttled ones (default: off, raw throughput)'
+    )
+    parser.add_argument('-o', '--output', help='write results as JSON to this file instead of stdout')
+    args = parser.parse_args(argv)
+    for target in args.targets:
+        if target not in _TARGETS:
+            parser.error(f'unknown target: {target}')
+
+    config = ConfigRegistry()
+    config.set_overrides({'RATE_LIMIT': args.rate_limit})
+    ratelimit.LIMITER.configure(config)
+
+    campus = FakeCampus(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        rate_limit=args.server_rate,
+        seed=0
+    )
+    server = campus.serve() if args.http else None
+    transport = campus.transport() if server is None else server.transport()
+
+    results = []
+    try:
+        for target in args.targets or list(_TARGETS):
+            result = run_target(campus, target, transport, args.logins, args.workers, args.accounts)
+            latency = result.get('latency', {})
+            print(
+                f'{target:<8} {result["logins_per_second"]:>9.1f} logins/s'
+                f'  p50 {latency.get("p50", 0) * 1e3:>8.2f} ms'
+                f'  p99 {latency.get("p99", 0) * 1e3:>8.2f} ms'
+                f'  failed {result["failed"]}'
+                f'  retries {result["retries"]:.0f}',
+                file=sys.stderr
+            )
+            results.append(result)
+    finally:
+        transport.close()
+        if server is not None:
+            server.close()
+
+    report = {
+        'meta': get_metadata(),
+        'config': {
+            key: value for key, value in vars(args).items() if key not in ('targets', 'output')
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,41 @@
-from . import auth
-from . import persistence
-from . import tunnel
-from . import utils
-from ._config import ConfigRegistry
+from typing import TYPE_CHECKING
+
+from ._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from . import auth
+    from . import client
+    from . import httpcache
+    from . import metrics
+    from . import persistence
+    from . import ratelimit
+    from . import tunnel
+    from . import utils
+    from ._config import ConfigRegistry, ConfigSnapshot
+
+__all__ = [
+    'auth',
+    'client',
+    'httpcache',
+    'metrics',
+    'persistence',
+    'ratelimit',
+    'tunnel',
+    'utils',
+    'ConfigRegistry',
+    'ConfigSnapshot'
+]
+
+# submodules pull in httpx, pycryptodome and friends, load them on first use only
+__getattr__, __dir__ = lazy_exports(__name__, {
+    'auth': '.auth',
+    'client': '.client',
+    'httpcache': '.httpcache',
+    'metrics': '.metrics',
+    'persistence': '.persistence',
+    'ratelimit': '.ratelimit',
+    'tunnel': '.tunnel',
+    'utils': '.utils',
+    'ConfigRegistry': '._config',
+    'ConfigSnapshot': '._config'
+})
@@ -1,7 +1,15 @@
+from __future__ import annotations
+
+import itertools
 import os
-from typing import Dict, Any
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Mapping, Optional
 
-from environs import Env
+if TYPE_CHECKING:
+    from environs import Env
 
 _ENTRIES_STR = [
     'CAS_USERNAME',
@@ -12,20 +20,87 @@ _ENTRIES_STR = [
     'ALIBABA_CLOUD_ACCESS_KEY_SECRET',
     'NOTIFY_EMAIL',
     'PERSISTENCE_TYPE',
+    'PERSISTENCE_COMPRESSION',
     'HE_DATA_PATH'
 ]
 
 _ENTRIES_INTEGER = [
-    # nothing
+    'PERSISTENCE_CACHE_SIZE',
+    'PERSISTENCE_CACHE_TTL',
+    'RATE_LIMIT_CAS',
+    'RATE_LIMIT_WEBVPN',
+    'RATE_LIMIT_JWGLXT',
+    'RATE_LIMIT_RETRIES',
+    'HTTP_MAX_CONNECTIONS',
+    'HTTP_MAX_KEEPALIVE',
+    'HTTP_KEEPALIVE_EXPIRY',
+    'HTTP_CONNECT_TIMEOUT',
+    'HTTP_READ_TIMEOUT',
+    'DNS_CACHE_TTL'
 ]
 
 _ENTRIES_BOOL = [
     'ALIBABA_CLOUD_INTERNAL',
-    'NOTIFY_DRY_RUN'
+    'PERSISTENCE_CACHE',
+    'PERSISTENCE_CACHE_WRITE_BEHIND',
+    'NOTIFY_DRY_RUN',
+    'RATE_LIMIT',
+    'HTTP2',
+    'WEBVPN_PERSIST_SESSION'
 ]
 
-_env = Env()
-_env.read_env(os.path.join(os.getcwd(), '.env'))
+_ENTRY_TYPES: Dict[str, str] = {
+    **{key: 'str' for key in _ENTRIES_STR},
+    **{key: 'int' for key in _ENTRIES_INTEGER},
+    **{key: 'bool' for key in _ENTRIES_BOOL}
+}
+
+# marks a key removed by a scoped override, so lookups fall through to the environment
+_UNSET = object()
+
+# overrides of the current thread or task, registry id -> overrides, layered over the ones from set_overrides.
+# one variable for all registries, a context variable lives as long as the interpreter, ids are never reused
+_scoped_overrides: ContextVar[Optional[Dict[int, Dict[str, Any]]]] = ContextVar('config_overrides', default=None)
+_registry_ids = itertools.count()
+
+_env: Optional[Env] = None
+_env_lock = threading.Lock()
+
+
+def _get_env() -> Env:
+    global _env
+    # .env is read on first lookup, not on import
+    if _env is None:
+        with _env_lock:
+            if _env is None:
+                from environs import Env
+
+                env = Env()
+                env.read_env(os.path.join(os.getcwd(), '.env'))
+                _env = env
+    return _env
+
+
+def _read_entry(key: str, default=None):
+    entry_type = _ENTRY_TYPES.get(key)
+    if entry_type == 'str':
+        return _get_env().str(key, default=default)
+    elif entry_type == 'int':
+        return _get_env().int(key, default=default)
+    elif entry_type == 'bool':
+        return _get_env().bool(key, default=default)
+    else:
+        raise ValueError(f'Unknown config key: {key}')
+
+
+def _read_environment() -> Dict[str, Any]:
+    _get_env()  # loads .env into os.environ
+    return {key: _read_entry(key) for key in _ENTRY_TYPES if key in os.environ}
+
+
+def _clean_overrides(overrides: Mapping[str, Any]) -> Dict[str, Any]:
+    # an empty string unsets the override
+    return {key: value for key, value in overrides.items() if value != ''}
 
 
 class ConfigRegistry:
@@ -33,27 +108,94 @@ class ConfigRegistry:
 
     def __init__(self):
         self._overrides = {}
+        self._id = next(_registry_ids)
 
     def __getitem__(self, key: str):
         return self.get(key)
 
     def get(self, key: str, default=None):
-        if key in self._overrides:
-            return self._overrides[key]
-        elif key in _ENTRIES_STR:
-            return _env.str(key, default=default)
-        elif key in _ENTRIES_INTEGER:
-            return _env.int(key, default=default)
-        elif key in _ENTRIES_BOOL:
-            return _env.bool(key, default=default)
-        else:
-            raise ValueError(f'Unknown config key: {key}')
+        scoped = self._get_scoped()
+        if scoped is not None and key in scoped:
+            value = scoped[key]
+            if value is not _UNSET:
+                return value
+            return _read_entry(key, default)
+
+        overrides = self._overrides
+        if key in overrides:
+            return overrides[key]
+        return _read_entry(key, default)
+
+    def get_overrides(self) -> Dict[str, Any]:
+        overrides = self._overrides.copy()
+        scoped = self._get_scoped()
+        if scoped is not None:
+            for key, value in scoped.items():
+                if value is _UNSET:
+                    overrides.pop(key, None)
+                else:
+                    overrides[key] = value
+        return overrides
 
     def set_overrides(self, overrides: Dict[str, Any]):
-        self._overrides = overrides.copy()
-        for key, value in overrides.items():
-            if value == '':
-                del self._overrides[key]
+        # replaced as a whole, readers in other threads see either the old or the new dict
+        self._overrides = _clean_overrides(overrides)
 
     def clear_overrides(self):
         self._overrides = {}
+
+    @contextmanager
+    def override(self, overrides: Dict[str, Any]) -> Iterator[ConfigRegistry]:
+        # only visible to the current thread or task and the tasks it starts, restored on exit
+        scopes = _scoped_overrides.get() or {}
+        scoped = {
+            **scopes.get(self._id, {}),
+            **{key: _UNSET if value == '' else value for key, value in overrides.items()}
+        }
+        token = _scoped_overrides.set({**scopes, self._id: scoped})
+        try:
+            yield self
+        finally:
+            _scoped_overrides.reset(token)
+
+    def with_overrides(self, overrides: Dict[str, Any]) -> ConfigRegistry:
+        config = ConfigRegistry()
+        config.set_overrides({**self.get_overrides(), **overrides})
+        return config
+
+    def snapshot(self) -> ConfigSnapshot:
+        return ConfigSnapshot(_read_environment(), self.get_overrides())
+
+    def _get_scoped(self) -> Optional[Dict[str, Any]]:
+        scopes = _scoped_overrides.get()
+        return None if scopes is None else scopes.get(self._id)
+
+
+class ConfigSnapshot:
+    # immutable, every entry is parsed once on creation, safe to share between threads
+    __slots__ = ('_environment', '_overrides', '_values')
+
+    def __init__(self, environment: Mapping[str, Any], overrides: Mapping[str, Any]):
+        self._environment = MappingProxyType(dict(environment))
+        self._overrides = MappingProxyType(_clean_overrides(overrides))
+        self._values = MappingProxyType({**self._environment, **self._overrides})
+
+    def __getitem__(self, key: str):
+        return self.get(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self._values[key]
+        except KeyError:
+            if key not in _ENTRY_TYPES:
+                raise ValueError(f'Unknown config key: {key}') from None
+            return default
+
+    def get_overrides(self) -> Dict[str, Any]:
+        return dict(self._overrides)
+
+    def with_overrides(self, overrides: Dict[str, Any]) -> ConfigSnapshot:
+        return ConfigSnapshot(self._environment, {**self._overrides, **overrides})
+
+    def snapshot(self) -> ConfigSnapshot:
+        return self
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from html.parser import HTMLParser
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple, Union
+from xml.etree.ElementTree import XMLPullParser
+
+if TYPE_CHECKING:
+    from httpx import AsyncClient, Client, Response
+
+
+class HtmlExtractor(HTMLParser):
+    # reads attributes of the first tags matching the targets, name -> (tag, attributes to match, attribute to read)
+    text = True
+
+    def __init__(self, targets: Dict[str, Tuple[str, Dict[str, str], str]]):
+        super().__init__()
+        self.targets = targets
+        self.results: Dict[str, str] = {}
+
+    @property
+    def done(self) -> bool:
+        return len(self.results) == len(self.targets)
+
+    def handle_starttag(self, tag: str, attrs):
+        attributes = dict(attrs)
+        for name, (target_tag, match, attribute) in self.targets.items():
+            if name in self.results or tag != target_tag or attributes.get(attribute) is None:
+                continue
+            if all(attributes.get(key) == value for key, value in match.items()):
+                self.results[name] = attributes[attribute]
+
+
+class XmlExtractor:
+    # reads the root tag and the text of the first elements with the given tags
+    text = False
+
+    def __init__(self, tags: Iterable[str] = ()):
+        self.tags = set(tags)
+        self.root: Optional[str] = None
+        self.results: Dict[str, str] = {}
+
+        self._parser = XMLPullParser(events=('start', 'end'))
+
+    @property
+    def done(self) -> bool:
+        return self.root is not None and len(self.results) == len(self.tags)
+
+    def feed(self, data: bytes):
+        self._parser.feed(data)
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = element.tag
+            elif element.tag in self.tags and element.tag not in self.results:
+                self.results[element.tag] = element.text or ''
+            if self.done:
+                return
+
+
+Extractor = Union[HtmlExtractor, XmlExtractor]
+
+
+def extract(session: Client, extractor: Extractor, method: str, url: str, **kwargs) -> Response:
+    # the body is only read until the extractor is done, the connection is dropped after that
+    with session.stream(method, url, **kwargs) as response:
+        if response.is_success:
+            chunks = response.iter_text() if extractor.text else response.iter_bytes()
+            for chunk in chunks:
+                extractor.feed(chunk)
+                if extractor.done:
+                    break
+    return response
+
+
+async def async_extract(session: AsyncClient, extractor: Extractor, method: str, url: str, **kwargs) -> Response:
+    async with session.stream(method, url, **kwargs) as response:
+        if response.is_success:
+            chunks = response.aiter_text() if extractor.text else response.aiter_bytes()
+            async for chunk in chunks:
+                extractor.feed(chunk)
+                if extractor.done:
+                    break
+    return response
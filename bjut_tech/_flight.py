@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# a login that completed this recently is reused instead of starting another one
+FRESHNESS_WINDOW = 5.0
+
+_groups_lock = threading.Lock()
+
+
+class _Flight:
+
+    def __init__(self, owner: Any, future: Optional[asyncio.Future] = None):
+        self.owner = owner
+        self.future = future
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _FlightGroup:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.completed: Dict[Hashable, Tuple[float, Any]] = {}
+
+
+def _get_group(obj) -> _FlightGroup:
+    group = obj.__dict__.get('_flight_group')
+    if group is None:
+        with _groups_lock:
+            group = obj.__dict__.setdefault('_flight_group', _FlightGroup())
+    return group
+
+
+def _begin(group: _FlightGroup, key: Hashable, window: float, owner: Any, future_factory=None):
+    # returns (fresh result, flight, whether this caller leads the flight)
+    with group.lock:
+        completed = group.completed.get(key)
+        if completed is not None and time.monotonic() - completed[0] < window:
+            return completed, None, False
+
+        flight = group.flights.get(key)
+        if flight is None:
+            flight = group.flights[key] = _Flight(owner, None if future_factory is None else future_factory())
+            return None, flight, True
+        return None, flight, False
+
+
+def _finish(group: _FlightGroup, key: Hashable, flight: _Flight, result, error: Optional[BaseException], window: float):
+    with group.lock:
+        del group.flights[key]
+        if error is None and window > 0:
+            group.completed[key] = (time.monotonic(), result)
+        else:
+            group.completed.pop(key, None)
+
+    flight.result = result
+    flight.error = error
+    if flight.future is not None and not flight.future.done():
+        if error is None:
+            flight.future.set_result(result)
+        else:
+            flight.future.set_exception(error)
+            flight.future.exception()  # followers may be gone, do not log it as unretrieved
+    flight.done.set()
+
+
+def run_flight(obj, key: Hashable, func: Callable[[], Any], window: float = FRESHNESS_WINDOW):
+    # concurrent runs with the same key on one object share the result of the first,
+    # runs from inside the running flight go straight through
+    group = _get_group(obj)
+    thread = threading.get_ident()
+    fresh, flight, leader = _begin(group, key, window, thread)
+    if fresh is not None:
+        return fresh[1]
+    if not leader:
+        if flight.owner == thread:
+            return func()
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        result = func()
+    except BaseException as e:
+        _finish(group, key, flight, None, e, window)
+        raise
+    _finish(group, key, flight, result, None, window)
+    return result
+
+
+async def async_run_flight(obj, key: Hashable, func: Callable[[], Awaitable], window: float = FRESHNESS_WINDOW):
+    group = _get_group(obj)
+    task = asyncio.current_task()
+    fresh, flight, leader = _begin(group, key, window, task, lambda: asyncio.get_running_loop().create_future())
+    if fresh is not None:
+        return fresh[1]
+    if not leader:
+        if flight.owner is task:
+            return await func()
+        return await asyncio.shield(flight.future)
+
+    try:
+        result = await func()
+    except BaseException as e:
+        _finish(group, key, flight, None, e, window)
+        raise
+    _finish(group, key, flight, result, None, window)
+    return result
+
+
+def single_flight(name: str = 'login', window: float = FRESHNESS_WINDOW):
+    # concurrent calls on one instance share a single run, methods with the same name share it too
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                key = (name, args, tuple(sorted(kwargs.items())))
+                return await async_run_flight(self, key, functools.partial(func, self, *args, **kwargs), window)
+        else:
+            @functools.wraps(func)
+            def wrapper(self, *args, **kwargs):
+                key = (name, args, tuple(sorted(kwargs.items())))
+                return run_flight(self, key, functools.partial(func, self, *args, **kwargs), window)
+        return wrapper
+    return decorator
+
+
+def _get_foreign_flights(objs: Iterable, owner: Any) -> List[_Flight]:
+    flights = []
+    for obj in objs:
+        group = obj.__dict__.get('_flight_group')
+        if group is None:
+            continue
+        with group.lock:
+            flights.extend(flight for flight in group.flights.values() if flight.owner != owner)
+    return flights
+
+
+def wait_for_flights(objs: Iterable) -> bool:
+    # requests sent while another thread logs in could carry stale cookies back into the jar
+    flights = _get_foreign_flights(objs, threading.get_ident())
+    for flight in flights:
+        flight.done.wait()
+    return bool(flights)
+
+
+async def async_wait_for_flights(objs: Iterable) -> bool:
+    flights = [flight for flight in _get_foreign_flights(objs, asyncio.current_task()) if flight.future is not None]
+    for flight in flights:
+        await asyncio.wait([flight.future])
+    return bool(flights)
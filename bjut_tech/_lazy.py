@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import importlib
+import sys
+from typing import Callable, Dict, List, Tuple
+
+
+def lazy_exports(package: str, exports: Dict[str, str]) -> Tuple[Callable[[str], object], Callable[[], List[str]]]:
+    # exports maps a public name to the relative module defining it, or to the module itself
+    def __getattr__(name: str):
+        module_name = exports.get(name)
+        if module_name is None:
+            raise AttributeError(f'module {package!r} has no attribute {name!r}')
+
+        module = importlib.import_module(module_name, package)
+        value = module if module_name == f'.{name}' else getattr(module, name)
+        # later lookups find the attribute directly and skip this hook
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted({*vars(sys.modules[package]), *exports})
+
+    return __getattr__, __dir__
@@ -0,0 +1,492 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urljoin, urlparse
+
+from httpx import AsyncBaseTransport, AsyncByteStream, BaseTransport, ByteStream, Response, SyncByteStream
+
+from . import metrics, ratelimit
+from ._flight import async_run_flight, async_wait_for_flights, run_flight, wait_for_flights
+
+if TYPE_CHECKING:
+    from httpx import AsyncClient, Client, Request
+    from .httpcache import CacheEntry, ResponseCache
+    from .tunnel import AbstractTunnel, AsyncAbstractTunnel
+
+_reauth_suspended: ContextVar[bool] = ContextVar('_reauth_suspended', default=False)
+
+
+@contextmanager
+def suspend_reauth():
+    token = _reauth_suspended.set(True)
+    try:
+        yield
+    finally:
+        _reauth_suspended.reset(token)
+
+
+def without_reauth(func):
+    # login flows request pages that look like expired sessions on purpose
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with suspend_reauth():
+                return await func(*args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with suspend_reauth():
+                return func(*args, **kwargs)
+    return wrapper
+
+
+def wrap_transports(session: Union[Client, AsyncClient], wrapper: Callable):
+    session._transport = wrapper(session._transport)
+    session._mounts = {
+        pattern: None if transport is None else wrapper(transport)
+        for pattern, transport in session._mounts.items()
+    }
+
+
+def find_transport(session: Union[Client, AsyncClient], cls: type):
+    transport = session._transport
+    while transport is not None:
+        if isinstance(transport, cls):
+            return transport
+        transport = getattr(transport, 'wrapped', None)
+    return None
+
+
+class _ReauthTransportBase:
+
+    def __init__(self, tunnel: Union[AbstractTunnel, AsyncAbstractTunnel], handlers: List):
+        self.tunnel = tunnel
+        self.handlers = handlers
+
+    def _find_handler(self, request: Request, response: Response):
+        if _reauth_suspended.get():
+            return None
+        if not isinstance(request.stream, ByteStream):
+            # streamed bodies cannot be replayed
+            return None
+
+        url = self.tunnel.recover_url(str(request.url))
+        location: Optional[str] = None
+        if response.is_redirect:
+            location = self.tunnel.recover_url(urljoin(str(request.url), response.headers['Location']))
+
+        for handler in self.handlers:
+            if handler.is_session_expired(url, location, response.status_code):
+                return handler
+        return None
+
+    def _prepare_replay(self, request: Request):
+        # cookies were renewed by a login, the stale ones are still in the header
+        if 'Cookie' in request.headers:
+            del request.headers['Cookie']
+        self.tunnel.get_session().cookies.set_cookie_header(request)
+
+
+class ReauthTransport(_ReauthTransportBase, BaseTransport):
+
+    def __init__(self, wrapped: BaseTransport, tunnel: AbstractTunnel, handlers: List):
+        super().__init__(tunnel, handlers)
+        self.wrapped = wrapped
+
+    def handle_request(self, request: Request) -> Response:
+        # requests of a login flow run with re-authentication suspended and must not wait for themselves
+        if not _reauth_suspended.get() and wait_for_flights(self.handlers):
+            self._prepare_replay(request)
+        response = self.wrapped.handle_request(request)
+
+        # the replay may run into the next layer, e.g. the tunnel is back but the service session is gone too
+        renewed = []
+        handler = self._find_handler(request, response)
+        while handler is not None and handler not in renewed:
+            renewed.append(handler)
+            metrics.REAUTHENTICATIONS.inc(handler=type(handler).__name__)
+            response.close()
+            with suspend_reauth():
+                handler.reauthenticate()
+
+            self._prepare_replay(request)
+            response = self.wrapped.handle_request(request)
+            handler = self._find_handler(request, response)
+        return response
+
+    def close(self):
+        self.wrapped.close()
+
+
+class AsyncReauthTransport(_ReauthTransportBase, AsyncBaseTransport):
+
+    def __init__(self, wrapped: AsyncBaseTransport, tunnel: AsyncAbstractTunnel, handlers: List):
+        super().__init__(tunnel, handlers)
+        self.wrapped = wrapped
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if not _reauth_suspended.get() and await async_wait_for_flights(self.handlers):
+            self._prepare_replay(request)
+        response = await self.wrapped.handle_async_request(request)
+
+        renewed = []
+        handler = self._find_handler(request, response)
+        while handler is not None and handler not in renewed:
+            renewed.append(handler)
+            metrics.REAUTHENTICATIONS.inc(handler=type(handler).__name__)
+            await response.aclose()
+            with suspend_reauth():
+                await handler.reauthenticate()
+
+            self._prepare_replay(request)
+            response = await self.wrapped.handle_async_request(request)
+            handler = self._find_handler(request, response)
+        return response
+
+    async def aclose(self):
+        await self.wrapped.aclose()
+
+
+class _CountingStream(SyncByteStream, AsyncByteStream):
+
+    def __init__(self, stream: Union[SyncByteStream, AsyncByteStream], host: str):
+        self.stream = stream
+        self.host = host
+        self.received = 0
+        self.closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.stream:
+            self.received += len(chunk)
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            self.received += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self._record()
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self._record()
+
+    def _record(self):
+        if not self.closed:
+            self.closed = True
+            metrics.HTTP_RECEIVED_BYTES.inc(self.received, host=self.host)
+
+
+class _MetricsTransportBase:
+
+    def __init__(self, tunnel: Union[AbstractTunnel, AsyncAbstractTunnel]):
+        self.tunnel = tunnel
+
+    def _get_host(self, request: Request) -> str:
+        # tunnelled urls all share the tunnel host, label by the site behind it
+        return urlparse(self.tunnel.recover_url(str(request.url))).hostname or ''
+
+    @staticmethod
+    def _record_request(request: Request, host: str, started_at: float, status: str):
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started_at, host=host, method=request.method)
+        metrics.HTTP_REQUESTS.inc(host=host, method=request.method, status=status)
+        sent = int(request.headers.get('Content-Length', 0))
+        if sent:
+            metrics.HTTP_SENT_BYTES.inc(sent, host=host)
+
+
+class MetricsTransport(_MetricsTransportBase, BaseTransport):
+
+    def __init__(self, wrapped: BaseTransport, tunnel: AbstractTunnel):
+        super().__init__(tunnel)
+        self.wrapped = wrapped
+
+    def handle_request(self, request: Request) -> Response:
+        if not metrics.REGISTRY.enabled:
+            return self.wrapped.handle_request(request)
+
+        host = self._get_host(request)
+        started_at = time.perf_counter()
+        try:
+            response = self.wrapped.handle_request(request)
+        except Exception:
+            self._record_request(request, host, started_at, 'error')
+            raise
+
+        self._record_request(request, host, started_at, str(response.status_code))
+        response.stream = _CountingStream(response.stream, host)
+        return response
+
+    def close(self):
+        self.wrapped.close()
+
+
+class AsyncMetricsTransport(_MetricsTransportBase, AsyncBaseTransport):
+
+    def __init__(self, wrapped: AsyncBaseTransport, tunnel: AsyncAbstractTunnel):
+        super().__init__(tunnel)
+        self.wrapped = wrapped
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if not metrics.REGISTRY.enabled:
+            return await self.wrapped.handle_async_request(request)
+
+        host = self._get_host(request)
+        started_at = time.perf_counter()
+        try:
+            response = await self.wrapped.handle_async_request(request)
+        except Exception:
+            self._record_request(request, host, started_at, 'error')
+            raise
+
+        self._record_request(request, host, started_at, str(response.status_code))
+        response.stream = _CountingStream(response.stream, host)
+        return response
+
+    async def aclose(self):
+        await self.wrapped.aclose()
+
+
+class _RateLimitTransportBase:
+
+    def __init__(self, tunnel: Union[AbstractTunnel, AsyncAbstractTunnel], limiter: ratelimit.RateLimiter):
+        self.tunnel = tunnel
+        self.limiter = limiter
+
+    def _get_hosts(self, request: Request) -> List[str]:
+        # the site behind the tunnel first, it is the one that reports throttling, then the tunnel host
+        host = urlparse(self.tunnel.recover_url(str(request.url))).hostname or ''
+        return [host] if host == request.url.host else [host, request.url.host]
+
+    def _get_retry_delay(self, request: Request, response: Response, attempt: int) -> Optional[float]:
+        if response.status_code not in ratelimit.RETRY_STATUSES or attempt >= self.limiter.retries:
+            return None
+        if request.method not in ratelimit.RETRY_METHODS:
+            return None
+        if not isinstance(request.stream, ByteStream):
+            # streamed bodies cannot be replayed
+            return None
+        return ratelimit.backoff_delay(attempt, response.headers.get('Retry-After'))
+
+
+class RateLimitTransport(_RateLimitTransportBase, BaseTransport):
+
+    def __init__(self, wrapped: BaseTransport, tunnel: AbstractTunnel, limiter: ratelimit.RateLimiter):
+        super().__init__(tunnel, limiter)
+        self.wrapped = wrapped
+
+    def handle_request(self, request: Request) -> Response:
+        if not self.limiter.is_enabled():
+            return self.wrapped.handle_request(request)
+
+        hosts = self._get_hosts(request)
+        attempt = 0
+        while True:
+            delay = self.limiter.reserve(hosts)
+            if delay > 0:
+                metrics.RATE_LIMIT_DELAY.observe(delay, host=hosts[0])
+                time.sleep(delay)
+
+            response = self.wrapped.handle_request(request)
+            self.limiter.record(hosts[0], response.status_code)
+
+            retry_delay = self._get_retry_delay(request, response, attempt)
+            if retry_delay is None:
+                return response
+
+            response.close()
+            metrics.HTTP_RETRIES.inc(host=hosts[0], status=str(response.status_code))
+            time.sleep(retry_delay)
+            attempt += 1
+
+    def close(self):
+        self.wrapped.close()
+
+
+class AsyncRateLimitTransport(_RateLimitTransportBase, AsyncBaseTransport):
+
+    def __init__(self, wrapped: AsyncBaseTransport, tunnel: AsyncAbstractTunnel, limiter: ratelimit.RateLimiter):
+        super().__init__(tunnel, limiter)
+        self.wrapped = wrapped
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if not self.limiter.is_enabled():
+            return await self.wrapped.handle_async_request(request)
+
+        hosts = self._get_hosts(request)
+        attempt = 0
+        while True:
+            delay = self.limiter.reserve(hosts)
+            if delay > 0:
+                metrics.RATE_LIMIT_DELAY.observe(delay, host=hosts[0])
+                await asyncio.sleep(delay)
+
+            response = await self.wrapped.handle_async_request(request)
+            self.limiter.record(hosts[0], response.status_code)
+
+            retry_delay = self._get_retry_delay(request, response, attempt)
+            if retry_delay is None:
+                return response
+
+            await response.aclose()
+            metrics.HTTP_RETRIES.inc(host=hosts[0], status=str(response.status_code))
+            await asyncio.sleep(retry_delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.wrapped.aclose()
+
+
+_Snapshot = Tuple[int, List[Tuple[str, str]], bytes]
+
+
+class _CachingTransportBase:
+
+    def __init__(self, tunnel: Union[AbstractTunnel, AsyncAbstractTunnel], cache: ResponseCache, account: str):
+        self.tunnel = tunnel
+        self.cache = cache
+        self.account = account
+
+    def _get_url(self, request: Request) -> Optional[str]:
+        # login flows must see the live pages
+        if _reauth_suspended.get() or not isinstance(request.stream, ByteStream):
+            return None
+        url = self.tunnel.recover_url(str(request.url))
+        return url if self.cache.is_cacheable(request, url) else None
+
+    def _prepare_request(self, request: Request, entry: Optional[CacheEntry]):
+        if entry is not None:
+            request.headers.update(self.cache.get_validators(entry))
+
+    def _store(self, url: str, response: Response, content: bytes) -> _Snapshot:
+        snapshot = (response.status_code, response.headers.multi_items(), content)
+        self.cache.store(self.account, url, *snapshot)
+        return snapshot
+
+    @staticmethod
+    def _to_snapshot(entry: CacheEntry) -> _Snapshot:
+        return entry.status_code, entry.headers, entry.content
+
+    @staticmethod
+    def _to_response(snapshot: _Snapshot) -> Response:
+        # bodies are kept as received, still encoded, the client decodes them as usual
+        status_code, headers, content = snapshot
+        return Response(status_code, headers=headers, stream=ByteStream(content))
+
+
+class CachingTransport(_CachingTransportBase, BaseTransport):
+
+    def __init__(self, wrapped: BaseTransport, tunnel: AbstractTunnel, cache: ResponseCache, account: str):
+        super().__init__(tunnel, cache, account)
+        self.wrapped = wrapped
+
+    def handle_request(self, request: Request) -> Response:
+        url = self._get_url(request)
+        if url is None:
+            return self.wrapped.handle_request(request)
+
+        host = urlparse(url).hostname or ''
+        entry = self.cache.get(self.account, url)
+        if entry is not None and not self.cache.needs_revalidation(request, entry):
+            metrics.HTTP_CACHE.inc(host=host, result='hit')
+            return self._to_response(self._to_snapshot(entry))
+
+        fetched = False
+
+        def fetch():
+            nonlocal fetched
+            fetched = True
+            return self._fetch(request, url, host, entry)
+
+        # identical requests arriving meanwhile wait for this one instead of going upstream too
+        snapshot = run_flight(self, (self.account, url), fetch, 0)
+        if not fetched:
+            metrics.HTTP_CACHE.inc(host=host, result='coalesced')
+        return self._to_response(snapshot)
+
+    def _fetch(self, request: Request, url: str, host: str, entry: Optional[CacheEntry]) -> _Snapshot:
+        self._prepare_request(request, entry)
+        response = self.wrapped.handle_request(request)
+        try:
+            if response.status_code == 304 and entry is not None:
+                self.cache.refresh(self.account, url, entry)
+                metrics.HTTP_CACHE.inc(host=host, result='revalidated')
+                return self._to_snapshot(entry)
+
+            # the stream itself, responses built with their content already count as read
+            content = b''.join(response.stream)
+        finally:
+            response.close()
+
+        metrics.HTTP_CACHE.inc(host=host, result='miss')
+        return self._store(url, response, content)
+
+    def close(self):
+        self.wrapped.close()
+
+
+class AsyncCachingTransport(_CachingTransportBase, AsyncBaseTransport):
+
+    def __init__(self, wrapped: AsyncBaseTransport, tunnel: AsyncAbstractTunnel, cache: ResponseCache, account: str):
+        super().__init__(tunnel, cache, account)
+        self.wrapped = wrapped
+
+    async def handle_async_request(self, request: Request) -> Response:
+        url = self._get_url(request)
+        if url is None:
+            return await self.wrapped.handle_async_request(request)
+
+        host = urlparse(url).hostname or ''
+        entry = await self._run_cache(self.cache.get, self.account, url)
+        if entry is not None and not self.cache.needs_revalidation(request, entry):
+            metrics.HTTP_CACHE.inc(host=host, result='hit')
+            return self._to_response(self._to_snapshot(entry))
+
+        fetched = False
+
+        async def fetch():
+            nonlocal fetched
+            fetched = True
+            return await self._fetch(request, url, host, entry)
+
+        snapshot = await async_run_flight(self, (self.account, url), fetch, 0)
+        if not fetched:
+            metrics.HTTP_CACHE.inc(host=host, result='coalesced')
+        return self._to_response(snapshot)
+
+    async def _fetch(self, request: Request, url: str, host: str, entry: Optional[CacheEntry]) -> _Snapshot:
+        self._prepare_request(request, entry)
+        response = await self.wrapped.handle_async_request(request)
+        try:
+            if response.status_code == 304 and entry is not None:
+                await self._run_cache(self.cache.refresh, self.account, url, entry)
+                metrics.HTTP_CACHE.inc(host=host, result='revalidated')
+                return self._to_snapshot(entry)
+
+            content = b''.join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+
+        metrics.HTTP_CACHE.inc(host=host, result='miss')
+        return await self._run_cache(self._store, url, response, content)
+
+    async def _run_cache(self, func, *args):
+        # persistence providers block, keep them off the event loop
+        if self.cache.persistence is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def aclose(self):
+        await self.wrapped.aclose()
@@ -1,4 +1,44 @@
-from .cas import CasAuthentication
-from .jwglxt import JwglxtAuthentication
-from .libziyuan import LibziyuanAuthentication
-from .xgxt import XgxtAuthentication
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from .cas import (
+        AsyncCasAuthentication,
+        AsyncCasService,
+        AsyncCasServiceRegistry,
+        CasAuthentication,
+        CasService,
+        CasServiceRegistry
+    )
+    from .jwglxt import AsyncJwglxtAuthentication, JwglxtAuthentication
+    from .libziyuan import LibziyuanAuthentication
+    from .xgxt import AsyncXgxtAuthentication, XgxtAuthentication
+
+__all__ = [
+    'AsyncCasAuthentication',
+    'AsyncCasService',
+    'AsyncCasServiceRegistry',
+    'CasAuthentication',
+    'CasService',
+    'CasServiceRegistry',
+    'AsyncJwglxtAuthentication',
+    'JwglxtAuthentication',
+    'LibziyuanAuthentication',
+    'AsyncXgxtAuthentication',
+    'XgxtAuthentication'
+]
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    'AsyncCasAuthentication': '.cas',
+    'AsyncCasService': '.cas',
+    'AsyncCasServiceRegistry': '.cas',
+    'CasAuthentication': '.cas',
+    'CasService': '.cas',
+    'CasServiceRegistry': '.cas',
+    'AsyncJwglxtAuthentication': '.jwglxt',
+    'JwglxtAuthentication': '.jwglxt',
+    'LibziyuanAuthentication': '.libziyuan',
+    'AsyncXgxtAuthentication': '.xgxt',
+    'XgxtAuthentication': '.xgxt'
+})
@@ -1,22 +1,72 @@
 from __future__ import annotations
 
+import hashlib
+import hmac
+import os
 import sys
+import threading
+import time
 from http import HTTPStatus
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
 from urllib.parse import urlencode, urlparse
 
+from ..client import DEFAULT_HEADERS
+from ..metrics import instrument_login
+from .._flight import single_flight
+from ..persistence import NoopPersistenceProvider
+from .._transport import without_reauth
 from ..utils import random_ipv6
 
 if TYPE_CHECKING:
-    from httpx import Response
-    from ..tunnel import AbstractTunnel
+    from httpx import Client, Response
+    from ..persistence import AbstractPersistenceProvider
+    from ..tunnel import AbstractTunnel, AsyncAbstractTunnel
 
+# cas keeps an idle ticket granting ticket for two hours, the hard limit is longer
+TGT_TTL = 7200
 
-class CasAuthentication:
+# persisted sessions carry a salted digest of the credentials, slow enough that a copy of the store does not
+# give away the password
+_CREDENTIAL_ITERATIONS = 100_000
+
+# one ticket granting ticket per account for the whole process, so that every service of the account signs in
+# with a single credential exchange, keyed by (username, password digest) -> (expires at, ticket)
+_tgt_cache: Dict[Tuple[str, str], Tuple[float, str]] = {}
+_tgt_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_tgt_cache_lock = threading.Lock()
+
+# well known services, name -> (base url, service url, own login page if any), only entry points confirmed
+# against the live deployment belong here, anything else is added with register()
+CAS_SERVICES: Dict[str, Tuple[str, str, Optional[str]]] = {
+    'xgxt': (
+        'https://xgxt.bjut.edu.cn',
+        'https://xgxt.bjut.edu.cn/bgdLoginAction/cas.htm',
+        None
+    )
+}
+
+
+def invalidate_tgt(username: Optional[str] = None):
+    with _tgt_cache_lock:
+        for key in [key for key in _tgt_cache if username is None or key[0] == username]:
+            del _tgt_cache[key]
+
+
+def _get_tgt_lock(account: Tuple[str, str]) -> threading.Lock:
+    with _tgt_cache_lock:
+        return _tgt_locks.setdefault(account, threading.Lock())
+
+
+def _with_ticket(service_url: str, ticket: str) -> str:
+    separator = '&' if '?' in service_url else '?'
+    return f'{service_url}{separator}' + urlencode({'ticket': ticket})
+
+
+class _CasAuthenticationBase:
 
     def __init__(
         self,
-        tunnel: AbstractTunnel,
+        tunnel: Union[AbstractTunnel, AsyncAbstractTunnel],
         username: str,
         password: str
     ):
@@ -29,19 +79,87 @@ class CasAuthentication:
         if not self.username or not self.password:
             raise ValueError('username and password are required')
 
-    def validate_user(self) -> str:
-        session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/v1/users')
+        self._account = (username, hashlib.sha256(password.encode('utf-8')).hexdigest())
+        self._credential_digests: Dict[bytes, bytes] = {}
+
+    def seal_state(self, state: dict) -> dict:
+        # marks persisted state as belonging to these credentials, see check_state
+        salt = os.urandom(16)
+        return {**state, 'credential': {'salt': salt, 'digest': self._get_credential_digest(salt)}}
+
+    def check_state(self, state) -> bool:
+        # state persisted under the username is only handed to callers that also know the password
+        if not isinstance(state, dict) or not isinstance(state.get('credential'), dict):
+            return False
+        credential = state['credential']
+        return hmac.compare_digest(credential['digest'], self._get_credential_digest(credential['salt']))
+
+    def _get_credential_digest(self, salt: bytes) -> bytes:
+        digest = self._credential_digests.get(salt)
+        if digest is None:
+            credentials = f'{self.username}\0{self.password}'.encode('utf-8')
+            digest = hashlib.pbkdf2_hmac('sha256', credentials, salt, _CREDENTIAL_ITERATIONS)
+            self._credential_digests[salt] = digest
+        return digest
 
-        response = session.post(url, headers={
-            'Accept': 'application/json',
-            'User-Agent': 'Mozilla/5.0',
-            'X-Forwarded-For': random_ipv6()
-        }, data={
+    def _get_cached_tgt(self, stale_ticket: Optional[str] = None) -> Optional[str]:
+        with _tgt_cache_lock:
+            entry = _tgt_cache.get(self._account)
+        if entry is None or entry[0] <= time.time() or entry[1] == stale_ticket:
+            return None
+        return entry[1]
+
+    def _cache_tgt(self, ticket: str, expires_at: float):
+        with _tgt_cache_lock:
+            _tgt_cache[self._account] = (expires_at, ticket)
+
+    @staticmethod
+    def _get_headers(**kwargs) -> dict:
+        return {
+            **DEFAULT_HEADERS,
+            'X-Forwarded-For': random_ipv6(),
+            **kwargs
+        }
+
+    def _get_credentials(self) -> dict:
+        return {
             'username': self.username,
             'password': self.password
-        })
+        }
+
+    def _get_tgt_request(self) -> dict:
+        return {
+            'url': self.tunnel.transform_url(f'{self.base_url}/v1/tickets'),
+            'headers': self._get_headers(Accept='application/json'),
+            'data': self._get_credentials(),
+            'follow_redirects': False
+        }
+
+    def _get_st_request(self, tgt: str, service_url: str) -> dict:
+        return {
+            'url': self.tunnel.transform_url(f'{self.base_url}/v1/tickets/{tgt}'),
+            'headers': self._get_headers(),
+            'data': {
+                'service': service_url
+            },
+            'follow_redirects': False
+        }
 
+    def _get_service_request(self, service_url: str, ticket: str) -> dict:
+        return {
+            'url': self.tunnel.transform_url(_with_ticket(service_url, ticket)),
+            'headers': self._get_headers(),
+            'follow_redirects': True
+        }
+
+    def _get_oauth_url(self, service_url: str) -> str:
+        return self.tunnel.transform_url(f'{self.base_url}/clientredirect?' + urlencode({
+            'client_name': 'mc-wx',
+            'service': service_url
+        }))
+
+    @staticmethod
+    def _parse_user(response: Response) -> str:
         if response.status_code == HTTPStatus.OK:
             return response.json()['authentication']['principal']['id']
         elif response.status_code == HTTPStatus.UNAUTHORIZED:
@@ -54,61 +172,298 @@ class CasAuthentication:
             response.raise_for_status()
             raise RuntimeError('unknown error')
 
+    @staticmethod
+    def _parse_ticket(response: Response) -> str:
+        if response.status_code != 201:
+            print(response.status_code, response.text, file=sys.stderr)
+            raise ValueError('CAS auth failed')
+
+        return response.headers['Location'].split('/')[-1]
+
+    @staticmethod
+    def _parse_service_ticket(response: Response) -> Optional[str]:
+        if response.status_code == HTTPStatus.OK:
+            return response.text.strip()
+        if response.status_code in (HTTPStatus.BAD_REQUEST, HTTPStatus.NOT_FOUND):
+            # ticket granting ticket expired or revoked before its time
+            return None
+
+        print(response.status_code, response.text, file=sys.stderr)
+        raise ValueError('CAS service ticket request failed')
+
+    def _set_ticket(self, session: Client, ticket: str):
+        session.cookies.set(
+            **self.tunnel.transform_cookie(name='CASTGC', value=ticket, domain='.bjut.edu.cn')
+        )
+
+    @staticmethod
+    def _is_login_page(url: str) -> bool:
+        parsed_url = urlparse(url)
+        return parsed_url.netloc == 'cas.bjut.edu.cn' and parsed_url.path.startswith('/login')
+
+
+class CasAuthentication(_CasAuthenticationBase):
+
+    def __init__(
+        self,
+        tunnel: AbstractTunnel,
+        username: str,
+        password: str,
+        persistence: Optional[AbstractPersistenceProvider] = None
+    ):
+        super().__init__(tunnel, username, password)
+
+        self.persistence = persistence or NoopPersistenceProvider()
+        self.persistence_key = f'temp/cas_tgc_{username}'
+
+    def validate_user(self) -> str:
+        session = self.tunnel.get_session()
+        url = self.tunnel.transform_url(f'{self.base_url}/v1/users')
+
+        response = session.post(
+            url,
+            headers=self._get_headers(Accept='application/json'),
+            data=self._get_credentials()
+        )
+
+        return self._parse_user(response)
+
+    def get_ticket_granting_ticket(self, stale_ticket: Optional[str] = None) -> str:
+        ticket = self._get_cached_tgt(stale_ticket)
+        if ticket is not None:
+            return ticket
+
+        with _get_tgt_lock(self._account), self.persistence.lock(self.persistence_key):
+            # another thread or worker may have obtained a new ticket while we were waiting
+            ticket = self._get_cached_tgt(stale_ticket)
+            if ticket is not None:
+                return ticket
+
+            state = self.persistence.load(self.persistence_key)
+            if self.check_state(state) and state['ticket'] != stale_ticket and state['expires_at'] > time.time():
+                self._cache_tgt(state['ticket'], state['expires_at'])
+                return state['ticket']
+
+            session = self.tunnel.get_session()
+            ticket = self._parse_ticket(session.post(**self._get_tgt_request()))
+            expires_at = time.time() + TGT_TTL
+            self._cache_tgt(ticket, expires_at)
+            self.persistence.save(self.persistence_key, self.seal_state({
+                'ticket': ticket,
+                'expires_at': expires_at
+            }))
+            return ticket
+
+    def get_service_ticket(self, service_url: str) -> str:
+        session = self.tunnel.get_session()
+        tgt = self.get_ticket_granting_ticket()
+        ticket = self._parse_service_ticket(session.post(**self._get_st_request(tgt, service_url)))
+        if ticket is None:
+            tgt = self.get_ticket_granting_ticket(stale_ticket=tgt)
+            ticket = self._parse_service_ticket(session.post(**self._get_st_request(tgt, service_url)))
+        if ticket is None:
+            raise ValueError('CAS auth failed')
+
+        self._set_ticket(session, tgt)
+        return ticket
+
+    @instrument_login('cas')
+    @without_reauth
     def authenticate(self, service_url: str) -> Response:
-        self._authenticate_ticket()
+        ticket = self.get_service_ticket(service_url)
 
         session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/login')
-        return session.get(url, params={
-            'service': service_url
-        }, headers={
-            'User-Agent': 'Mozilla/5.0',
-            'X-Forwarded-For': random_ipv6()
-        }, follow_redirects=True)
+        return session.get(**self._get_service_request(service_url, ticket))
 
+    @instrument_login('cas')
+    @without_reauth
     def authenticate_oauth(self, service_url: str) -> Response:
         session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/clientredirect?' + urlencode({
-            'client_name': 'mc-wx',
-            'service': service_url
-        }))
-        tried_login = False
+        url = self._get_oauth_url(service_url)
+        # a session still signed in to cas goes straight through, a ticket is only needed at the login page
+        ticket = None
+        attempts = 0
         while True:
-            response = session.get(url, headers={
-                'User-Agent': 'Mozilla/5.0',
-                'X-Forwarded-For': random_ipv6()
-            }, follow_redirects=True)
+            response = session.get(url, headers=self._get_headers(), follow_redirects=True)
 
             url = self.tunnel.recover_url(str(response.url))
             parsed_url = urlparse(url)
             if parsed_url.scheme == 'http':
                 # possible outcome: http page is reached, retry with https
                 url = self.tunnel.transform_url(parsed_url._replace(scheme='https').geturl())
-            elif parsed_url.netloc == 'cas.bjut.edu.cn' and parsed_url.path.startswith('/login') and not tried_login:
-                # possible outcome: at login page, set cookie and try again
-                self._authenticate_ticket()
-                tried_login = True
+            elif self._is_login_page(url) and attempts < 2:
+                # possible outcome: at login page, set the shared ticket, or a new one if that was no longer valid
+                ticket = self.get_ticket_granting_ticket(stale_ticket=ticket)
+                self._set_ticket(session, ticket)
+                attempts += 1
             else:
                 return response
 
-    def _authenticate_ticket(self):
+
+class AsyncCasAuthentication(_CasAuthenticationBase):
+
+    async def validate_user(self) -> str:
         session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/v1/tickets')
+        url = self.tunnel.transform_url(f'{self.base_url}/v1/users')
 
-        response = session.post(url, headers={
-            'Accept': 'application/json',
-            'User-Agent': 'Mozilla/5.0',
-            'X-Forwarded-For': random_ipv6()
-        }, data={
-            'username': self.username,
-            'password': self.password
-        }, follow_redirects=False)
+        response = await session.post(
+            url,
+            headers=self._get_headers(Accept='application/json'),
+            data=self._get_credentials()
+        )
 
-        if response.status_code != 201:
-            print(response.status_code, response.text, file=sys.stderr)
+        return self._parse_user(response)
+
+    async def get_ticket_granting_ticket(self, stale_ticket: Optional[str] = None) -> str:
+        # shares the process wide cache, concurrent tasks of one account may both exchange credentials
+        ticket = self._get_cached_tgt(stale_ticket)
+        if ticket is not None:
+            return ticket
+
+        session = self.tunnel.get_session()
+        ticket = self._parse_ticket(await session.post(**self._get_tgt_request()))
+        self._cache_tgt(ticket, time.time() + TGT_TTL)
+        return ticket
+
+    async def get_service_ticket(self, service_url: str) -> str:
+        session = self.tunnel.get_session()
+        tgt = await self.get_ticket_granting_ticket()
+        ticket = self._parse_service_ticket(await session.post(**self._get_st_request(tgt, service_url)))
+        if ticket is None:
+            tgt = await self.get_ticket_granting_ticket(stale_ticket=tgt)
+            ticket = self._parse_service_ticket(await session.post(**self._get_st_request(tgt, service_url)))
+        if ticket is None:
             raise ValueError('CAS auth failed')
 
-        ticket = response.headers['Location'].split('/')[-1]
-        session.cookies.set(
-            **self.tunnel.transform_cookie(name='CASTGC', value=ticket, domain='.bjut.edu.cn')
-        )
+        self._set_ticket(session, tgt)
+        return ticket
+
+    @instrument_login('cas')
+    @without_reauth
+    async def authenticate(self, service_url: str) -> Response:
+        ticket = await self.get_service_ticket(service_url)
+
+        session = self.tunnel.get_session()
+        return await session.get(**self._get_service_request(service_url, ticket))
+
+    @instrument_login('cas')
+    @without_reauth
+    async def authenticate_oauth(self, service_url: str) -> Response:
+        session = self.tunnel.get_session()
+        url = self._get_oauth_url(service_url)
+        # a session still signed in to cas goes straight through, a ticket is only needed at the login page
+        ticket = None
+        attempts = 0
+        while True:
+            response = await session.get(url, headers=self._get_headers(), follow_redirects=True)
+
+            url = self.tunnel.recover_url(str(response.url))
+            parsed_url = urlparse(url)
+            if parsed_url.scheme == 'http':
+                # possible outcome: http page is reached, retry with https
+                url = self.tunnel.transform_url(parsed_url._replace(scheme='https').geturl())
+            elif self._is_login_page(url) and attempts < 2:
+                # possible outcome: at login page, set the shared ticket, or a new one if that was no longer valid
+                ticket = await self.get_ticket_granting_ticket(stale_ticket=ticket)
+                self._set_ticket(session, ticket)
+                attempts += 1
+            else:
+                return response
+
+
+class _CasServiceBase:
+
+    def __init__(
+        self,
+        cas: Union[CasAuthentication, AsyncCasAuthentication],
+        base_url: str,
+        service_url: str,
+        login_url: Optional[str] = None
+    ):
+        self.cas = cas
+        self.base_url = base_url
+        self.service_url = service_url
+        self.login_url = login_url
+
+    def is_session_expired(self, url: str, location: Optional[str], status_code: int) -> bool:
+        # expired sessions are sent to cas, or to the service's own login page
+        if not url.startswith(self.base_url) or location is None:
+            return False
+        return self.cas._is_login_page(location) or (self.login_url is not None and location.startswith(self.login_url))
+
+
+class CasService(_CasServiceBase):
+
+    @single_flight()
+    def authenticate(self) -> Response:
+        return self.cas.authenticate(self.service_url)
+
+    @single_flight()
+    def reauthenticate(self):
+        self.authenticate()
+
+
+class AsyncCasService(_CasServiceBase):
+
+    @single_flight()
+    async def authenticate(self) -> Response:
+        return await self.cas.authenticate(self.service_url)
+
+    @single_flight()
+    async def reauthenticate(self):
+        await self.authenticate()
+
+
+class _CasServiceRegistryBase:
+    _service_cls: type
+
+    def __init__(self, cas: Union[CasAuthentication, AsyncCasAuthentication]):
+        self.cas = cas
+        self._services: Dict[str, Union[CasService, AsyncCasService]] = {}
+
+        for name, (base_url, service_url, login_url) in CAS_SERVICES.items():
+            self.register(name, base_url, service_url, login_url)
+
+    def __getitem__(self, name: str):
+        return self.get(name)
+
+    def register(self, name: str, base_url: str, service_url: str, login_url: Optional[str] = None):
+        service = self._service_cls(self.cas, base_url, service_url, login_url)
+        self._services[name] = service
+        return service
+
+    def get(self, name: str):
+        service = self._services.get(name)
+        if service is None:
+            raise ValueError(f'Unknown service: {name}')
+        return service
+
+    def enable_auto_reauth(self):
+        # services sign in on their first redirect to a login page, nothing is fetched up front
+        self.cas.tunnel.enable_auto_reauth(*self._services.values())
+
+
+class CasServiceRegistry(_CasServiceRegistryBase):
+    _service_cls = CasService
+
+    def __init__(
+        self,
+        tunnel: AbstractTunnel,
+        username: str,
+        password: str,
+        persistence: Optional[AbstractPersistenceProvider] = None
+    ):
+        super().__init__(CasAuthentication(tunnel, username, password, persistence))
+
+    def authenticate(self, name: str) -> Response:
+        return self.get(name).authenticate()
+
+
+class AsyncCasServiceRegistry(_CasServiceRegistryBase):
+    _service_cls = AsyncCasService
+
+    def __init__(self, tunnel: AsyncAbstractTunnel, username: str, password: str):
+        super().__init__(AsyncCasAuthentication(tunnel, username, password))
+
+    async def authenticate(self, name: str) -> Response:
+        return await self.get(name).authenticate()
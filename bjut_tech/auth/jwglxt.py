@@ -1,22 +1,52 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import threading
 import time
 from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
 from math import floor
-from typing import Tuple, Optional, TYPE_CHECKING
+from typing import Dict, Tuple, Optional, TYPE_CHECKING, Union
+from urllib.parse import urljoin, urlparse
 
-import rsa
-from bs4 import BeautifulSoup
+from ..metrics import instrument_login
+from .._extract import HtmlExtractor, async_extract, extract
+from .._flight import single_flight
+from .._transport import without_reauth
 
 if TYPE_CHECKING:
-    from ..tunnel import AbstractTunnel
+    from httpx import Response
+    from ..tunnel import AbstractTunnel, AsyncAbstractTunnel
 
+PUBLIC_KEY_TTL = 3600
 
-class JwglxtAuthentication:
+# base_url -> (expires at, (modulus hex, exponent hex)), shared by all instances
+_key_cache: Dict[str, Tuple[float, Tuple[str, str]]] = {}
+_key_cache_lock = threading.Lock()
+
+
+def invalidate_public_key(base_url: Optional[str] = None):
+    with _key_cache_lock:
+        if base_url is None:
+            _key_cache.clear()
+        else:
+            _key_cache.pop(base_url, None)
+
+
+def _get_cached_key(base_url: str) -> Optional[Tuple[str, str]]:
+    with _key_cache_lock:
+        entry = _key_cache.get(base_url)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+class _JwglxtAuthenticationBase:
 
     def __init__(
         self,
-        tunnel: AbstractTunnel,
+        tunnel: Union[AbstractTunnel, AsyncAbstractTunnel],
         base_url: str,
         username: str,
         password: str,
@@ -32,61 +62,209 @@ class JwglxtAuthentication:
         if not self.username or not self.password:
             raise ValueError('username and password are required')
 
+    def is_session_expired(self, url: str, location: Optional[str], status_code: int) -> bool:
+        # jwglxt sends expired sessions back to its login page
+        return url.startswith(self.base_url) and location is not None and '/xtgl/login_slogin.html' in location
+
+    def _get_check_request(self) -> dict:
+        return {
+            'url': self.tunnel.transform_url(f'{self.base_url}/xtgl/index_initMenu.html'),
+            'params': {
+                '_t': floor(time.time() * 1000)
+            },
+            'follow_redirects': False
+        }
+
+    def _get_login_request(self, csrf_token: str) -> dict:
+        from Crypto.Cipher import PKCS1_v1_5
+        from Crypto.PublicKey import RSA
+
+        pub_key = RSA.construct((int(self.key[0], 16), int(self.key[1], 16)))
+        password_encrypted = PKCS1_v1_5.new(pub_key).encrypt(self.password.encode('utf-8'))
+        password_encrypted = b64encode(password_encrypted).decode()
+
+        return {
+            'url': self.tunnel.transform_url(f'{self.base_url}/xtgl/login_slogin.html'),
+            'params': {
+                'time': floor(time.time() * 1000)
+            },
+            'data': {
+                'csrftoken': csrf_token,
+                'yhm': self.username,
+                'mm': password_encrypted
+            },
+            'follow_redirects': False
+        }
+
+    def _get_cached_key(self) -> bool:
+        if self.key is None:
+            self.key = _get_cached_key(self.base_url)
+        return self.key is not None
+
+    def _set_key(self, response: Response):
+        response.raise_for_status()
+        data = response.json()
+
+        self.key = (
+            b64decode(data['modulus'].encode()).hex(),
+            b64decode(data['exponent'].encode()).hex()
+        )
+        with _key_cache_lock:
+            _key_cache[self.base_url] = (time.monotonic() + PUBLIC_KEY_TTL, self.key)
+
+    def _check_login_response(self, response: Response) -> bool:
+        # a successful login redirects into the system, a failed one renders the login page again,
+        # a redirect anywhere else proves nothing and has to be confirmed by check()
+        if not response.is_redirect:
+            return False
+        location = urljoin(str(response.request.url), response.headers['Location'])
+        location = self.tunnel.recover_url(location)
+
+        prefix = self.base_url.rstrip('/') + '/'
+        return location.startswith(prefix) and not urlparse(location).path.endswith('/xtgl/login_slogin.html')
+
+    def _invalidate_key(self):
+        self.key = None
+        invalidate_public_key(self.base_url)
+
+    def _get_csrf_request(self) -> dict:
+        return {
+            'extractor': HtmlExtractor({'csrftoken': ('input', {'id': 'csrftoken'}, 'value')}),
+            'method': 'GET',
+            'url': self.tunnel.transform_url(f'{self.base_url}/xtgl/login_slogin.html')
+        }
+
+    @staticmethod
+    def _parse_csrf_token(response: Response, extractor: HtmlExtractor) -> str:
+        response.raise_for_status()
+
+        csrf_token = extractor.results.get('csrftoken')
+        if csrf_token is None:
+            raise RuntimeError('CSRF token not found on login page')
+        return csrf_token
+
+
+class JwglxtAuthentication(_JwglxtAuthenticationBase):
+
     def check(self) -> bool:
         session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/xtgl/index_initMenu.html')
-
-        response = session.get(url, params={
-            '_t': floor(time.time() * 1000)
-        }, follow_redirects=False)
+        response = session.get(**self._get_check_request())
 
         return response.status_code == 200
 
+    @single_flight()
+    @without_reauth
     def authenticate(self):
         if self.check():
             # also for setting initial session cookie
             return
 
-        self._get_key()
-        pub_key = rsa.PublicKey(int(self.key[0], 16), int(self.key[1], 16))
-        password_encrypted = rsa.encrypt(self.password.encode('utf-8'), pub_key)
-        password_encrypted = b64encode(password_encrypted).decode()
+        self._login()
 
-        session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/xtgl/login_slogin.html')
-        session.post(url, params={
-            'time': floor(time.time() * 1000)
-        }, data={
-            'csrftoken': self._get_csrf_token(),
-            'yhm': self.username,
-            'mm': password_encrypted
-        })
-
-        if not self.check():
+    @single_flight()
+    @without_reauth
+    def reauthenticate(self):
+        self._login()
+
+    @instrument_login('jwglxt')
+    def _login(self):
+        key_cached = self._get_cached_key()
+        if self._post_login(parallel=True):
+            return
+
+        # the cached key may have been rotated, or the parallel requests opened two sessions when
+        # there was none yet, retry once in order
+        if key_cached:
+            self._invalidate_key()
+        if not self._post_login(parallel=False):
             raise RuntimeError('Login failed')
 
-    def _get_key(self):
+    def _post_login(self, parallel: bool) -> bool:
         if self.key is not None:
-            return
+            csrf_token = self._get_csrf_token()
+        elif parallel:
+            # the context carries the suspended re-authentication over to the worker thread
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                key_future = executor.submit(contextvars.copy_context().run, self._get_key)
+                csrf_token = self._get_csrf_token()
+                key_future.result()
+        else:
+            self._get_key()
+            csrf_token = self._get_csrf_token()
 
         session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/xtgl/login_getPublicKey.html')
+        response = session.post(**self._get_login_request(csrf_token))
+        return self._check_login_response(response) or self.check()
 
-        response = session.get(url)
-        response.raise_for_status()
-        data = response.json()
+    def _get_key(self):
+        session = self.tunnel.get_session()
+        url = self.tunnel.transform_url(f'{self.base_url}/xtgl/login_getPublicKey.html')
 
-        self.key = (
-            b64decode(data['modulus'].encode()).hex(),
-            b64decode(data['exponent'].encode()).hex()
-        )
+        self._set_key(session.get(url))
 
     def _get_csrf_token(self):
+        request = self._get_csrf_request()
+        response = extract(self.tunnel.get_session(), **request)
+
+        return self._parse_csrf_token(response, request['extractor'])
+
+
+class AsyncJwglxtAuthentication(_JwglxtAuthenticationBase):
+
+    async def check(self) -> bool:
         session = self.tunnel.get_session()
-        url = self.tunnel.transform_url(f'{self.base_url}/xtgl/login_slogin.html')
+        response = await session.get(**self._get_check_request())
 
-        response = session.get(url)
-        response.raise_for_status()
+        return response.status_code == 200
+
+    @single_flight()
+    @without_reauth
+    async def authenticate(self):
+        if await self.check():
+            # also for setting initial session cookie
+            return
+
+        await self._login()
+
+    @single_flight()
+    @without_reauth
+    async def reauthenticate(self):
+        await self._login()
+
+    @instrument_login('jwglxt')
+    async def _login(self):
+        key_cached = self._get_cached_key()
+        if await self._post_login(parallel=True):
+            return
+
+        # the cached key may have been rotated, or the parallel requests opened two sessions when
+        # there was none yet, retry once in order
+        if key_cached:
+            self._invalidate_key()
+        if not await self._post_login(parallel=False):
+            raise RuntimeError('Login failed')
+
+    async def _post_login(self, parallel: bool) -> bool:
+        if self.key is not None:
+            csrf_token = await self._get_csrf_token()
+        elif parallel:
+            _, csrf_token = await asyncio.gather(self._get_key(), self._get_csrf_token())
+        else:
+            await self._get_key()
+            csrf_token = await self._get_csrf_token()
+
+        session = self.tunnel.get_session()
+        response = await session.post(**self._get_login_request(csrf_token))
+        return self._check_login_response(response) or await self.check()
+
+    async def _get_key(self):
+        session = self.tunnel.get_session()
+        url = self.tunnel.transform_url(f'{self.base_url}/xtgl/login_getPublicKey.html')
+
+        self._set_key(await session.get(url))
+
+    async def _get_csrf_token(self):
+        request = self._get_csrf_request()
+        response = await async_extract(self.tunnel.get_session(), **request)
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        return soup.find('input', {'id': 'csrftoken'}).get('value')
+        return self._parse_csrf_token(response, request['extractor'])
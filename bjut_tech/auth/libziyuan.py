@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from io import BytesIO
 from typing import TYPE_CHECKING, Optional
-from xml.etree import ElementTree
 
-import rsa
+from ..client import create_client
+from ..metrics import instrument_login
+from .._extract import XmlExtractor, extract
+from .._flight import single_flight
 
 if TYPE_CHECKING:
     from httpx import Client
@@ -25,16 +26,14 @@ class LibziyuanAuthentication:
 
     @staticmethod
     def check(session: Client) -> bool:
-        response = session.get('https://libziyuan.bjut.edu.cn/por/conf.csp?apiversion=1')
+        extractor = XmlExtractor()
+        response = extract(session, extractor, 'GET', 'https://libziyuan.bjut.edu.cn/por/conf.csp?apiversion=1')
         if response.status_code != 200:
             return False
 
-        etree = ElementTree.parse(BytesIO(response.content))
-        if etree.getroot().tag == 'Conf':
-            return True
-
-        return False
+        return extractor.root == 'Conf'
 
+    @single_flight()
     def authenticate(self, session: Optional[Client] = None) -> Client:
         if session is None:
             session = self._new_session()
@@ -42,27 +41,50 @@ class LibziyuanAuthentication:
         if self.check(session):
             return session
 
-        saved_cookies = self.persistence.load(self.persistence_key)
-        if saved_cookies is not None:
-            session.cookies.update(saved_cookies)
-            if self.check(session):
-                print('[libziyuan] authenticated session reused')
+        if self._restore(session):
+            return session
+
+        # only one worker logs in per account, the others wait and reuse its cookies
+        with self.persistence.lock(self.persistence_key):
+            if self._restore(session):
                 return session
-            self.persistence.delete(self.persistence_key)
 
-        response = session.get('https://libziyuan.bjut.edu.cn/por/login_auth.csp', params={
+            self._login(session)
+            self.persistence.save(self.persistence_key, session.cookies.jar)
+
+        return session
+
+    def _restore(self, session: Client) -> bool:
+        saved_cookies = self.persistence.load(self.persistence_key)
+        if saved_cookies is None:
+            return False
+
+        session.cookies.update(saved_cookies)
+        if self.check(session):
+            print('[libziyuan] authenticated session reused')
+            return True
+
+        self.persistence.delete(self.persistence_key)
+        return False
+
+    @instrument_login('libziyuan')
+    def _login(self, session: Client):
+        from Crypto.Cipher import PKCS1_v1_5
+        from Crypto.PublicKey import RSA
+
+        extractor = XmlExtractor(['CSRF_RAND_CODE', 'RSA_ENCRYPT_KEY', 'RSA_ENCRYPT_EXP'])
+        response = extract(session, extractor, 'GET', 'https://libziyuan.bjut.edu.cn/por/login_auth.csp', params={
             'apiversion': 1
         })
         response.raise_for_status()
 
-        etree = ElementTree.parse(BytesIO(response.content))
-        csrf_token = etree.find('CSRF_RAND_CODE').text
-        rsa_key = etree.find('RSA_ENCRYPT_KEY').text
-        rsa_exp = etree.find('RSA_ENCRYPT_EXP').text
+        csrf_token = extractor.results['CSRF_RAND_CODE']
+        rsa_key = extractor.results['RSA_ENCRYPT_KEY']
+        rsa_exp = extractor.results['RSA_ENCRYPT_EXP']
 
-        pub_key = rsa.PublicKey(int(rsa_key, 16), int(rsa_exp))
+        pub_key = RSA.construct((int(rsa_key, 16), int(rsa_exp)))
         clear_text = f'{self.password}_{csrf_token}'.encode('utf-8')
-        password_encrypted = rsa.encrypt(clear_text, pub_key).hex()
+        password_encrypted = PKCS1_v1_5.new(pub_key).encrypt(clear_text).hex()
 
         response = session.post('https://libziyuan.bjut.edu.cn/por/login_psw.csp', params={
             'anti_replay': 1,
@@ -79,10 +101,6 @@ class LibziyuanAuthentication:
         if 'success' not in response.text:
             raise RuntimeError('Login to webvpn failed')
 
-        self.persistence.save(self.persistence_key, session.cookies.jar)
-
     @staticmethod
-    def _new_session():
-        return Client(headers={
-            'User-Agent': 'Mozilla/5.0'
-        }, verify=False)
+    def _new_session() -> Client:
+        return create_client(verify=False)
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
-from .cas import CasAuthentication
+from .cas import AsyncCasAuthentication, CasAuthentication
+from ..metrics import instrument_login
+from .._flight import single_flight
+from .._transport import without_reauth
 
 if TYPE_CHECKING:
-    from ..tunnel import AbstractTunnel
+    from ..persistence import AbstractPersistenceProvider
+    from ..tunnel import AbstractTunnel, AsyncAbstractTunnel
 
 
 class XgxtAuthentication:
@@ -14,14 +18,15 @@ class XgxtAuthentication:
         self,
         tunnel: AbstractTunnel,
         username: str,
-        password: str
+        password: str,
+        persistence: Optional[AbstractPersistenceProvider] = None
     ):
         self.tunnel = tunnel
         self.base_url = 'https://xgxt.bjut.edu.cn'
 
         self.username = username
         self.password = password
-        self.cas = CasAuthentication(tunnel, username, password)
+        self.cas = CasAuthentication(tunnel, username, password, persistence)
 
         if not self.username or not self.password:
             raise ValueError('username and password are required')
@@ -34,5 +39,55 @@ class XgxtAuthentication:
 
         return response.status_code == 200
 
+    def is_session_expired(self, url: str, location: Optional[str], status_code: int) -> bool:
+        return url.startswith(self.base_url) and location is not None and self.cas._is_login_page(location)
+
+    @single_flight()
+    @instrument_login('xgxt')
+    @without_reauth
     def authenticate(self):
         self.cas.authenticate(f'{self.base_url}/bgdLoginAction/cas.htm')
+
+    @single_flight()
+    def reauthenticate(self):
+        self.authenticate()
+
+
+class AsyncXgxtAuthentication:
+
+    def __init__(
+        self,
+        tunnel: AsyncAbstractTunnel,
+        username: str,
+        password: str
+    ):
+        self.tunnel = tunnel
+        self.base_url = 'https://xgxt.bjut.edu.cn'
+
+        self.username = username
+        self.password = password
+        self.cas = AsyncCasAuthentication(tunnel, username, password)
+
+        if not self.username or not self.password:
+            raise ValueError('username and password are required')
+
+    async def check(self) -> bool:
+        session = self.tunnel.get_session()
+        url = self.tunnel.transform_url(f'{self.base_url}/index/summary/personal.htm')
+
+        response = await session.get(url, follow_redirects=False)
+
+        return response.status_code == 200
+
+    def is_session_expired(self, url: str, location: Optional[str], status_code: int) -> bool:
+        return url.startswith(self.base_url) and location is not None and self.cas._is_login_page(location)
+
+    @single_flight()
+    @instrument_login('xgxt')
+    @without_reauth
+    async def authenticate(self):
+        await self.cas.authenticate(f'{self.base_url}/bgdLoginAction/cas.htm')
+
+    @single_flight()
+    async def reauthenticate(self):
+        await self.authenticate()
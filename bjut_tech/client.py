@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import importlib.util
+import ipaddress
+import socket
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import anyio
+import httpcore
+import httpx
+from httpx import (
+    URL,
+    AsyncBaseTransport,
+    AsyncByteStream,
+    AsyncClient,
+    BaseTransport,
+    Client,
+    Limits,
+    Request,
+    Response,
+    SyncByteStream,
+    Timeout,
+    create_ssl_context
+)
+
+from ._flight import single_flight
+from ._transport import find_transport
+
+if TYPE_CHECKING:
+    from ._config import ConfigRegistry
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0'
+}
+
+# behind webvpn everything goes to one host, a few multiplexed connections carry all of it
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 30
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 20
+DEFAULT_POOL_TIMEOUT = 10
+DEFAULT_DNS_TTL = 300
+
+_DNS_CACHE_SIZE = 1024
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# most specific first, timeouts and protocol errors derive from more general ones
+_HTTPCORE_ERRORS = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError)
+)
+_HTTPCORE_ERROR_TYPES = tuple(httpcore_error for httpcore_error, _ in _HTTPCORE_ERRORS)
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+@functools.lru_cache(maxsize=None)
+def _has_h2() -> bool:
+    return importlib.util.find_spec('h2') is not None
+
+
+def _is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class DnsCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    def get(self, host: str, port: int) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get((host, port))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, host: str, port: int, addresses: List[str], ttl: float = DEFAULT_DNS_TTL):
+        with self._lock:
+            if len(self._entries) >= _DNS_CACHE_SIZE:
+                self._entries = {}
+            self._entries[(host, port)] = (time.monotonic() + ttl, addresses)
+
+    def invalidate(self, host: Optional[str] = None):
+        with self._lock:
+            if host is None:
+                self._entries = {}
+            else:
+                self._entries = {key: entry for key, entry in self._entries.items() if key[0] != host}
+
+    def resolve(self, host: str, port: int, ttl: float = DEFAULT_DNS_TTL) -> List[str]:
+        if _is_ip_address(host):
+            return [host]
+        addresses = self.get(host, port)
+        if addresses is None:
+            addresses = self._lookup(host, port, ttl)
+        return addresses
+
+    @single_flight('resolve', window=0)
+    def _lookup(self, host: str, port: int, ttl: float) -> List[str]:
+        # threads missing the same host at once share one lookup
+        addresses = self.get(host, port)
+        if addresses is not None:
+            return addresses
+
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except (OSError, UnicodeError) as e:
+            # surfaces as httpx.ConnectError, like a failed lookup inside httpcore
+            raise httpcore.ConnectError(f'Failed to resolve {host}: {e}') from e
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        if not addresses:
+            raise httpcore.ConnectError(f'No address found for {host}')
+
+        self.put(host, port, addresses, ttl)
+        return addresses
+
+
+DNS_CACHE = DnsCache()
+
+
+class _CachingBackend(httpcore.SyncBackend):
+
+    def __init__(self, cache: DnsCache, ttl: float):
+        self.cache = cache
+        self.ttl = ttl
+
+    def connect_tcp(self, host: str, port: int, timeout=None, local_address=None, socket_options=None):
+        # the tls handshake still uses the hostname for sni and verification
+        error: Exception = httpcore.ConnectError(f'No address found for {host}')
+        for address in self.cache.resolve(host, port, self.ttl):
+            try:
+                return super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        self.cache.invalidate(host)
+        raise error
+
+
+class _AsyncCachingBackend(httpcore.AnyIOBackend):
+
+    def __init__(self, cache: DnsCache, ttl: float):
+        self.cache = cache
+        self.ttl = ttl
+
+    async def connect_tcp(self, host: str, port: int, timeout=None, local_address=None, socket_options=None):
+        addresses = self.cache.get(host, port)
+        if addresses is None:
+            addresses = await anyio.to_thread.run_sync(self.cache.resolve, host, port, self.ttl)
+
+        error: Exception = httpcore.ConnectError(f'No address found for {host}')
+        for address in addresses:
+            try:
+                return await super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        self.cache.invalidate(host)
+        raise error
+
+
+@contextmanager
+def _map_errors():
+    try:
+        yield
+    except _HTTPCORE_ERROR_TYPES as e:
+        for httpcore_error, httpx_error in _HTTPCORE_ERRORS:
+            if isinstance(e, httpcore_error):
+                raise httpx_error(str(e)) from e
+        raise
+
+
+def _to_httpcore_request(request: Request, content) -> httpcore.Request:
+    return httpcore.Request(
+        method=request.method,
+        url=httpcore.URL(
+            scheme=request.url.raw_scheme,
+            host=request.url.raw_host,
+            port=request.url.port,
+            target=request.url.raw_path
+        ),
+        headers=request.headers.raw,
+        content=content,
+        extensions=request.extensions
+    )
+
+
+class _ResponseStream(SyncByteStream):
+
+    def __init__(self, stream: Iterable[bytes]):
+        self.stream = stream
+
+    def __iter__(self) -> Iterator[bytes]:
+        with _map_errors():
+            yield from self.stream
+
+    def close(self):
+        if hasattr(self.stream, 'close'):
+            self.stream.close()
+
+
+class _AsyncResponseStream(AsyncByteStream):
+
+    def __init__(self, stream: AsyncIterator[bytes]):
+        self.stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _map_errors():
+            async for chunk in self.stream:
+                yield chunk
+
+    async def aclose(self):
+        if hasattr(self.stream, 'aclose'):
+            await self.stream.aclose()
+
+
+class _PooledTransport(BaseTransport):
+    # httpx has no option for the network backend, so this stands in for its HTTPTransport on a pool that has one,
+    # the pool is also where prewarm looks for open connections
+
+    def __init__(self, verify, http2: bool, limits: Limits, network_backend: httpcore.NetworkBackend):
+        self.pool = httpcore.ConnectionPool(
+            ssl_context=create_ssl_context(verify=verify),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http2=http2,
+            network_backend=network_backend
+        )
+
+    def handle_request(self, request: Request) -> Response:
+        with _map_errors():
+            response = self.pool.handle_request(_to_httpcore_request(request, request.stream))
+        return Response(
+            response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions
+        )
+
+    def close(self):
+        self.pool.close()
+
+
+class _AsyncPooledTransport(AsyncBaseTransport):
+
+    def __init__(self, verify, http2: bool, limits: Limits, network_backend: httpcore.AsyncNetworkBackend):
+        self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=create_ssl_context(verify=verify),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http2=http2,
+            network_backend=network_backend
+        )
+
+    async def handle_async_request(self, request: Request) -> Response:
+        with _map_errors():
+            response = await self.pool.handle_async_request(_to_httpcore_request(request, request.stream))
+        return Response(
+            response.status,
+            headers=response.headers,
+            stream=_AsyncResponseStream(response.stream),
+            extensions=response.extensions
+        )
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+
+class _SharedTransport(BaseTransport):
+    # lets many clients use one connection pool, closing a client leaves the pool to its owner
+
+    def __init__(self, wrapped: BaseTransport):
+        self.wrapped = wrapped
+
+    def handle_request(self, request: Request):
+        return self.wrapped.handle_request(request)
+
+    def close(self):
+        pass
+
+
+class _AsyncSharedTransport(AsyncBaseTransport):
+
+    def __init__(self, wrapped: AsyncBaseTransport):
+        self.wrapped = wrapped
+
+    async def handle_async_request(self, request: Request):
+        return await self.wrapped.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+def _get_config(config: Optional[ConfigRegistry]) -> ConfigRegistry:
+    if config is None:
+        from ._config import ConfigRegistry
+
+        config = ConfigRegistry()
+    return config
+
+
+def _use_http2(config: ConfigRegistry) -> bool:
+    http2 = config.get('HTTP2')
+    if http2 is None:
+        return _has_h2()
+    if http2 and not _has_h2():
+        warnings.warn('HTTP/2 not available due to missing h2 package, falling back to HTTP/1.1')
+        return False
+    return http2
+
+
+def _get_limits(config: ConfigRegistry) -> Limits:
+    return Limits(
+        max_connections=config.get('HTTP_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS),
+        max_keepalive_connections=config.get('HTTP_MAX_KEEPALIVE', DEFAULT_MAX_KEEPALIVE),
+        keepalive_expiry=config.get('HTTP_KEEPALIVE_EXPIRY', DEFAULT_KEEPALIVE_EXPIRY)
+    )
+
+
+def _get_timeout(config: ConfigRegistry) -> Timeout:
+    read_timeout = config.get('HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)
+    return Timeout(
+        connect=config.get('HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+        read=read_timeout,
+        write=read_timeout,
+        pool=DEFAULT_POOL_TIMEOUT
+    )
+
+
+def create_transport(config: Optional[ConfigRegistry] = None, verify=True) -> BaseTransport:
+    config = _get_config(config)
+    ttl = config.get('DNS_CACHE_TTL', DEFAULT_DNS_TTL)
+    backend = _CachingBackend(DNS_CACHE, ttl) if ttl > 0 else httpcore.SyncBackend()
+    return _PooledTransport(verify, _use_http2(config), _get_limits(config), backend)
+
+
+def create_async_transport(config: Optional[ConfigRegistry] = None, verify=True) -> AsyncBaseTransport:
+    config = _get_config(config)
+    ttl = config.get('DNS_CACHE_TTL', DEFAULT_DNS_TTL)
+    backend = _AsyncCachingBackend(DNS_CACHE, ttl) if ttl > 0 else httpcore.AnyIOBackend()
+    return _AsyncPooledTransport(verify, _use_http2(config), _get_limits(config), backend)
+
+
+def create_client(
+    config: Optional[ConfigRegistry] = None,
+    transport: Optional[BaseTransport] = None,
+    verify=True,
+    **kwargs
+) -> Client:
+    # a given transport is shared, it outlives the client and is closed by whoever created it
+    config = _get_config(config)
+    return Client(
+        transport=create_transport(config, verify) if transport is None else _SharedTransport(transport),
+        timeout=kwargs.pop('timeout', _get_timeout(config)),
+        headers={**DEFAULT_HEADERS, **kwargs.pop('headers', {})},
+        **kwargs
+    )
+
+
+def create_async_client(
+    config: Optional[ConfigRegistry] = None,
+    transport: Optional[AsyncBaseTransport] = None,
+    verify=True,
+    **kwargs
+) -> AsyncClient:
+    config = _get_config(config)
+    return AsyncClient(
+        transport=create_async_transport(config, verify) if transport is None else _AsyncSharedTransport(transport),
+        timeout=kwargs.pop('timeout', _get_timeout(config)),
+        headers={**DEFAULT_HEADERS, **kwargs.pop('headers', {})},
+        **kwargs
+    )
+
+
+def _get_origins(urls: Iterable[str]) -> List[httpcore.Origin]:
+    origins = []
+    for url in urls:
+        parsed_url = URL(url)
+        origin = httpcore.Origin(
+            parsed_url.raw_scheme,
+            parsed_url.raw_host,
+            parsed_url.port or _DEFAULT_PORTS.get(parsed_url.scheme, 443)
+        )
+        if origin not in origins:
+            origins.append(origin)
+    return origins
+
+
+def _needs_connection(transport: Union[_PooledTransport, _AsyncPooledTransport], origin: httpcore.Origin) -> bool:
+    return not any(
+        connection.can_handle_request(origin) and not connection.is_closed()
+        for connection in transport.pool.connections
+    )
+
+
+def _get_warm_request(origin: httpcore.Origin) -> Request:
+    return Request('HEAD', str(origin) + '/', headers=DEFAULT_HEADERS)
+
+
+def _warm(transport: _PooledTransport, origin: httpcore.Origin):
+    try:
+        # read to the end, an unfinished response drops the connection instead of returning it to the pool
+        response = transport.handle_request(_get_warm_request(origin))
+        response.read()
+        response.close()
+    except Exception:
+        # only an optimization, the real request reports the error
+        pass
+
+
+async def _async_warm(transport: _AsyncPooledTransport, origin: httpcore.Origin):
+    try:
+        response = await transport.handle_async_request(_get_warm_request(origin))
+        await response.aread()
+        await response.aclose()
+    except Exception:
+        pass
+
+
+def prewarm(session: Client, urls: Iterable[str]) -> List[threading.Thread]:
+    # resolves and connects in the background, so a login can reuse the connection when it gets there,
+    # only clients from the factory can tell whether they are connected already
+    transport = find_transport(session, _PooledTransport)
+    if transport is None:
+        return []
+
+    threads = []
+    for origin in _get_origins(urls):
+        if not _needs_connection(transport, origin):
+            continue
+        thread = threading.Thread(target=_warm, args=(transport, origin), name='prewarm', daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def async_prewarm(session: AsyncClient, urls: Iterable[str]) -> List[asyncio.Task]:
+    transport = find_transport(session, _AsyncPooledTransport)
+    if transport is None:
+        return []
+
+    tasks = []
+    for origin in _get_origins(urls):
+        if not _needs_connection(transport, origin):
+            continue
+        task = asyncio.create_task(_async_warm(transport, origin))
+        # the loop only keeps weak references to tasks
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        tasks.append(task)
+    return tasks
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Tuple
+
+if TYPE_CHECKING:
+    from httpx import Request
+    from .persistence import AbstractPersistenceProvider
+
+DEFAULT_MAX_ENTRIES = 1024
+
+# a replayed set-cookie would put stale cookies back into the jar, date and age are wrong on replay
+_UNCACHED_HEADERS = {'set-cookie', 'date', 'age'}
+_CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since', 'if-match', 'if-unmodified-since', 'if-range')
+
+
+def _parse_directives(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+class CacheEntry:
+    __slots__ = ('status_code', 'headers', 'content', 'expires_at', 'etag', 'last_modified')
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: List[Tuple[str, str]],
+        content: bytes,
+        expires_at: float,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        # wall clock, entries outlive the process when persisted
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def can_revalidate(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> CacheEntry:
+        return cls(**data)
+
+
+class ResponseCache:
+
+    def __init__(
+        self,
+        routes: Mapping[str, float],
+        persistence: Optional[AbstractPersistenceProvider] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        # pattern searched in the upstream url -> seconds a response stays fresh, the first match wins,
+        # 0 keeps responses with a validator and revalidates them on every use
+        self.routes = [(re.compile(pattern), ttl) for pattern, ttl in routes.items()]
+        self.persistence = persistence
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Tuple[str, str], CacheEntry] = OrderedDict()
+
+    def get_ttl(self, url: str) -> Optional[float]:
+        for pattern, ttl in self.routes:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def is_cacheable(self, request: Request, url: str) -> bool:
+        if request.method != 'GET' or self.get_ttl(url) is None:
+            return False
+        if any(header in request.headers for header in _CONDITIONAL_HEADERS):
+            # the caller validates on its own
+            return False
+        return 'no-store' not in _parse_directives(request.headers.get('Cache-Control'))
+
+    def get(self, account: str, url: str) -> Optional[CacheEntry]:
+        key = (account, url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self.persistence is None:
+            return None
+        data = self.persistence.load(self._get_persistence_key(account, url))
+        if data is None:
+            return None
+        entry = CacheEntry.from_dict(data)
+        self._put(key, entry)
+        return entry
+
+    def store(
+        self,
+        account: str,
+        url: str,
+        status_code: int,
+        headers: List[Tuple[str, str]],
+        content: bytes
+    ) -> Optional[CacheEntry]:
+        ttl = self.get_ttl(url)
+        response_headers = {name.lower(): value for name, value in headers}
+        if ttl is None or status_code != 200 or 'no-store' in _parse_directives(response_headers.get('cache-control')):
+            return None
+
+        entry = CacheEntry(
+            status_code,
+            [(name, value) for name, value in headers if name.lower() not in _UNCACHED_HEADERS],
+            content,
+            time.time() + ttl,
+            response_headers.get('etag'),
+            response_headers.get('last-modified')
+        )
+        if ttl <= 0 and not entry.can_revalidate():
+            return None
+
+        self._put((account, url), entry)
+        if self.persistence is not None:
+            self.persistence.save(self._get_persistence_key(account, url), entry.to_dict())
+        return entry
+
+    def refresh(self, account: str, url: str, entry: CacheEntry):
+        # a 304 confirmed the entry, it counts as fresh again
+        entry.expires_at = time.time() + (self.get_ttl(url) or 0)
+        if self.persistence is not None:
+            self.persistence.save(self._get_persistence_key(account, url), entry.to_dict())
+
+    def invalidate(self, account: Optional[str] = None, url: Optional[str] = None):
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (account is None or key[0] == account) and (url is None or key[1] == url)
+            ]
+            for key in keys:
+                del self._entries[key]
+
+        if self.persistence is not None and account is not None and url is not None:
+            self.persistence.delete(self._get_persistence_key(account, url))
+
+    @staticmethod
+    def get_validators(entry: CacheEntry) -> Dict[str, str]:
+        validators = {}
+        if entry.etag is not None:
+            validators['If-None-Match'] = entry.etag
+        if entry.last_modified is not None:
+            validators['If-Modified-Since'] = entry.last_modified
+        return validators
+
+    @staticmethod
+    def needs_revalidation(request: Request, entry: CacheEntry) -> bool:
+        directives = _parse_directives(request.headers.get('Cache-Control'))
+        if 'no-cache' in directives or directives.get('max-age') == '0':
+            return True
+        return not entry.is_fresh()
+
+    def _put(self, key: Tuple[str, str], entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _get_persistence_key(account: str, url: str) -> str:
+        digest = hashlib.sha256(f'{account}\0{url}'.encode('utf-8')).hexdigest()
+        return f'temp/http_cache_{digest[:32]}'
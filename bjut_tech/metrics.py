@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+_LabelValues = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_key(labels: Dict[str, str]) -> _LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: _LabelValues) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, registry: MetricsRegistry, name: str, help: str):
+        self._registry = registry
+        self.name = name
+        self.help = help
+
+    def _collect(self) -> List[Tuple[str, _LabelValues, float]]:
+        raise NotImplementedError
+
+    def _reset(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, registry: MetricsRegistry, name: str, help: str):
+        super().__init__(registry, name, help)
+        self._values: Dict[_LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self._registry.enabled:
+            return
+        key = _labels_key(labels)
+        with self._registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry._emit(self.name, amount, labels)
+
+    def get(self, **labels) -> float:
+        with self._registry._lock:
+            return self._values.get(_labels_key(labels), 0)
+
+    def _collect(self):
+        return [(self.name, key, value) for key, value in self._values.items()]
+
+    def _reset(self):
+        self._values = {}
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, registry: MetricsRegistry, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: non-cumulative bucket counts (last one is +Inf), sum
+        self._values: Dict[_LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        if not self._registry.enabled:
+            return
+        key = _labels_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._registry._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+        self._registry._emit(self.name, value, labels)
+
+    def get_count(self, **labels) -> int:
+        with self._registry._lock:
+            entry = self._values.get(_labels_key(labels))
+            return 0 if entry is None else sum(entry[0])
+
+    def get_sum(self, **labels) -> float:
+        with self._registry._lock:
+            entry = self._values.get(_labels_key(labels))
+            return 0.0 if entry is None else entry[1][0]
+
+    def _collect(self):
+        samples = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', (*key, ('le', _format_value(bound))), cumulative))
+            samples.append((f'{self.name}_sum', key, total[0]))
+            samples.append((f'{self.name}_count', key, cumulative))
+        return samples
+
+    def _reset(self):
+        self._values = {}
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.enabled = True
+
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._listeners: List[Callable[[str, float, Dict[str, str]], None]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, buckets)
+
+    def subscribe(self, listener: Callable[[str, float, Dict[str, str]], None]):
+        with self._lock:
+            self._listeners = [*self._listeners, listener]
+
+    def unsubscribe(self, listener: Callable[[str, float, Dict[str, str]], None]):
+        with self._lock:
+            self._listeners = [item for item in self._listeners if item is not listener]
+
+    def collect(self) -> Dict[str, List[Tuple[Dict[str, str], float]]]:
+        result = {}
+        with self._lock:
+            for metric in self._metrics.values():
+                for name, labels, value in metric._collect():
+                    result.setdefault(name, []).append((dict(labels), value))
+        return result
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                samples = metric._collect()
+                if not samples:
+                    continue
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.type}')
+                for name, labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def reset(self):
+        with self._lock:
+            for metric in self._metrics.values():
+                metric._reset()
+
+    def _register(self, cls, name: str, help: str, *args) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} is already registered as a {metric.type}')
+            return metric
+
+    def _emit(self, name: str, value: float, labels: Dict[str, str]):
+        # the list is replaced on change, no lock needed for iterating
+        for listener in self._listeners:
+            try:
+                listener(name, value, labels)
+            except Exception as e:
+                print('[metrics] listener failed:', e, file=sys.stderr)
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'bjut_tech_http_request_duration_seconds',
+    'Time until response headers, by upstream host and method.'
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    'bjut_tech_http_requests_total',
+    'HTTP requests by upstream host, method and status, status is "error" on transport errors.'
+)
+HTTP_SENT_BYTES = REGISTRY.counter(
+    'bjut_tech_http_sent_bytes_total',
+    'Request body bytes sent, by upstream host.'
+)
+HTTP_RECEIVED_BYTES = REGISTRY.counter(
+    'bjut_tech_http_received_bytes_total',
+    'Response body bytes received, by upstream host.'
+)
+LOGIN_ATTEMPTS = REGISTRY.counter(
+    'bjut_tech_login_attempts_total',
+    'Logins started, by authentication type.'
+)
+LOGIN_SUCCESSES = REGISTRY.counter(
+    'bjut_tech_login_successes_total',
+    'Logins completed, by authentication type.'
+)
+LOGIN_FAILURES = REGISTRY.counter(
+    'bjut_tech_login_failures_total',
+    'Logins that raised, by authentication type.'
+)
+LOGIN_DURATION = REGISTRY.histogram(
+    'bjut_tech_login_duration_seconds',
+    'Login duration, by authentication type.'
+)
+REAUTHENTICATIONS = REGISTRY.counter(
+    'bjut_tech_reauthentications_total',
+    'Expired sessions renewed transparently, by handler.'
+)
+HTTP_RETRIES = REGISTRY.counter(
+    'bjut_tech_http_retries_total',
+    'Requests retried after the server asked to slow down, by upstream host and status.'
+)
+HTTP_CACHE = REGISTRY.counter(
+    'bjut_tech_http_cache_total',
+    'Cacheable requests by upstream host and result: hit, miss, revalidated or coalesced.'
+)
+RATE_LIMIT_DELAY = REGISTRY.histogram(
+    'bjut_tech_rate_limit_delay_seconds',
+    'Time requests waited for the rate limiter, by upstream host.'
+)
+TUNNEL_SELECTIONS = REGISTRY.counter(
+    'bjut_tech_tunnel_selections_total',
+    'Tunnels chosen by the selector or by failover, by tunnel and reason.'
+)
+
+
+def instrument_login(auth: str):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started_at = _login_started(auth)
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException:
+                    _login_finished(auth, started_at, False)
+                    raise
+                _login_finished(auth, started_at, True)
+                return result
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started_at = _login_started(auth)
+                try:
+                    result = func(*args, **kwargs)
+                except BaseException:
+                    _login_finished(auth, started_at, False)
+                    raise
+                _login_finished(auth, started_at, True)
+                return result
+        return wrapper
+    return decorator
+
+
+def _login_started(auth: str) -> float:
+    LOGIN_ATTEMPTS.inc(auth=auth)
+    return time.perf_counter()
+
+
+def _login_finished(auth: str, started_at: float, succeeded: bool):
+    LOGIN_DURATION.observe(time.perf_counter() - started_at, auth=auth)
+    (LOGIN_SUCCESSES if succeeded else LOGIN_FAILURES).inc(auth=auth)
@@ -1,5 +1,38 @@
-from ._base import AbstractPersistenceProvider
-from ._selector import get_persistence
-from .noop import NoopPersistenceProvider
-from .oss import OssPersistenceProvider
-from .temp import TemporaryFilePersistenceProvider
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from ._base import AbstractPersistenceProvider
+    from ._codec import AbstractCodec, AbstractCompression, register_codec, register_compression
+    from ._selector import get_persistence
+    from .cached import CachedPersistenceProvider
+    from .noop import NoopPersistenceProvider
+    from .oss import OssPersistenceProvider
+    from .temp import TemporaryFilePersistenceProvider
+
+__all__ = [
+    'AbstractPersistenceProvider',
+    'AbstractCodec',
+    'AbstractCompression',
+    'register_codec',
+    'register_compression',
+    'get_persistence',
+    'CachedPersistenceProvider',
+    'NoopPersistenceProvider',
+    'OssPersistenceProvider',
+    'TemporaryFilePersistenceProvider'
+]
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    'AbstractPersistenceProvider': '._base',
+    'AbstractCodec': '._codec',
+    'AbstractCompression': '._codec',
+    'register_codec': '._codec',
+    'register_compression': '._codec',
+    'get_persistence': '._selector',
+    'CachedPersistenceProvider': '.cached',
+    'NoopPersistenceProvider': '.noop',
+    'OssPersistenceProvider': '.oss',
+    'TemporaryFilePersistenceProvider': '.temp'
+})
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-import sys
-from typing import TYPE_CHECKING
+import threading
+import warnings
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, BinaryIO, ContextManager, Dict, Iterable, Mapping, Optional
 
-import dill
+from . import _codec
 
 if TYPE_CHECKING:
     from .._config import ConfigRegistry
 
+_local_locks: Dict[str, threading.Lock] = {}
+_local_locks_lock = threading.Lock()
+
 
 class AbstractPersistenceProvider:
+    compression: str = 'none'
 
     def load(self, name: str):
         raise NotImplementedError
@@ -20,18 +26,54 @@ class AbstractPersistenceProvider:
     def delete(self, name: str):
         raise NotImplementedError
 
+    def open_write(self, name: str) -> BinaryIO:
+        # raw bytes instead of an encoded object, they replace the old ones on close,
+        # closing through a with block that raises discards them instead
+        raise NotImplementedError
+
+    def open_read(self, name: str) -> Optional[BinaryIO]:
+        # None if there is nothing under the name, like load
+        raise NotImplementedError
+
+    def load_many(self, names: Iterable[str]) -> Dict[str, Any]:
+        return {name: self.load(name) for name in names}
+
+    def save_many(self, objs: Mapping[str, Any]):
+        for name, obj in objs.items():
+            self.save(name, obj)
+
+    def delete_many(self, names: Iterable[str]):
+        for name in names:
+            self.delete(name)
+
+    def lock(self, name: str, ttl: float = 60, timeout: Optional[float] = None) -> ContextManager[None]:
+        # only exclusive within this process, providers shared between nodes override this
+        return self._local_lock(name, timeout)
+
     @classmethod
     def construct(cls, config: ConfigRegistry) -> AbstractPersistenceProvider:
         raise NotImplementedError
 
-    @staticmethod
-    def _serialize(obj) -> bytes:
-        return dill.dumps(obj)
+    def _serialize(self, obj) -> bytes:
+        return _codec.encode(obj, self.compression)
 
     @staticmethod
     def _deserialize(data: bytes):
         try:
-            return dill.loads(data)
+            return _codec.decode(data)
         except Exception as e:
-            print('Error while deserializing:', e, file=sys.stderr)
+            warnings.warn(f'Discarding persisted object that failed to deserialize: {e!r}')
             return None
+
+    @staticmethod
+    @contextmanager
+    def _local_lock(name: str, timeout: Optional[float] = None):
+        with _local_locks_lock:
+            lock = _local_locks.setdefault(name, threading.Lock())
+
+        if not lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise TimeoutError(f'Timed out waiting for lock on {name}')
+        try:
+            yield
+        finally:
+            lock.release()
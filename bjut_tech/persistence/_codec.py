@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import json
+import time
+import zlib
+from base64 import b64decode, b64encode
+from http.cookiejar import Cookie, CookieJar
+from typing import Any, Dict, List
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# magic + format version, followed by one byte codec id and one byte compression id
+_MAGIC = b'BJT\x01'
+_HEADER_SIZE = len(_MAGIC) + 2
+
+
+class AbstractCodec:
+    id: int
+    name: str
+
+    def can_encode(self, obj) -> bool:
+        raise NotImplementedError
+
+    def encode(self, obj) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes):
+        raise NotImplementedError
+
+
+class AbstractCompression:
+    id: int
+    name: str
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+def _encode_cookie(cookie: Cookie) -> list:
+    return [
+        cookie.version, cookie.name, cookie.value,
+        cookie.port, cookie.port_specified,
+        cookie.domain, cookie.domain_specified, cookie.domain_initial_dot,
+        cookie.path, cookie.path_specified,
+        cookie.secure, cookie.expires, cookie.discard,
+        cookie.comment, cookie.comment_url,
+        cookie._rest, cookie.rfc2109
+    ]
+
+
+def _decode_cookie(data: list) -> Cookie:
+    return Cookie(*data)
+
+
+def encode_cookies(jar: CookieJar) -> List[list]:
+    return [_encode_cookie(cookie) for cookie in jar]
+
+
+def decode_cookies(data: List[list]) -> CookieJar:
+    jar = CookieJar()
+    now = time.time()
+    for item in data:
+        cookie = _decode_cookie(item)
+        if not cookie.is_expired(now):
+            jar.set_cookie(cookie)
+    return jar
+
+
+def _is_json_safe(obj) -> bool:
+    # only values that survive a json round trip unchanged, tuples or int keys would not
+    if obj is None or isinstance(obj, (str, int, float, bool, bytes, CookieJar)):
+        return True
+    elif type(obj) is list:
+        return all(_is_json_safe(item) for item in obj)
+    elif type(obj) is dict:
+        return all(isinstance(key, str) and _is_json_safe(value) for key, value in obj.items())
+    return False
+
+
+def _json_default(obj):
+    if isinstance(obj, CookieJar):
+        return {'$cookies': encode_cookies(obj)}
+    elif isinstance(obj, bytes):
+        return {'$bytes': b64encode(obj).decode()}
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _json_object_hook(obj: dict):
+    if len(obj) == 1:
+        if '$cookies' in obj:
+            return decode_cookies(obj['$cookies'])
+        elif '$bytes' in obj:
+            return b64decode(obj['$bytes'])
+    return obj
+
+
+class DillCodec(AbstractCodec):
+    id = 0
+    name = 'dill'
+
+    def can_encode(self, obj) -> bool:
+        return True
+
+    def encode(self, obj) -> bytes:
+        import dill
+        return dill.dumps(obj)
+
+    def decode(self, data: bytes):
+        import dill
+        return dill.loads(data)
+
+
+class CookieJarCodec(AbstractCodec):
+    id = 1
+    name = 'cookies'
+
+    def can_encode(self, obj) -> bool:
+        return isinstance(obj, CookieJar)
+
+    def encode(self, obj: CookieJar) -> bytes:
+        return json.dumps(encode_cookies(obj), separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data: bytes) -> CookieJar:
+        return decode_cookies(json.loads(data))
+
+
+class JsonCodec(AbstractCodec):
+    id = 2
+    name = 'json'
+
+    def can_encode(self, obj) -> bool:
+        return _is_json_safe(obj)
+
+    def encode(self, obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+    def decode(self, data: bytes):
+        return json.loads(data, object_hook=_json_object_hook)
+
+
+class NoCompression(AbstractCompression):
+    id = 0
+    name = 'none'
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCompression(AbstractCompression):
+    id = 1
+    name = 'zlib'
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCompression(AbstractCompression):
+    id = 2
+    name = 'zstd'
+
+    def compress(self, data: bytes) -> bytes:
+        if zstandard is None:
+            raise ImportError('Unable to use `zstd` compression since `zstandard` is not installed.')
+        return zstandard.ZstdCompressor().compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        if zstandard is None:
+            raise ImportError('Unable to use `zstd` compression since `zstandard` is not installed.')
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+# codecs are tried in order, the first one that can encode an object wins
+_CODECS: List[AbstractCodec] = [
+    CookieJarCodec(),
+    JsonCodec(),
+    DillCodec()
+]
+
+_COMPRESSIONS: Dict[str, AbstractCompression] = {
+    compression.name: compression
+    for compression in (NoCompression(), ZlibCompression(), ZstdCompression())
+}
+
+
+def register_codec(codec: AbstractCodec):
+    for existing in _CODECS:
+        if existing.id == codec.id:
+            raise ValueError(f'Codec id {codec.id} is already used by {existing.name}')
+    # keep the catch-all dill codec last
+    _CODECS.insert(len(_CODECS) - 1, codec)
+
+
+def register_compression(compression: AbstractCompression):
+    _COMPRESSIONS[compression.name] = compression
+
+
+def encode(obj, compression: str = 'none') -> bytes:
+    if compression not in _COMPRESSIONS:
+        raise ValueError(f'Unknown compression: {compression}')
+
+    codec = next((codec for codec in _CODECS if codec.can_encode(obj)), None)
+    if codec is None:
+        raise ValueError(f'No codec can encode object of type {type(obj).__name__}')
+
+    data = codec.encode(obj)
+
+    compressor = _COMPRESSIONS[compression]
+    compressed = compressor.compress(data)
+    if len(compressed) >= len(data):
+        compressor = _COMPRESSIONS['none']
+        compressed = data
+
+    return _MAGIC + bytes((codec.id, compressor.id)) + compressed
+
+
+def decode(data: bytes) -> Any:
+    if data[:len(_MAGIC)] != _MAGIC:
+        # written before the versioned header existed
+        return DillCodec().decode(data)
+
+    codec_id, compression_id = data[len(_MAGIC)], data[len(_MAGIC) + 1]
+    codec = next((codec for codec in _CODECS if codec.id == codec_id), None)
+    compressor = next((c for c in _COMPRESSIONS.values() if c.id == compression_id), None)
+    if codec is None or compressor is None:
+        raise ValueError(f'Unknown codec {codec_id} or compression {compression_id}')
+
+    return codec.decode(compressor.decompress(data[_HEADER_SIZE:]))
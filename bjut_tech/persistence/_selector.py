@@ -1,32 +1,71 @@
 from __future__ import annotations
 
 import sys
+import threading
 import warnings
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Tuple
 
 from ._base import AbstractPersistenceProvider
+from .cached import CachedPersistenceProvider
 from .noop import NoopPersistenceProvider
 from .temp import TemporaryFilePersistenceProvider
 
-try:
-    from .oss import OssPersistenceProvider
-except ImportError as e:
-    print(e, file=sys.stderr)
-    warnings.warn('OSS persistence not available due to import error')
-    OssPersistenceProvider = AbstractPersistenceProvider
-
 if TYPE_CHECKING:
     from .._config import ConfigRegistry
 
+# everything that goes into building a provider, equal settings share one cached provider
+_PROVIDER_KEYS = (
+    'PERSISTENCE_TYPE',
+    'PERSISTENCE_COMPRESSION',
+    'PERSISTENCE_CACHE_SIZE',
+    'PERSISTENCE_CACHE_TTL',
+    'PERSISTENCE_CACHE_WRITE_BEHIND',
+    'ALIBABA_CLOUD_ACCESS_KEY_ID',
+    'ALIBABA_CLOUD_ACCESS_KEY_SECRET',
+    'ALIBABA_CLOUD_INTERNAL'
+)
+
+_cached_providers: Dict[Tuple, CachedPersistenceProvider] = {}
+_cached_providers_lock = threading.Lock()
+
 
 def get_persistence(config: ConfigRegistry) -> AbstractPersistenceProvider:
+    if config.get('PERSISTENCE_CACHE', False):
+        # a cached provider owns a write-behind thread and an exit hook, and its cache is only
+        # coherent if everyone in the process goes through the same one
+        key = tuple(config.get(name) for name in _PROVIDER_KEYS)
+        with _cached_providers_lock:
+            persistence = _cached_providers.get(key)
+            if persistence is None:
+                persistence = CachedPersistenceProvider.wrap(_get_backend(config), config)
+                _cached_providers[key] = persistence
+        return persistence
+
+    return _get_backend(config)
+
+
+def _get_backend(config: ConfigRegistry) -> AbstractPersistenceProvider:
     cls_name = config.get('PERSISTENCE_TYPE', 'temp')
 
     if cls_name == 'oss':
-        return OssPersistenceProvider.construct(config)
+        persistence = _get_oss_provider().construct(config)
     elif cls_name == 'temp':
-        return TemporaryFilePersistenceProvider.construct(config)
+        persistence = TemporaryFilePersistenceProvider.construct(config)
     elif cls_name == 'noop':
-        return NoopPersistenceProvider.construct(config)
+        persistence = NoopPersistenceProvider.construct(config)
     else:
         raise ValueError(f'Unknown persistence type: {cls_name}')
+
+    persistence.compression = config.get('PERSISTENCE_COMPRESSION', 'none')
+    return persistence
+
+
+def _get_oss_provider():
+    # oss2 is slow to import and only needed by deployments that persist to oss
+    try:
+        from .oss import OssPersistenceProvider
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        warnings.warn('OSS persistence not available due to import error')
+        return AbstractPersistenceProvider
+    return OssPersistenceProvider
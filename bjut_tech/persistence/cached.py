@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import atexit
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterable, Mapping, Optional, Tuple
+
+from ._base import AbstractPersistenceProvider
+
+if TYPE_CHECKING:
+    from .._config import ConfigRegistry
+
+
+class CachedPersistenceProvider(AbstractPersistenceProvider):
+
+    def __init__(
+        self,
+        backend: AbstractPersistenceProvider,
+        max_size: int = 256,
+        ttl: Optional[float] = 300,
+        write_behind: bool = False,
+        flush_interval: float = 1
+    ):
+        self.backend = backend
+        self.max_size = max_size
+        self.ttl = ttl
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+
+        # values are kept encoded, so callers never share an object with the cache or the writer,
+        # a cookie jar still attached to a client keeps changing after it was saved
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+
+        self._pending: Dict[str, bytes] = {}
+        # taken from pending but not yet in the backend
+        self._writing: Dict[str, bytes] = {}
+        self._pending_changed = threading.Condition(self._lock)
+        # held from taking a pending value until it is written, a delete waits for it instead of being
+        # overwritten by a write that was already under way
+        self._write_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    def __repr__(self):
+        return f'CachedPersistenceProvider(backend={self.backend!r})'
+
+    def load(self, name: str):
+        with self._lock:
+            entry = self._cache.get(name)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > time.monotonic():
+                    self._cache.move_to_end(name)
+                    return self._deserialize(data)
+                del self._cache[name]
+
+            # evicted or expired from the cache, but the backend does not have it yet
+            data = self._get_unwritten(name)
+            if data is not None:
+                self._put(name, data)
+                return self._deserialize(data)
+
+        obj = self.backend.load(name)
+        data = self._serialize(obj)
+        with self._lock:
+            # a save may have raced the backend load, the newer value wins
+            if name not in self._cache and self._get_unwritten(name) is None:
+                self._put(name, data)
+        return obj
+
+    def save(self, name: str, obj):
+        data = self._serialize(obj)
+        with self._lock:
+            self._put(name, data)
+            if self.write_behind:
+                self._pending[name] = data
+                self._ensure_writer()
+                self._pending_changed.notify()
+                return
+
+        self.backend.save(name, obj)
+
+    def delete(self, name: str):
+        with self._lock:
+            self._cache.pop(name, None)
+            self._pending.pop(name, None)
+
+        with self._write_lock:
+            self.backend.delete(name)
+
+    def open_write(self, name: str) -> BinaryIO:
+        # streams bypass the cache, the written bytes supersede whatever is cached or pending
+        with self._lock:
+            self._cache.pop(name, None)
+            self._pending.pop(name, None)
+
+        return self.backend.open_write(name)
+
+    def open_read(self, name: str) -> Optional[BinaryIO]:
+        self._flush_one(name)
+        return self.backend.open_read(name)
+
+    def load_many(self, names: Iterable[str]) -> Dict[str, Any]:
+        result = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for name in names:
+                entry = self._cache.get(name)
+                if entry is not None and entry[0] > now:
+                    self._cache.move_to_end(name)
+                    result[name] = entry[1]
+                    continue
+
+                data = self._get_unwritten(name)
+                if data is None:
+                    missing.append(name)
+                else:
+                    result[name] = data
+                    self._put(name, data)
+        result = {name: self._deserialize(data) for name, data in result.items()}
+
+        if missing:
+            loaded = self.backend.load_many(missing)
+            encoded = {name: self._serialize(obj) for name, obj in loaded.items()}
+            with self._lock:
+                for name, data in encoded.items():
+                    if name not in self._cache and self._get_unwritten(name) is None:
+                        self._put(name, data)
+            result.update(loaded)
+
+        return result
+
+    def save_many(self, objs: Mapping[str, Any]):
+        encoded = {name: self._serialize(obj) for name, obj in objs.items()}
+        with self._lock:
+            for name, data in encoded.items():
+                self._put(name, data)
+            if self.write_behind:
+                self._pending.update(encoded)
+                self._ensure_writer()
+                self._pending_changed.notify()
+                return
+
+        self.backend.save_many(objs)
+
+    def delete_many(self, names: Iterable[str]):
+        names = list(names)
+        with self._lock:
+            for name in names:
+                self._cache.pop(name, None)
+                self._pending.pop(name, None)
+
+        with self._write_lock:
+            self.backend.delete_many(names)
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = 60, timeout: Optional[float] = None):
+        with self.backend.lock(name, ttl, timeout):
+            # the previous holder may have written from another process
+            self.invalidate(name)
+            try:
+                yield
+            finally:
+                self._flush_one(name)
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
+    def flush(self):
+        with self._lock:
+            names = list(self._pending)
+
+        for name in names:
+            try:
+                self._flush_one(name)
+            except Exception as e:
+                print(f'[persistence] write-behind of {name} failed:', e, file=sys.stderr)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pending_changed.notify()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    def _flush_one(self, name: str):
+        with self._write_lock:
+            with self._lock:
+                # gone if a delete or a newer flush got here first
+                data = self._pending.pop(name, None)
+                if data is None:
+                    return
+                self._writing[name] = data
+            try:
+                self.backend.save(name, self._deserialize(data))
+            finally:
+                with self._lock:
+                    del self._writing[name]
+
+    def _get_unwritten(self, name: str) -> Optional[bytes]:
+        # with the lock held, pending values are newer than the one being written
+        data = self._pending.get(name)
+        return self._writing.get(name) if data is None else data
+
+    def _put(self, name: str, data: bytes):
+        expires_at = float('inf') if self.ttl is None else time.monotonic() + self.ttl
+        self._cache[name] = (expires_at, data)
+        self._cache.move_to_end(name)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name='PersistenceWriteBehind', daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _write_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._pending_changed.wait()
+                # give further saves a chance to coalesce into the same write, close cuts the wait short
+                if self._pending_changed.wait_for(lambda: self._closed, self.flush_interval):
+                    return
+            self.flush()
+
+    @classmethod
+    def construct(cls, config: ConfigRegistry) -> AbstractPersistenceProvider:
+        from ._selector import get_persistence
+
+        return get_persistence(config.with_overrides({
+            'PERSISTENCE_CACHE': True
+        }))
+
+    @classmethod
+    def wrap(cls, backend: AbstractPersistenceProvider, config: ConfigRegistry) -> AbstractPersistenceProvider:
+        return cls(
+            backend,
+            max_size=config.get('PERSISTENCE_CACHE_SIZE', 256),
+            ttl=config.get('PERSISTENCE_CACHE_TTL', 300),
+            write_behind=config.get('PERSISTENCE_CACHE_WRITE_BEHIND', False)
+        )
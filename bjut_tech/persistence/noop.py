@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import io
+from typing import TYPE_CHECKING, BinaryIO, Optional
 
 from ._base import AbstractPersistenceProvider
 
@@ -8,6 +9,15 @@ if TYPE_CHECKING:
     from .._config import ConfigRegistry
 
 
+class _DiscardingWriter(io.RawIOBase):
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        return len(data)
+
+
 class NoopPersistenceProvider(AbstractPersistenceProvider):
 
     def load(self, name: str):
@@ -19,6 +29,12 @@ class NoopPersistenceProvider(AbstractPersistenceProvider):
     def delete(self, name: str):
         pass
 
+    def open_write(self, name: str) -> BinaryIO:
+        return _DiscardingWriter()
+
+    def open_read(self, name: str) -> Optional[BinaryIO]:
+        return None
+
     @classmethod
     def construct(cls, config: ConfigRegistry) -> AbstractPersistenceProvider:
         return cls()
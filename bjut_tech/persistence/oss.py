@@ -1,6 +1,15 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterable, List, Mapping, Optional
 
 try:
     import oss2
@@ -12,12 +21,189 @@ from ._base import AbstractPersistenceProvider
 if TYPE_CHECKING:
     from .._config import ConfigRegistry
 
+_BATCH_DELETE_SIZE = 1000  # limit of a single DeleteMultipleObjects request
+
+# parts other than the last have to be at least 100 KiB, streams hold (upload workers + 1) parts in memory
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_UPLOAD_WORKERS = 4
+
+
+class _MultipartWriter(io.BufferedIOBase):
+    # small objects go up in one request on close, larger ones part by part while being written
+
+    def __init__(self, bucket: oss2.Bucket, object_name: str, part_size: int, workers: int):
+        super().__init__()
+        self.bucket = bucket
+        self.object_name = object_name
+        self.part_size = part_size
+        self.workers = workers
+        self.aborted = False
+
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._parts: List[Future] = []
+        # writing blocks while all workers are busy, so memory stays bounded however large the object
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.aborted = True
+        self.close()
+
+    def __del__(self):
+        # dropped without being closed, most likely after an error
+        if not self.closed:
+            self.abort()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._upload_part(part)
+        return len(data)
+
+    def abort(self):
+        self.aborted = True
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.aborted:
+                self._abort_upload()
+            elif self._upload_id is None:
+                self.bucket.put_object(self.object_name, bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_part(bytes(self._buffer))
+                parts = [future.result() for future in self._parts]
+                self.bucket.complete_multipart_upload(self.object_name, self._upload_id, parts)
+        except BaseException:
+            self._abort_upload()
+            raise
+        finally:
+            self._buffer = bytearray()
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            super().close()
+
+    def _upload_part(self, data: bytes):
+        if self._upload_id is None:
+            self._upload_id = self.bucket.init_multipart_upload(self.object_name).upload_id
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='OssUpload')
+
+        self._slots.acquire()
+        # a failed part fails the writer right away instead of on close
+        for future in self._parts:
+            if future.done() and future.exception() is not None:
+                self._slots.release()
+                future.result()
+
+        part_number = len(self._parts) + 1
+        self._parts.append(self._executor.submit(self._send_part, part_number, data))
+
+    def _send_part(self, part_number: int, data: bytes):
+        try:
+            result = self.bucket.upload_part(self.object_name, self._upload_id, part_number, data)
+            return oss2.models.PartInfo(part_number, result.etag)
+        finally:
+            self._slots.release()
+
+    def _abort_upload(self):
+        if self._upload_id is None:
+            return
+        for future in self._parts:
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        try:
+            self.bucket.abort_multipart_upload(self.object_name, self._upload_id)
+        except oss2.exceptions.OssError:
+            # parts left behind are cleaned up by the bucket lifecycle rules
+            pass
+        self._upload_id = None
+
+
+class _RangeReader(io.RawIOBase):
+    # every read is a ranged get, pinned to the etag seen on open so a concurrent writer cannot mix versions
+
+    def __init__(self, bucket: oss2.Bucket, object_name: str, size: int, etag: str, chunk_size: int):
+        super().__init__()
+        self.bucket = bucket
+        self.object_name = object_name
+        self.size = size
+        self.etag = etag
+        self.chunk_size = chunk_size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f'Negative seek position {offset}')
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self.size or not len(buffer):
+            return 0
+
+        end = min(self._position + len(buffer), self.size) - 1
+        data = self.bucket.get_object(self.object_name, byte_range=(self._position, end), headers={
+            'If-Match': f'"{self.etag}"',
+            'x-oss-range-behavior': 'standard'
+        }).read()
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def readall(self) -> bytes:
+        # the default reads in tiny steps, one request each
+        chunks = []
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
 
 class OssPersistenceProvider(AbstractPersistenceProvider):
 
-    def __init__(self, auth: oss2.Auth, endpoint: str, bucket: str, prefix: str = ''):
+    def __init__(
+        self,
+        auth: oss2.Auth,
+        endpoint: str,
+        bucket: str,
+        prefix: str = '',
+        max_workers: int = 16,
+        part_size: int = DEFAULT_PART_SIZE,
+        upload_workers: int = DEFAULT_UPLOAD_WORKERS
+    ):
         self.bucket = oss2.Bucket(auth, endpoint, bucket)
         self.prefix = prefix
+        self.max_workers = max_workers
+        self.part_size = part_size
+        self.upload_workers = upload_workers
 
     def get_object_name(self, name: str) -> str:
         name = self.prefix + name
@@ -27,9 +213,9 @@ class OssPersistenceProvider(AbstractPersistenceProvider):
 
     def load(self, name: str):
         object_name = self.get_object_name(name)
-        if self.bucket.object_exists(object_name):
+        try:
             return self._deserialize(self.bucket.get_object(object_name).read())
-        else:
+        except oss2.exceptions.NoSuchKey:
             return None
 
     def save(self, name: str, obj):
@@ -37,9 +223,110 @@ class OssPersistenceProvider(AbstractPersistenceProvider):
         self.bucket.put_object(object_name, self._serialize(obj))
 
     def delete(self, name: str):
+        # deleting a missing object is not an error in OSS
+        self.bucket.delete_object(self.get_object_name(name))
+
+    def open_write(self, name: str) -> BinaryIO:
+        return _MultipartWriter(self.bucket, self.get_object_name(name), self.part_size, self.upload_workers)
+
+    def open_read(self, name: str) -> Optional[BinaryIO]:
         object_name = self.get_object_name(name)
-        if self.bucket.object_exists(object_name):
-            self.bucket.delete_object(object_name)
+        try:
+            meta = self.bucket.head_object(object_name)
+        except oss2.exceptions.NotFound:
+            return None
+
+        reader = _RangeReader(self.bucket, object_name, meta.content_length, meta.etag, self.part_size)
+        return io.BufferedReader(reader, buffer_size=self.part_size)
+
+    def load_many(self, names: Iterable[str]) -> Dict[str, Any]:
+        names = list(names)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(names, executor.map(self.load, names)))
+
+    def save_many(self, objs: Mapping[str, Any]):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # consume results so that the first failure is raised
+            list(executor.map(self.save, objs.keys(), objs.values()))
+
+    def delete_many(self, names: Iterable[str]):
+        object_names = [self.get_object_name(name) for name in names]
+        for i in range(0, len(object_names), _BATCH_DELETE_SIZE):
+            self.bucket.batch_delete_objects(object_names[i:i + _BATCH_DELETE_SIZE])
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = 60, timeout: Optional[float] = None):
+        # a lock is a sequence of objects, <name>.lock.<generation>, each only created if it does not exist yet,
+        # so of everyone racing for the next generation exactly one wins. the highest generation tells who holds
+        # the lock, taking over an expired lease and releasing both work by creating the next one
+        prefix = self.get_object_name(name) + '.lock.'
+        owner = uuid.uuid4().hex
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            generation = self._try_lock(prefix, owner, ttl)
+            if generation is not None:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f'Timed out waiting for lock on {name}')
+            time.sleep(random.uniform(0.2, 1))
+
+        try:
+            yield
+        finally:
+            # fails if the lease ran out and someone took over meanwhile, the next generation is theirs then,
+            # the released generation stays until the next holder cleans up so it cannot be created again
+            self._create_lock_generation(prefix, generation + 1, {'owner': None})
+
+    def _try_lock(self, prefix: str, owner: str, ttl: float) -> Optional[int]:
+        generations = self._list_lock_generations(prefix)
+        if generations and not self._is_lock_free(f'{prefix}{generations[-1]}'):
+            return None
+
+        generation = generations[-1] + 1 if generations else 1
+        if not self._create_lock_generation(prefix, generation, {'owner': owner, 'ttl': ttl}):
+            return None
+
+        # someone who listed before older generations were cleaned up may have created one of them again,
+        # only the highest generation counts
+        generations = self._list_lock_generations(prefix)
+        if generations[-1] != generation:
+            return None
+
+        stale = [f'{prefix}{stale_generation}' for stale_generation in generations if stale_generation < generation]
+        if stale:
+            self.bucket.batch_delete_objects(stale)
+        return generation
+
+    def _create_lock_generation(self, prefix: str, generation: int, state: dict) -> bool:
+        try:
+            self.bucket.put_object(f'{prefix}{generation}', json.dumps(state), headers={
+                'x-oss-forbid-overwrite': 'true'
+            })
+            return True
+        except oss2.exceptions.ServerError as e:
+            if e.status != HTTPStatus.CONFLICT:
+                raise
+            return False
+
+    def _list_lock_generations(self, prefix: str) -> List[int]:
+        suffixes = (info.key[len(prefix):] for info in oss2.ObjectIteratorV2(self.bucket, prefix=prefix))
+        return sorted(int(suffix) for suffix in suffixes if suffix.isdigit())
+
+    def _is_lock_free(self, object_name: str) -> bool:
+        try:
+            result = self.bucket.get_object(object_name)
+        except oss2.exceptions.NoSuchKey:
+            # superseded and cleaned up since it was listed
+            return False
+
+        state = json.loads(result.read())
+        if state['owner'] is None:
+            return True
+        # the lease runs on the server clock, from writing the generation to this read, both times are
+        # whole seconds so it ends a second late rather than early
+        now = oss2.utils.http_to_unixtime(result.headers['date'])
+        return result.last_modified + state['ttl'] < now
 
     @classmethod
     def construct(cls, config: ConfigRegistry) -> AbstractPersistenceProvider:
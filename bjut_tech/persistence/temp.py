@@ -1,14 +1,67 @@
 from __future__ import annotations
 
+import io
 import os
-from tempfile import gettempdir, gettempprefix
-from typing import TYPE_CHECKING
+import random
+import time
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile, gettempdir, gettempprefix, mkstemp
+from typing import TYPE_CHECKING, BinaryIO, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 from ._base import AbstractPersistenceProvider
 
 if TYPE_CHECKING:
     from .._config import ConfigRegistry
 
+_BUFFER_SIZE = 1024 * 1024
+
+# sessions and tickets end up here, only the owner gets to read them, files are created 0600 by mkstemp
+_DIR_MODE = 0o700
+
+
+class _AtomicFileWriter(io.BufferedWriter):
+    # written aside like save, the file is only renamed into place when closed cleanly
+
+    def __init__(self, path: str):
+        fd, self.temp_path = mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+        super().__init__(io.FileIO(fd, 'wb'), _BUFFER_SIZE)
+
+        self.path = path
+        self.aborted = False
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.aborted = True
+        self.close()
+
+    def __del__(self):
+        # dropped without being closed, most likely after an error
+        if not self.closed:
+            self.abort()
+
+    def abort(self):
+        self.aborted = True
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+        except BaseException:
+            os.remove(self.temp_path)
+            raise
+
+        if self.aborted:
+            os.remove(self.temp_path)
+        else:
+            os.replace(self.temp_path, self.path)
+
 
 class TemporaryFilePersistenceProvider(AbstractPersistenceProvider):
 
@@ -24,6 +77,11 @@ class TemporaryFilePersistenceProvider(AbstractPersistenceProvider):
             path += '.bin'
         return path
 
+    def _make_dirs(self, path: str):
+        # makedirs only applies the mode to the last directory
+        os.makedirs(self.dir, mode=_DIR_MODE, exist_ok=True)
+        os.makedirs(os.path.dirname(path), mode=_DIR_MODE, exist_ok=True)
+
     def load(self, name: str):
         if not os.path.exists(self.get_path(name)):
             return None
@@ -33,16 +91,55 @@ class TemporaryFilePersistenceProvider(AbstractPersistenceProvider):
 
     def save(self, name: str, obj):
         path = self.get_path(name)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._make_dirs(path)
 
-        with open(path, 'wb') as f:
+        # write aside and rename, readers never observe a partially written file
+        with NamedTemporaryFile('wb', dir=os.path.dirname(path), prefix='.', suffix='.tmp', delete=False) as f:
             f.write(self._serialize(obj))
+        os.replace(f.name, path)
 
     def delete(self, name: str):
         path = self.get_path(name)
         if os.path.exists(path):
             os.remove(path)
 
+    def open_write(self, name: str) -> BinaryIO:
+        path = self.get_path(name)
+        self._make_dirs(path)
+        return _AtomicFileWriter(path)
+
+    def open_read(self, name: str) -> Optional[BinaryIO]:
+        try:
+            # an open file keeps reading the old contents even if a writer replaces it meanwhile
+            return open(self.get_path(name), 'rb', buffering=_BUFFER_SIZE)
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = 60, timeout: Optional[float] = None):
+        if fcntl is None:
+            with self._local_lock(self.get_path(name), timeout):
+                yield
+            return
+
+        path = self.get_path(name) + '.lock'
+        self._make_dirs(path)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with open(path, 'a') as f:
+            while True:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise TimeoutError(f'Timed out waiting for lock on {name}')
+                    time.sleep(random.uniform(0.05, 0.2))
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
     @classmethod
     def construct(cls, config: ConfigRegistry) -> AbstractPersistenceProvider:
         return cls()
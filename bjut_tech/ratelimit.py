@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+if TYPE_CHECKING:
+    from ._config import ConfigRegistry
+
+# highest request rate per second each host is allowed to reach, 0 disables limiting for it
+DEFAULT_LIMITS: Dict[str, int] = {
+    'cas.bjut.edu.cn': 20,
+    'webvpn.bjut.edu.cn': 50,
+    'jwglxt.bjut.edu.cn': 20
+}
+DEFAULT_RETRIES = 3
+
+_CONFIG_KEYS = {
+    'cas.bjut.edu.cn': 'RATE_LIMIT_CAS',
+    'webvpn.bjut.edu.cn': 'RATE_LIMIT_WEBVPN',
+    'jwglxt.bjut.edu.cn': 'RATE_LIMIT_JWGLXT'
+}
+
+# the server asks to slow down, retried after a backoff
+RETRY_STATUSES = {HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE}
+# only requests that can safely be sent twice are retried, a credential post could count as a second login attempt
+RETRY_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# slows down as well, but a retry could lock the account for longer
+THROTTLE_STATUSES = {*RETRY_STATUSES, HTTPStatus.LOCKED}
+
+_MIN_RATE = 1.0
+_INITIAL_SHARE = 0.25  # a fresh bucket starts at a quarter of its limit and probes upwards
+_INCREASE_STEPS = 25  # successes needed to climb from zero to the limit
+_DECREASE_FACTOR = 0.7
+_DECREASE_INTERVAL = 1.0  # a burst of throttled responses cuts the rate only once
+
+_BACKOFF_BASE = 0.5
+_BACKOFF_CAP = 30.0
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    # full jitter, spreads retries of many clients instead of having them return in lockstep
+    delay = random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None and retry_after.strip().isdigit():
+        delay = max(delay, min(_BACKOFF_CAP, float(retry_after)))
+    return delay
+
+
+class TokenBucket:
+
+    def __init__(self, max_rate: float):
+        self.max_rate = max_rate
+        self.rate = max(_MIN_RATE, max_rate * _INITIAL_SHARE)
+
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._decreased_at = 0.0
+
+    def reserve(self) -> float:
+        # takes a token, returns how long to wait before using it
+        with self._lock:
+            now = time.monotonic()
+            capacity = max(1.0, self.rate)
+            self._tokens = min(capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / _INCREASE_STEPS)
+
+    def on_throttled(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._decreased_at < _DECREASE_INTERVAL:
+                return
+            self._decreased_at = now
+            self.rate = max(_MIN_RATE, self.rate * _DECREASE_FACTOR)
+            # requests already granted still go out, but nothing more for now
+            self._tokens = min(self._tokens, 0.0)
+
+
+class RateLimiter:
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        retries: int = DEFAULT_RETRIES,
+        enabled: bool = False
+    ):
+        # off unless asked for, a shared limiter would otherwise pace every client in the process
+        self.enabled = enabled
+        self.retries = retries
+
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._configured = limits is not None
+        for host, limit in (DEFAULT_LIMITS if limits is None else limits).items():
+            self.set_limit(host, limit)
+
+    def configure(self, config: ConfigRegistry):
+        self.enabled = config.get('RATE_LIMIT', False)
+        self.retries = config.get('RATE_LIMIT_RETRIES', DEFAULT_RETRIES)
+        for host, key in _CONFIG_KEYS.items():
+            self.set_limit(host, config.get(key, DEFAULT_LIMITS[host]))
+        self._configured = True
+
+    def is_enabled(self) -> bool:
+        if not self._configured:
+            # first use without explicit configuration, take it from the environment
+            from ._config import ConfigRegistry
+
+            self.configure(ConfigRegistry())
+        return self.enabled
+
+    def set_limit(self, host: str, max_rate: float):
+        with self._lock:
+            if max_rate <= 0:
+                self._buckets.pop(host, None)
+                return
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                self._buckets[host] = TokenBucket(max_rate)
+            else:
+                bucket.max_rate = max_rate
+                bucket.rate = min(bucket.rate, max_rate)
+
+    def get_bucket(self, host: str) -> Optional[TokenBucket]:
+        return self._buckets.get(host)
+
+    def reserve(self, hosts: Iterable[str]) -> float:
+        delay = 0.0
+        for host in hosts:
+            bucket = self._buckets.get(host)
+            if bucket is not None:
+                delay = max(delay, bucket.reserve())
+        return delay
+
+    def record(self, host: str, status_code: int):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            return
+        if status_code in THROTTLE_STATUSES:
+            bucket.on_throttled()
+        elif status_code < 500:
+            bucket.on_success()
+
+
+LIMITER = RateLimiter()
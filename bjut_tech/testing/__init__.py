@@ -0,0 +1 @@
+from ._campus import FakeCampus, LocalTransport
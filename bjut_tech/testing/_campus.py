@@ -0,0 +1,531 @@
+from __future__ import annotations
+
+import json
+import random
+import secrets
+import threading
+import time
+from base64 import b64decode, b64encode
+from collections import Counter
+from html import escape
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from Crypto.Cipher import AES, PKCS1_v1_5
+from Crypto.PublicKey import RSA
+from Crypto.Util.Padding import pad
+from httpx import HTTPTransport, Request, Response, WSGITransport
+
+_CAS_HOST = 'cas.bjut.edu.cn'
+_WEBVPN_HOST = 'webvpn.bjut.edu.cn'
+_WEBVPN_SESSION_COOKIE = 'wengine_vpn_ticketwebvpn_bjut_edu_cn'
+
+
+class _Request:
+
+    def __init__(
+        self,
+        method: str,
+        host: str,
+        path: str,
+        query: Dict[str, str],
+        form: Dict[str, str],
+        cookies: Dict[str, str]
+    ):
+        self.method = method
+        self.host = host
+        self.path = path
+        self.query = query
+        self.form = form
+        self.cookies = cookies
+
+    @classmethod
+    def from_environ(cls, environ: dict) -> _Request:
+        body = b''
+        length = environ.get('CONTENT_LENGTH')
+        if length:
+            body = environ['wsgi.input'].read(int(length))
+
+        cookies = SimpleCookie()
+        cookies.load(environ.get('HTTP_COOKIE', ''))
+
+        return cls(
+            method=environ['REQUEST_METHOD'],
+            host=environ.get('HTTP_HOST', environ.get('SERVER_NAME', '')).split(':')[0],
+            path=environ.get('PATH_INFO', '/') or '/',
+            query=dict(parse_qsl(environ.get('QUERY_STRING', ''))),
+            form=dict(parse_qsl(body.decode('utf-8'))),
+            cookies={name: morsel.value for name, morsel in cookies.items()}
+        )
+
+
+class _Response:
+
+    def __init__(self, status: int = 200, body: str = '', content_type: str = 'text/html; charset=utf-8'):
+        self.status = status
+        self.body = body.encode('utf-8')
+        self.headers: List[Tuple[str, str]] = [('Content-Type', content_type)]
+
+    def set_cookie(self, name: str, value: str, path: str = '/', domain: Optional[str] = None):
+        cookie = f'{name}={value}; Path={path}; HttpOnly'
+        if domain is not None:
+            cookie += f'; Domain={domain}'
+        self.headers.append(('Set-Cookie', cookie))
+
+    @classmethod
+    def redirect(cls, location: str) -> _Response:
+        response = cls(HTTPStatus.FOUND)
+        response.headers.append(('Location', location))
+        return response
+
+    @classmethod
+    def json(cls, data, status: int = 200) -> _Response:
+        return cls(status, json.dumps(data), 'application/json')
+
+
+def _with_ticket(service: str, ticket: str) -> str:
+    return service + ('&' if '?' in service else '?') + urlencode({'ticket': ticket})
+
+
+class FakeCampus:
+    # stand-in for cas, webvpn and jwglxt as a wsgi app, only the endpoints used by this package
+
+    def __init__(
+        self,
+        accounts: Optional[Dict[str, str]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        failure_status: int = HTTPStatus.SERVICE_UNAVAILABLE,
+        rate_limit: float = 0.0,
+        jwglxt_url: str = 'https://jwglxt.bjut.edu.cn',
+        seed: Optional[int] = None
+    ):
+        # any non-empty credentials are accepted when no accounts are given
+        self.accounts = accounts
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        # requests per second each host serves before answering 429, 0 for no limit
+        self.rate_limit = rate_limit
+
+        parsed_jwglxt_url = urlparse(jwglxt_url)
+        self.jwglxt_host = parsed_jwglxt_url.hostname
+        self.jwglxt_prefix = parsed_jwglxt_url.path.rstrip('/')
+
+        # clients only learn the cipher after logging in, so it has to be the well-known one
+        self.webvpn_key = self.webvpn_iv = b'wrdvpnisthebest!'
+        self.jwglxt_key = RSA.generate(1024)
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats: Counter = Counter()
+        self._allowance: Dict[str, Tuple[float, float]] = {}
+
+        self._tgts: Dict[str, str] = {}
+        self._service_tickets: Dict[str, Tuple[str, str]] = {}
+        self._webvpn_sessions: Dict[str, Dict[str, Any]] = {}
+        self._jwglxt_sessions: Dict[str, Dict[str, Optional[str]]] = {}
+
+        self._hosts: Dict[str, Callable[[_Request], _Response]] = {
+            _CAS_HOST: self._handle_cas,
+            _WEBVPN_HOST: self._handle_webvpn,
+            self.jwglxt_host: self._handle_jwglxt
+        }
+
+    def __call__(self, environ: dict, start_response):
+        response = self.dispatch(_Request.from_environ(environ))
+
+        start_response(f'{response.status} {HTTPStatus(response.status).phrase}', [
+            *response.headers,
+            ('Content-Length', str(len(response.body)))
+        ])
+        return [response.body]
+
+    def dispatch(self, request: _Request) -> _Response:
+        with self._lock:
+            self._stats[f'{request.host} {request.method}'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter) if self.latency or self.jitter else 0
+            failed = self._random.random() < self.failure_rate
+            throttled = self.rate_limit > 0 and not self._take_allowance(request.host)
+
+        # requests proxied through webvpn pay for both hops
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            with self._lock:
+                self._stats['requests throttled'] += 1
+            return _Response(HTTPStatus.TOO_MANY_REQUESTS, 'Too Many Requests')
+        if failed:
+            with self._lock:
+                self._stats['failures injected'] += 1
+            return _Response(self.failure_status, HTTPStatus(self.failure_status).phrase)
+
+        handler = self._hosts.get(request.host)
+        if handler is None:
+            return _Response(HTTPStatus.NOT_FOUND, 'Unknown host')
+        return handler(request)
+
+    def _take_allowance(self, host: str) -> bool:
+        # token bucket holding a second worth of requests
+        now = time.monotonic()
+        tokens, updated_at = self._allowance.get(host, (self.rate_limit, now))
+        tokens = min(self.rate_limit, tokens + (now - updated_at) * self.rate_limit)
+        if tokens < 1:
+            self._allowance[host] = (tokens, now)
+            return False
+        self._allowance[host] = (tokens - 1, now)
+        return True
+
+    def transport(self) -> WSGITransport:
+        return WSGITransport(app=self)
+
+    def serve(self, host: str = '127.0.0.1', port: int = 0) -> FakeCampusServer:
+        return FakeCampusServer(self, host, port)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    # accounts and tickets
+
+    def _check_credentials(self, username: Optional[str], password: Optional[str]) -> bool:
+        if not username or not password:
+            return False
+        return self.accounts is None or self.accounts.get(username) == password
+
+    def _new_tgt(self, username: str) -> str:
+        tgt = f'TGT-{secrets.token_hex(16)}-cas'
+        with self._lock:
+            self._tgts[tgt] = username
+            self._stats['cas tgt issued'] += 1
+        return tgt
+
+    def _new_service_ticket(self, tgt: str, service: str) -> Optional[str]:
+        with self._lock:
+            username = self._tgts.get(tgt)
+            if username is None:
+                return None
+            ticket = f'ST-{secrets.token_hex(16)}-cas'
+            self._service_tickets[ticket] = (username, service)
+            self._stats['cas st issued'] += 1
+        return ticket
+
+    def _validate_service_ticket(self, ticket: str) -> Optional[str]:
+        with self._lock:
+            # service tickets are single use
+            entry = self._service_tickets.pop(ticket, None)
+        return None if entry is None else entry[0]
+
+    def expire_sessions(self, tgts: bool = True):
+        with self._lock:
+            if tgts:
+                self._tgts.clear()
+            self._service_tickets.clear()
+            self._webvpn_sessions.clear()
+            self._jwglxt_sessions.clear()
+
+    # cas.bjut.edu.cn
+
+    def _handle_cas(self, request: _Request) -> _Response:
+        path = request.path
+        if path == '/v1/tickets' and request.method == 'POST':
+            if not self._check_credentials(request.form.get('username'), request.form.get('password')):
+                return _Response(HTTPStatus.UNAUTHORIZED, 'Authentication failed')
+            response = _Response(HTTPStatus.CREATED, 'Created')
+            tgt = self._new_tgt(request.form['username'])
+            response.headers.append(('Location', f'https://{_CAS_HOST}/v1/tickets/{tgt}'))
+            return response
+
+        if path.startswith('/v1/tickets/'):
+            tgt = path[len('/v1/tickets/'):]
+            if request.method == 'DELETE':
+                with self._lock:
+                    self._tgts.pop(tgt, None)
+                return _Response(HTTPStatus.OK, tgt, 'text/plain')
+            ticket = self._new_service_ticket(tgt, request.form.get('service', ''))
+            if ticket is None:
+                return _Response(HTTPStatus.NOT_FOUND, 'Ticket not found', 'text/plain')
+            return _Response(HTTPStatus.OK, ticket, 'text/plain')
+
+        if path == '/v1/users' and request.method == 'POST':
+            if not self._check_credentials(request.form.get('username'), request.form.get('password')):
+                return _Response(HTTPStatus.UNAUTHORIZED, 'Authentication failed')
+            return _Response.json({
+                'authentication': {
+                    'principal': {
+                        'id': request.form['username']
+                    }
+                }
+            })
+
+        service = request.query.get('service')
+        tgt = request.cookies.get('CASTGC')
+        ticket = None if tgt is None or service is None else self._new_service_ticket(tgt, service)
+        if path.startswith('/login'):
+            if ticket is not None:
+                return _Response.redirect(_with_ticket(service, ticket))
+            return _Response(HTTPStatus.OK, '<html><body><form id="fm1" action="/login"></form></body></html>')
+        if path == '/clientredirect':
+            if ticket is not None:
+                return _Response.redirect(_with_ticket(service, ticket))
+            return _Response.redirect(f'https://{_CAS_HOST}/login?' + urlencode({'service': service or ''}))
+
+        return _Response(HTTPStatus.NOT_FOUND, 'Not found')
+
+    # webvpn.bjut.edu.cn
+
+    def _handle_webvpn(self, request: _Request) -> _Response:
+        session_id = request.cookies.get(_WEBVPN_SESSION_COOKIE)
+        with self._lock:
+            session = self._webvpn_sessions.get(session_id)
+
+        if request.path == '/user/info':
+            if session is None:
+                return _Response.redirect(f'https://{_WEBVPN_HOST}/login')
+            return _Response.json({
+                'username': session['username'],
+                'wrdvpnIV': self.webvpn_iv.decode(),
+                'wrdvpnKey': self.webvpn_key.decode()
+            })
+
+        if request.path == '/login':
+            ticket = request.query.get('ticket')
+            if ticket is not None:
+                username = self._validate_service_ticket(ticket)
+                if username is None:
+                    return _Response(HTTPStatus.OK, '<html><body>Invalid ticket</body></html>')
+                session_id = secrets.token_hex(16)
+                with self._lock:
+                    self._webvpn_sessions[session_id] = {'username': username, 'cookies': {}}
+                    self._stats['webvpn sessions'] += 1
+                response = _Response.redirect('/')
+                response.set_cookie(_WEBVPN_SESSION_COOKIE, session_id)
+                return response
+            if 'cas_login' in request.query:
+                service = f'https://{_WEBVPN_HOST}/login?cas_login=true'
+                return _Response.redirect(f'https://{_CAS_HOST}/login?' + urlencode({'service': service}))
+            return _Response(HTTPStatus.OK, '<html><body>WebVPN login</body></html>')
+
+        if request.path == '/':
+            if session is None:
+                return _Response.redirect(f'https://{_WEBVPN_HOST}/login')
+            return _Response(HTTPStatus.OK, '<html><body>WebVPN portal</body></html>')
+
+        return self._proxy(request, session)
+
+    def _proxy(self, request: _Request, session: Optional[Dict[str, Any]]) -> _Response:
+        parts = request.path.lstrip('/').split('/', 2)
+        if len(parts) < 2:
+            return _Response(HTTPStatus.NOT_FOUND, 'Not found')
+        scheme = parts[0].split('-', 1)[0]
+        host = self._decode_host(parts[1])
+        if host is None or scheme not in ('http', 'https'):
+            return _Response(HTTPStatus.NOT_FOUND, 'Not found')
+
+        # cas stays reachable without a webvpn session so that users can log in
+        if session is None and host != _CAS_HOST:
+            return _Response.redirect(f'https://{_WEBVPN_HOST}/login')
+
+        cookies = {name: value for name, value in request.cookies.items() if name != _WEBVPN_SESSION_COOKIE}
+        if session is not None:
+            with self._lock:
+                cookies.update(session['cookies'].get(host, {}))
+
+        upstream = self.dispatch(_Request(
+            request.method,
+            host,
+            '/' + (parts[2] if len(parts) > 2 else ''),
+            request.query,
+            request.form,
+            cookies
+        ))
+
+        response = _Response(upstream.status)
+        response.body = upstream.body
+        response.headers = []
+        prefix = f'/{parts[0]}/{parts[1]}'
+        for name, value in upstream.headers:
+            if name == 'Set-Cookie':
+                # upstream cookies live on the webvpn side of the session
+                if session is not None:
+                    cookie = SimpleCookie()
+                    cookie.load(value)
+                    with self._lock:
+                        session['cookies'].setdefault(host, {}).update(
+                            {key: morsel.value for key, morsel in cookie.items()}
+                        )
+                continue
+            if name == 'Location':
+                value = self._rewrite_location(value, prefix)
+            response.headers.append((name, value))
+        return response
+
+    def _rewrite_location(self, location: str, prefix: str) -> str:
+        if location.startswith('/'):
+            return prefix + location
+
+        parsed = urlparse(location)
+        if not parsed.hostname or parsed.hostname == _WEBVPN_HOST:
+            return location
+        path = f'/{parsed.scheme}' + (f'-{parsed.port}' if parsed.port else '')
+        rewritten = f'https://{_WEBVPN_HOST}{path}/{self._encode_host(parsed.hostname)}{parsed.path or "/"}'
+        return rewritten + (f'?{parsed.query}' if parsed.query else '')
+
+    def _encode_host(self, host: str) -> str:
+        cipher = AES.new(self.webvpn_key, AES.MODE_CFB, iv=self.webvpn_iv, segment_size=128)
+        encrypted = cipher.encrypt(pad(host.encode('utf-8'), AES.block_size))
+        return self.webvpn_iv.hex() + encrypted.hex()[:len(host) * 2]
+
+    def _decode_host(self, encoded_host: str) -> Optional[str]:
+        try:
+            iv = bytes.fromhex(encoded_host[:32])
+            cipher = AES.new(self.webvpn_key, AES.MODE_CFB, iv=iv, segment_size=128)
+            return cipher.decrypt(bytes.fromhex(encoded_host[32:])).decode('utf-8')
+        except ValueError:
+            return None
+
+    # jwglxt
+
+    def _handle_jwglxt(self, request: _Request) -> _Response:
+        if not request.path.startswith(self.jwglxt_prefix + '/'):
+            return _Response(HTTPStatus.NOT_FOUND, 'Not found')
+        path = request.path[len(self.jwglxt_prefix):]
+        base_url = f'https://{self.jwglxt_host}{self.jwglxt_prefix}'
+
+        session_id = request.cookies.get('JSESSIONID')
+        with self._lock:
+            session = self._jwglxt_sessions.get(session_id)
+        new_session = session is None
+        if new_session:
+            session_id = secrets.token_hex(16).upper()
+            session = {'csrf': None, 'username': None}
+            with self._lock:
+                self._jwglxt_sessions[session_id] = session
+
+        response = self._route_jwglxt(request, path, base_url, session)
+        if new_session:
+            response.set_cookie('JSESSIONID', session_id, path=self.jwglxt_prefix or '/')
+        return response
+
+    def _route_jwglxt(
+        self,
+        request: _Request,
+        path: str,
+        base_url: str,
+        session: Dict[str, Optional[str]]
+    ) -> _Response:
+        ticket = request.query.get('ticket')
+        if ticket is not None:
+            username = self._validate_service_ticket(ticket)
+            if username is None:
+                return _Response.redirect(f'{base_url}/xtgl/login_slogin.html')
+            session['username'] = username
+            query = {key: value for key, value in request.query.items() if key != 'ticket'}
+            return _Response.redirect(f'{base_url}{path}' + (f'?{urlencode(query)}' if query else ''))
+
+        if path == '/sso/jasiglogin':
+            # cas entry point, signed in sessions land on the index
+            if session['username'] is None:
+                return _Response.redirect(f'{base_url}/xtgl/login_slogin.html')
+            return _Response.redirect(f'{base_url}/xtgl/index_initMenu.html')
+
+        if path == '/xtgl/login_getPublicKey.html':
+            public_key = self.jwglxt_key.publickey()
+            return _Response.json({
+                'modulus': b64encode(public_key.n.to_bytes((public_key.n.bit_length() + 7) // 8, 'big')).decode(),
+                'exponent': b64encode(public_key.e.to_bytes((public_key.e.bit_length() + 7) // 8, 'big')).decode()
+            })
+
+        if path == '/xtgl/login_slogin.html':
+            if request.method == 'POST':
+                username = request.form.get('yhm')
+                if request.form.get('csrftoken') == session['csrf'] and \
+                        self._check_credentials(username, self._decrypt_password(request.form.get('mm', ''))):
+                    session['username'] = username
+                    return _Response.redirect(f'{base_url}/xtgl/index_initMenu.html')
+            session['csrf'] = secrets.token_hex(16)
+            return _Response(HTTPStatus.OK, (
+                '<html><body><form id="ajaxForm" method="post">'
+                f'<input type="hidden" id="csrftoken" name="csrftoken" value="{escape(session["csrf"])}"/>'
+                '</form></body></html>'
+            ))
+
+        if session['username'] is None:
+            return _Response.redirect(f'{base_url}/xtgl/login_slogin.html')
+        if path == '/xtgl/index_initMenu.html':
+            return _Response(HTTPStatus.OK, f'<html><body>{escape(session["username"])}</body></html>')
+        return _Response(HTTPStatus.NOT_FOUND, 'Not found')
+
+    def _decrypt_password(self, encrypted: str) -> Optional[str]:
+        try:
+            decrypted = PKCS1_v1_5.new(self.jwglxt_key).decrypt(b64decode(encrypted), None)
+        except ValueError:
+            return None
+        return None if decrypted is None else decrypted.decode('utf-8')
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    # headers and body go out in separate writes, nagle would hold the body back for a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # wsgiref closes every connection, load tests open them faster than the default backlog of 5 accepts
+    request_queue_size = 128
+
+
+class FakeCampusServer:
+
+    def __init__(self, campus: FakeCampus, host: str = '127.0.0.1', port: int = 0):
+        self.campus = campus
+        self._server = make_server(host, port, campus, _ThreadingWSGIServer, _QuietRequestHandler)
+        self.address: Tuple[str, int] = self._server.server_address[:2]
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name='FakeCampusServer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def transport(self, **kwargs) -> LocalTransport:
+        return LocalTransport(self.address, **kwargs)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+class LocalTransport(HTTPTransport):
+
+    def __init__(self, address: Tuple[str, int], **kwargs):
+        super().__init__(**kwargs)
+        self.address = address
+
+    def handle_request(self, request: Request) -> Response:
+        # the Host header still names the original site, the client resolves redirects against the original url
+        local_request = Request(
+            request.method,
+            request.url.copy_with(scheme='http', host=self.address[0], port=self.address[1]),
+            headers=request.headers,
+            stream=request.stream,
+            extensions=request.extensions
+        )
+        return super().handle_request(local_request)
@@ -1,5 +1,42 @@
-from ._base import AbstractTunnel
-from ._selector import TunnelSelector
-from .direct import NoTunnel
-from .libziyuan import LibraryTunnel
-from .webvpn import WebvpnTunnel
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from ._base import AbstractTunnel, AsyncAbstractTunnel, FetchResult
+    from ._failover import FailoverTunnel, TunnelHealthMonitor
+    from ._pool import TunnelPool
+    from ._selector import TunnelSelector
+    from .direct import AsyncNoTunnel, NoTunnel
+    from .libziyuan import LibraryTunnel
+    from .webvpn import AsyncWebvpnTunnel, WebvpnTunnel
+
+__all__ = [
+    'AbstractTunnel',
+    'AsyncAbstractTunnel',
+    'FetchResult',
+    'FailoverTunnel',
+    'TunnelHealthMonitor',
+    'TunnelPool',
+    'TunnelSelector',
+    'AsyncNoTunnel',
+    'NoTunnel',
+    'LibraryTunnel',
+    'AsyncWebvpnTunnel',
+    'WebvpnTunnel'
+]
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    'AbstractTunnel': '._base',
+    'AsyncAbstractTunnel': '._base',
+    'FetchResult': '._base',
+    'FailoverTunnel': '._failover',
+    'TunnelHealthMonitor': '._failover',
+    'TunnelPool': '._pool',
+    'TunnelSelector': '._selector',
+    'AsyncNoTunnel': '.direct',
+    'NoTunnel': '.direct',
+    'LibraryTunnel': '.libziyuan',
+    'AsyncWebvpnTunnel': '.webvpn',
+    'WebvpnTunnel': '.webvpn'
+})
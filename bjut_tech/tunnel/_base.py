@@ -1,35 +1,114 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import asyncio
+import contextvars
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from ..ratelimit import LIMITER
+from .._transport import (
+    AsyncCachingTransport,
+    AsyncMetricsTransport,
+    AsyncRateLimitTransport,
+    AsyncReauthTransport,
+    CachingTransport,
+    MetricsTransport,
+    RateLimitTransport,
+    ReauthTransport,
+    find_transport,
+    wrap_transports
+)
 
 if TYPE_CHECKING:
-    from httpx import Client, Cookies
+    from httpx import AsyncClient, Client, Cookies, Response
+    from ..httpcache import ResponseCache
     from .._config import ConfigRegistry
 
+_ORIGIN_PATTERN = re.compile(r'[^:/?#]+://[^/?#]*')
 
-class AbstractTunnel:
+DEFAULT_FETCH_CONCURRENCY = 8
 
-    def __init__(self, session: Client):
-        self._session = session
+# an upstream url, or the keyword arguments of session.request with the upstream url in 'url'
+FetchRequest = Union[str, Mapping[str, Any]]
 
-    def get_session(self) -> Client:
-        return self._session
 
-    def authenticate(self):
-        raise NotImplementedError
+def split_origin(url: str) -> Tuple[str, str]:
+    match = _ORIGIN_PATTERN.match(url)
+    if match is None:
+        return url, ''
+    return url[:match.end()], url[match.end():]
+
+
+class FetchResult:
+
+    def __init__(
+        self,
+        index: int,
+        url: str,
+        response: Optional[Response] = None,
+        error: Optional[Exception] = None
+    ):
+        # position in the requests given to fetch_many
+        self.index = index
+        # upstream url, where the response came from after redirects, as requested if it failed
+        self.url = url
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        outcome = repr(self.error) if self.error is not None else self.response.status_code
+        return f'FetchResult(index={self.index}, url={self.url}, {outcome})'
+
+
+class _TunnelBase:
 
     def transform_url(self, url: str) -> str:
         raise NotImplementedError
 
+    def transform_urls(self, urls: Iterable[str]) -> List[str]:
+        return [self.transform_url(url) for url in urls]
+
     def recover_url(self, url: str) -> str:
         raise NotImplementedError
 
     def transform_cookie(self, **kwargs):
         raise NotImplementedError
 
-    def resume(self, cookies: Cookies):
-        self._session.cookies = cookies
-        self.authenticate()
+    def recover_cookie(self, **kwargs) -> Optional[dict]:
+        raise NotImplementedError
+
+    def is_session_expired(self, url: str, location: Optional[str], status_code: int) -> bool:
+        return False
+
+    def get_account(self) -> Optional[str]:
+        # whose pages the session sees, None if the tunnel does not log in
+        return None
+
+    def _prepare_fetches(self, requests: Iterable[FetchRequest], concurrency: int) -> List[Dict[str, Any]]:
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        prepared = [{'url': request} if isinstance(request, str) else dict(request) for request in requests]
+        urls = self.transform_urls([request['url'] for request in prepared])
+        for request, url in zip(prepared, urls):
+            request['url'] = url
+            request.setdefault('method', 'GET')
+        return prepared
+
+    def _to_fetch_result(self, index: int, request: Dict[str, Any], response: Optional[Response], error=None):
+        if response is None:
+            return FetchResult(index, self.recover_url(request['url']), error=error)
+        return FetchResult(index, self.recover_url(str(response.url)), response)
+
+    def _get_cache_account(self, account: Optional[str]) -> str:
+        account = account or self.get_account()
+        if account is None:
+            raise ValueError('An account is required to keep cached pages of different users apart')
+        return account
 
     @classmethod
     def get_name(cls) -> str:
@@ -43,6 +122,205 @@ class AbstractTunnel:
     def is_available(cls) -> bool:
         raise NotImplementedError
 
+    @classmethod
+    def measure_latency(cls, use_cache: bool = True) -> Optional[float]:
+        return 0.0 if cls.is_available() else None
+
+
+class AbstractTunnel(_TunnelBase):
+
+    def __init__(self, session: Client):
+        self._session = session
+
+        # tunnels sharing a session also share the first one's instrumentation
+        if find_transport(session, MetricsTransport) is None:
+            wrap_transports(session, lambda wrapped: MetricsTransport(wrapped, self))
+        # outside of the metrics, so that every retry shows up as a request of its own
+        if find_transport(session, RateLimitTransport) is None:
+            wrap_transports(session, lambda wrapped: RateLimitTransport(wrapped, self, LIMITER))
+
+    def get_session(self) -> Client:
+        return self._session
+
+    def authenticate(self):
+        raise NotImplementedError
+
+    def reauthenticate(self):
+        self.authenticate()
+
+    def enable_auto_reauth(self, *handlers):
+        transport = find_transport(self._session, ReauthTransport)
+        if transport is None:
+            # all mounts share one handler list
+            shared_handlers = [self]
+            wrap_transports(self._session, lambda wrapped: ReauthTransport(wrapped, self, shared_handlers))
+            transport = find_transport(self._session, ReauthTransport)
+
+        # service handlers are more specific than the tunnel itself, ask them first
+        for handler in reversed(handlers):
+            if handler not in transport.handlers:
+                transport.handlers.insert(0, handler)
+
+    def fetch_many(
+        self,
+        requests: Iterable[FetchRequest],
+        concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+        ordered: bool = False
+    ) -> Iterator[FetchResult]:
+        # failed requests come back as results with an error, they do not stop the others
+        prepared = self._prepare_fetches(requests, concurrency)
+        if not prepared:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(concurrency, len(prepared)), thread_name_prefix='fetch_many')
+        pending: Dict[Future, int] = {}
+        completed: Dict[int, FetchResult] = {}
+        next_submit = next_yield = 0
+
+        def submit():
+            nonlocal next_submit
+            # only as many as run at once are queued, leaving early does not wait for the rest
+            while next_submit < len(prepared) and len(pending) < concurrency:
+                future = executor.submit(contextvars.copy_context().run, self._fetch_one, prepared[next_submit])
+                pending[future] = next_submit
+                next_submit += 1
+
+        try:
+            submit()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    response, error = future.result()
+                    completed[index] = self._to_fetch_result(index, prepared[index], response, error)
+                submit()
+
+                if ordered:
+                    while next_yield in completed:
+                        yield completed.pop(next_yield)
+                        next_yield += 1
+                else:
+                    for index in sorted(completed):
+                        yield completed.pop(index)
+        finally:
+            executor.shutdown(wait=True)
+
+    def _fetch_one(self, request: Dict[str, Any]) -> Tuple[Optional[Response], Optional[Exception]]:
+        try:
+            return self._session.request(**request), None
+        except Exception as e:
+            return None, e
+
+    def enable_cache(self, cache: ResponseCache, account: Optional[str] = None):
+        if find_transport(self._session, CachingTransport) is not None:
+            raise RuntimeError('Cache is already enabled for this session')
+        account = self._get_cache_account(account)
+        wrap_transports(self._session, lambda wrapped: CachingTransport(wrapped, self, cache, account))
+
+    def resume(self, cookies: Cookies):
+        self._session.cookies = cookies
+        self.authenticate()
+
+    def close(self):
+        self._session.close()
+
     @classmethod
     def construct(cls, session: Client, config: ConfigRegistry) -> AbstractTunnel:
         raise NotImplementedError
+
+
+class AsyncAbstractTunnel(_TunnelBase):
+
+    def __init__(self, session: AsyncClient):
+        self._session = session
+
+        # tunnels sharing a session also share the first one's instrumentation
+        if find_transport(session, AsyncMetricsTransport) is None:
+            wrap_transports(session, lambda wrapped: AsyncMetricsTransport(wrapped, self))
+        if find_transport(session, AsyncRateLimitTransport) is None:
+            wrap_transports(session, lambda wrapped: AsyncRateLimitTransport(wrapped, self, LIMITER))
+
+    def get_session(self) -> AsyncClient:
+        return self._session
+
+    async def authenticate(self):
+        raise NotImplementedError
+
+    async def reauthenticate(self):
+        await self.authenticate()
+
+    def enable_auto_reauth(self, *handlers):
+        transport = find_transport(self._session, AsyncReauthTransport)
+        if transport is None:
+            # all mounts share one handler list
+            shared_handlers = [self]
+            wrap_transports(self._session, lambda wrapped: AsyncReauthTransport(wrapped, self, shared_handlers))
+            transport = find_transport(self._session, AsyncReauthTransport)
+
+        # service handlers are more specific than the tunnel itself, ask them first
+        for handler in reversed(handlers):
+            if handler not in transport.handlers:
+                transport.handlers.insert(0, handler)
+
+    async def fetch_many(
+        self,
+        requests: Iterable[FetchRequest],
+        concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+        ordered: bool = False
+    ) -> AsyncIterator[FetchResult]:
+        prepared = self._prepare_fetches(requests, concurrency)
+        pending: Dict[asyncio.Task, int] = {}
+        completed: Dict[int, FetchResult] = {}
+        next_submit = next_yield = 0
+
+        def submit():
+            nonlocal next_submit
+            while next_submit < len(prepared) and len(pending) < concurrency:
+                task = asyncio.create_task(self._fetch_one(prepared[next_submit]))
+                pending[task] = next_submit
+                next_submit += 1
+
+        try:
+            submit()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = pending.pop(task)
+                    response, error = task.result()
+                    completed[index] = self._to_fetch_result(index, prepared[index], response, error)
+                submit()
+
+                if ordered:
+                    while next_yield in completed:
+                        yield completed.pop(next_yield)
+                        next_yield += 1
+                else:
+                    for index in sorted(completed):
+                        yield completed.pop(index)
+        finally:
+            # an abandoned iteration takes its requests with it
+            for task in pending:
+                task.cancel()
+
+    async def _fetch_one(self, request: Dict[str, Any]) -> Tuple[Optional[Response], Optional[Exception]]:
+        try:
+            return await self._session.request(**request), None
+        except Exception as e:
+            return None, e
+
+    def enable_cache(self, cache: ResponseCache, account: Optional[str] = None):
+        if find_transport(self._session, AsyncCachingTransport) is not None:
+            raise RuntimeError('Cache is already enabled for this session')
+        account = self._get_cache_account(account)
+        wrap_transports(self._session, lambda wrapped: AsyncCachingTransport(wrapped, self, cache, account))
+
+    async def resume(self, cookies: Cookies):
+        self._session.cookies = cookies
+        await self.authenticate()
+
+    async def aclose(self):
+        await self._session.aclose()
+
+    @classmethod
+    async def construct(cls, session: AsyncClient, config: ConfigRegistry) -> AsyncAbstractTunnel:
+        raise NotImplementedError
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import Cookie
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Type
+
+from httpx import BaseTransport, TransportError
+
+from ._base import AbstractTunnel
+from ._selector import _TUNNELS, TunnelSelector
+from .. import metrics
+from .._transport import wrap_transports
+
+if TYPE_CHECKING:
+    from httpx import Client, Request, Response
+    from .._config import ConfigRegistry
+
+_ERROR_PENALTY = 100  # priority points lost at a 100% error rate
+_GATEWAY_ERRORS = {502, 503, 504}
+
+
+class TunnelHealth:
+
+    def __init__(self, tunnel_cls: Type[AbstractTunnel]):
+        self.tunnel_cls = tunnel_cls
+        self.rtt: Optional[float] = None
+        self.error_rate = 0.0
+        self.checked_at: Optional[float] = None
+
+    def record(self, ok: bool, rtt: Optional[float], alpha: float):
+        if rtt is not None:
+            self.rtt = rtt if self.rtt is None else (1 - alpha) * self.rtt + alpha * rtt
+        self.error_rate = (1 - alpha) * self.error_rate + alpha * (0.0 if ok else 1.0)
+        self.checked_at = time.monotonic()
+
+    def is_healthy(self, max_error_rate: float) -> bool:
+        return self.rtt is not None and self.error_rate < max_error_rate
+
+    def score(self) -> Optional[float]:
+        if self.rtt is None:
+            return None
+        return TunnelSelector.score(self.tunnel_cls, self.rtt) - self.error_rate * _ERROR_PENALTY
+
+
+class TunnelHealthMonitor:
+
+    def __init__(
+        self,
+        interval: float = 30,
+        alpha: float = 0.3,
+        max_error_rate: float = 0.5,
+        tunnels: Optional[Iterable[Type[AbstractTunnel]]] = None
+    ):
+        self.interval = interval
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+
+        self._tunnels = list(_TUNNELS if tunnels is None else tunnels)
+        self._lock = threading.Lock()
+        self._health: Dict[Type[AbstractTunnel], TunnelHealth] = {
+            tunnel_cls: TunnelHealth(tunnel_cls) for tunnel_cls in self._tunnels
+        }
+        self._listeners: List[Callable[[TunnelHealthMonitor], None]] = []
+
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='TunnelHealthMonitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        self._stopped.set()
+        self._wakeup.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def check(self):
+        with ThreadPoolExecutor(max_workers=len(self._tunnels)) as executor:
+            latencies = list(executor.map(self._measure, self._tunnels))
+
+        with self._lock:
+            for tunnel_cls, latency in zip(self._tunnels, latencies):
+                self._health[tunnel_cls].record(latency is not None, latency, self.alpha)
+
+        self._notify()
+
+    def record(self, tunnel_cls: Type[AbstractTunnel], ok: bool):
+        with self._lock:
+            health = self._health.setdefault(tunnel_cls, TunnelHealth(tunnel_cls))
+            was_healthy = health.is_healthy(self.max_error_rate)
+            health.record(ok, None, self.alpha)
+            degraded = was_healthy and not health.is_healthy(self.max_error_rate)
+
+        if degraded:
+            # re-check right away instead of waiting for the next round, off the request thread
+            self._wakeup.set()
+
+    def get_health(self, tunnel_cls: Type[AbstractTunnel]) -> Optional[TunnelHealth]:
+        with self._lock:
+            return self._health.get(tunnel_cls)
+
+    def is_healthy(self, tunnel_cls: Type[AbstractTunnel]) -> bool:
+        with self._lock:
+            health = self._health.get(tunnel_cls)
+            return health is not None and health.is_healthy(self.max_error_rate)
+
+    def score(self, tunnel_cls: Type[AbstractTunnel]) -> Optional[float]:
+        with self._lock:
+            health = self._health.get(tunnel_cls)
+            return None if health is None else health.score()
+
+    def get_best_class(self) -> Optional[Type[AbstractTunnel]]:
+        with self._lock:
+            healthy = [health for health in self._health.values() if health.is_healthy(self.max_error_rate)]
+            if not healthy:
+                return None
+            return max(healthy, key=lambda health: health.score()).tunnel_cls
+
+    def subscribe(self, listener: Callable[[TunnelHealthMonitor], None]):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[TunnelHealthMonitor], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self):
+        with self._lock:
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                print('[health] listener failed:', e, file=sys.stderr)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # cleared before the round, a degradation reported during it triggers the next one right away
+            self._wakeup.clear()
+            try:
+                self.check()
+            except Exception as e:
+                print('[health] check failed:', e, file=sys.stderr)
+            self._wakeup.wait(self.interval)
+
+    @staticmethod
+    def _measure(tunnel_cls: Type[AbstractTunnel]) -> Optional[float]:
+        try:
+            return tunnel_cls.measure_latency(use_cache=False)
+        except Exception:
+            return None
+
+
+class _HealthTransport(BaseTransport):
+
+    def __init__(self, wrapped: BaseTransport, tunnel: FailoverTunnel):
+        self.wrapped = wrapped
+        self.tunnel = tunnel
+
+    def handle_request(self, request: Request) -> Response:
+        tunnel_cls = type(self.tunnel.get_owner(str(request.url)))
+        try:
+            response = self.wrapped.handle_request(request)
+        except TransportError:
+            self.tunnel.monitor.record(tunnel_cls, False)
+            raise
+
+        self.tunnel.monitor.record(tunnel_cls, response.status_code not in _GATEWAY_ERRORS)
+        return response
+
+    def close(self):
+        self.wrapped.close()
+
+
+class FailoverTunnel(AbstractTunnel):
+
+    def __init__(
+        self,
+        session: Client,
+        config: ConfigRegistry,
+        monitor: Optional[TunnelHealthMonitor] = None,
+        switch_margin: float = 5,
+        min_switch_interval: float = 60
+    ):
+        super().__init__(session)
+        self._config = config
+
+        self._owns_monitor = monitor is None
+        self.monitor = TunnelHealthMonitor() if monitor is None else monitor
+        self.switch_margin = switch_margin
+        self.min_switch_interval = min_switch_interval
+
+        self._switch_lock = threading.Lock()
+        self._previous: List[AbstractTunnel] = []
+
+        tunnel_cls = self.monitor.get_best_class() or TunnelSelector.get_best_class()
+        self._active = tunnel_cls.construct(session, config)
+        self._switched_at = time.monotonic()
+
+        wrap_transports(session, lambda wrapped: _HealthTransport(wrapped, self))
+        self.monitor.subscribe(self._on_health_changed)
+        self.monitor.start()
+
+    def get_active(self) -> AbstractTunnel:
+        return self._active
+
+    def get_owner(self, url: str) -> AbstractTunnel:
+        active = self._active
+        for tunnel in [active, *self._previous]:
+            if tunnel.recover_url(url) != url:
+                return tunnel
+        return active
+
+    def authenticate(self):
+        self._active.authenticate()
+
+    def reauthenticate(self):
+        self._active.reauthenticate()
+
+    def transform_url(self, url: str) -> str:
+        return self._active.transform_url(url)
+
+    def transform_urls(self, urls: Iterable[str]) -> List[str]:
+        return self._active.transform_urls(urls)
+
+    def recover_url(self, url: str) -> str:
+        # requests issued before a switch still carry urls of the previous tunnels
+        return self.get_owner(url).recover_url(url)
+
+    def transform_cookie(self, **kwargs):
+        return self._active.transform_cookie(**kwargs)
+
+    def recover_cookie(self, **kwargs) -> Optional[dict]:
+        return self._active.recover_cookie(**kwargs)
+
+    def is_session_expired(self, url: str, location: Optional[str], status_code: int) -> bool:
+        return self._active.is_session_expired(url, location, status_code)
+
+    def get_account(self) -> Optional[str]:
+        return self._active.get_account()
+
+    def failover(self, tunnel_cls: Optional[Type[AbstractTunnel]] = None) -> AbstractTunnel:
+        with self._switch_lock:
+            previous = self._active
+            if tunnel_cls is None:
+                tunnel_cls = self.monitor.get_best_class()
+            if tunnel_cls is None:
+                raise RuntimeError('No tunnel available')
+            if tunnel_cls is type(previous):
+                return previous
+
+            print(f'Tunnel switched: {previous.get_name()} -> {tunnel_cls.get_name()}', file=sys.stderr)
+            metrics.TUNNEL_SELECTIONS.inc(tunnel=tunnel_cls.get_name(), reason='failover')
+            tunnel = tunnel_cls.construct(self._session, self._config)
+            self._migrate_cookies(previous, tunnel)
+
+            # the old tunnel stays around for requests still in flight through it
+            self._previous = [previous, *(t for t in self._previous if type(t) is not tunnel_cls)]
+            self._active = tunnel
+            self._switched_at = time.monotonic()
+            return tunnel
+
+    def close(self):
+        self.monitor.unsubscribe(self._on_health_changed)
+        if self._owns_monitor:
+            self.monitor.stop()
+
+        with self._switch_lock:
+            tunnels = [self._active, *self._previous]
+            self._previous = []
+        for tunnel in tunnels:
+            tunnel.close()
+
+    def _migrate_cookies(self, source: AbstractTunnel, target: AbstractTunnel):
+        jar = self._session.cookies.jar
+        for cookie in list(jar):
+            current = {
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path,
+                'secure': cookie.secure
+            }
+            recovered = source.recover_cookie(**dict(current))
+            if recovered is None:
+                continue
+            transformed = target.transform_cookie(**recovered)
+            if transformed == current:
+                continue
+
+            domain = transformed['domain']
+            jar.set_cookie(Cookie(
+                version=cookie.version,
+                name=transformed['name'],
+                value=transformed['value'],
+                port=None,
+                port_specified=False,
+                domain=domain,
+                domain_specified=bool(domain),
+                domain_initial_dot=domain.startswith('.'),
+                path=transformed['path'],
+                path_specified=cookie.path_specified,
+                secure=transformed['secure'],
+                expires=cookie.expires,
+                discard=cookie.discard,
+                comment=None,
+                comment_url=None,
+                rest={}
+            ))
+
+    def _on_health_changed(self, monitor: TunnelHealthMonitor):
+        active_cls = type(self._active)
+        best_cls = monitor.get_best_class()
+        if best_cls is None or best_cls is active_cls:
+            return
+
+        if monitor.is_healthy(active_cls):
+            # only leave a working tunnel for a clearly better one, and not too often
+            if time.monotonic() - self._switched_at < self.min_switch_interval:
+                return
+            if monitor.score(best_cls) < monitor.score(active_cls) + self.switch_margin:
+                return
+
+        try:
+            self.failover(best_cls)
+        except Exception as e:
+            print(f'[failover] failed to switch to {best_cls.get_name()}:', e, file=sys.stderr)
+
+    @classmethod
+    def get_name(cls) -> str:
+        return 'Failover'
+
+    @classmethod
+    def construct(cls, session: Client, config: ConfigRegistry) -> AbstractTunnel:
+        return cls(session, config)
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from ._selector import TunnelSelector
+from ..client import create_client, create_transport
+
+if TYPE_CHECKING:
+    from httpx import BaseTransport, Client
+    from ._base import AbstractTunnel
+    from .._config import ConfigRegistry
+
+
+class _PoolEntry:
+
+    def __init__(self, tunnel: AbstractTunnel):
+        self.tunnel = tunnel
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.authenticated_at = time.monotonic()
+
+
+class _Shared:
+    __slots__ = ('value', 'users')
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.users = 0
+
+
+class TunnelPool:
+
+    def __init__(
+        self,
+        config: ConfigRegistry,
+        session_factory: Optional[Callable[[], Client]] = None,
+        max_size: int = 64,
+        max_leases_per_account: int = 4,
+        idle_timeout: float = 1800,
+        refresh_interval: float = 600,
+        selection_ttl: float = 300
+    ):
+        self._config = config
+        # sessions keep their own cookies, but share one connection pool to the upstream hosts
+        self._transport: Optional[BaseTransport] = None
+        self._session_factory = session_factory or self._new_session
+
+        self.max_size = max_size
+        self.max_leases_per_account = max_leases_per_account
+        self.idle_timeout = idle_timeout
+        self.refresh_interval = refresh_interval
+        self.selection_ttl = selection_ttl
+
+        # leases without a tunnel name use the best tunnel as of the last probe, not one probe per lease
+        self._selection_lock = threading.Lock()
+        self._selected: Optional[Tuple[float, str]] = None
+
+        self._lock = threading.Lock()
+        # keyed by username, tunnel name and password digest, a changed password never gets the old session
+        self._entries: OrderedDict[Tuple[str, str, str], _PoolEntry] = OrderedDict()
+        # only kept while someone waits on them, so they do not pile up for every account ever seen
+        self._key_locks: Dict[Tuple[str, str, str], _Shared] = {}
+        self._account_semaphores: Dict[str, _Shared] = {}
+
+        self._closed = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @contextmanager
+    def lease(
+        self,
+        username: str,
+        password: str,
+        tunnel_name: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Iterator[AbstractTunnel]:
+        if self._closed.is_set():
+            raise RuntimeError('Tunnel pool is closed')
+
+        with self._use_shared(self._account_semaphores, username, self._new_account_semaphore) as semaphore:
+            if not semaphore.acquire(timeout=timeout):
+                raise TimeoutError(f'Timed out waiting for a tunnel of {username}')
+
+            try:
+                entry = self._acquire_entry(username, password, tunnel_name)
+                try:
+                    yield entry.tunnel
+                finally:
+                    with self._lock:
+                        entry.leases -= 1
+                        entry.last_used = time.monotonic()
+                        evicted = self._evict_lru()
+                    for evicted_entry in evicted:
+                        self._close_entry(evicted_entry)
+            finally:
+                semaphore.release()
+
+    def evict(self, username: str, tunnel_name: Optional[str] = None):
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if key[0] == username and (tunnel_name is None or key[1] == tunnel_name) and entry.leases == 0
+            ]
+            entries = [self._entries.pop(key) for key in keys]
+
+        for entry in entries:
+            self._close_entry(entry)
+
+    def close(self):
+        self._closed.set()
+        if self._refresher is not None:
+            self._refresher.join()
+
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+
+        for entry in entries:
+            self._close_entry(entry)
+
+        with self._lock:
+            transport = self._transport
+            self._transport = None
+        if transport is not None:
+            transport.close()
+
+    def _new_session(self) -> Client:
+        with self._lock:
+            if self._transport is None:
+                self._transport = create_transport(self._config)
+            transport = self._transport
+        return create_client(self._config, transport)
+
+    def _new_account_semaphore(self) -> threading.BoundedSemaphore:
+        return threading.BoundedSemaphore(self.max_leases_per_account)
+
+    @contextmanager
+    def _use_shared(self, table: Dict[Hashable, _Shared], key: Hashable, factory: Callable[[], Any]) -> Iterator[Any]:
+        with self._lock:
+            shared = table.get(key)
+            if shared is None:
+                shared = table[key] = _Shared(factory())
+            shared.users += 1
+
+        try:
+            yield shared.value
+        finally:
+            with self._lock:
+                shared.users -= 1
+                if shared.users == 0:
+                    del table[key]
+
+    def _acquire_entry(self, username: str, password: str, tunnel_name: Optional[str]) -> _PoolEntry:
+        # parsed once per login, the tunnel and its persistence see one consistent config
+        config = self._config.snapshot().with_overrides({
+            'CAS_USERNAME': username,
+            'CAS_PASSWORD': password
+        })
+
+        if tunnel_name is None:
+            tunnel_name = self._get_default_tunnel_name()
+        key = (username, tunnel_name, hashlib.sha256(password.encode('utf-8')).hexdigest())
+
+        # only one login per key, concurrent leases wait for it and share the result
+        with self._use_shared(self._key_locks, key, threading.Lock) as key_lock, key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.leases += 1
+                    return entry
+
+            session = self._session_factory()
+            try:
+                tunnel = TunnelSelector.find(tunnel_name).construct(session, config)
+            except Exception:
+                session.close()
+                raise
+            entry = _PoolEntry(tunnel)
+            entry.leases += 1
+
+            with self._lock:
+                # idle sessions signed in with an older password are of no use anymore
+                evicted = [
+                    self._entries.pop(other) for other, other_entry in list(self._entries.items())
+                    if other[:2] == key[:2] and other_entry.leases == 0
+                ]
+                self._entries[key] = entry
+                evicted += self._evict_lru()
+                self._ensure_refresher()
+
+        for evicted_entry in evicted:
+            self._close_entry(evicted_entry)
+
+        return entry
+
+    def _get_default_tunnel_name(self) -> str:
+        with self._selection_lock:
+            if self._selected is None or self._selected[0] <= time.monotonic():
+                tunnel_name = TunnelSelector.get_best_class().get_name()
+                self._selected = (time.monotonic() + self.selection_ttl, tunnel_name)
+            return self._selected[1]
+
+    def _evict_lru(self):
+        evicted = []
+        for key in list(self._entries.keys()):
+            if len(self._entries) <= self.max_size:
+                break
+            if self._entries[key].leases == 0:
+                evicted.append(self._entries.pop(key))
+        return evicted
+
+    def _ensure_refresher(self):
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name='TunnelPoolRefresher', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        interval = min(self.refresh_interval, self.idle_timeout) / 4
+        while not self._closed.wait(interval):
+            now = time.monotonic()
+            with self._lock:
+                idle = [
+                    key for key, entry in self._entries.items()
+                    if entry.leases == 0 and now - entry.last_used > self.idle_timeout
+                ]
+                idle_entries = [self._entries.pop(key) for key in idle]
+                stale = [
+                    (key, entry) for key, entry in self._entries.items()
+                    if now - entry.authenticated_at > self.refresh_interval
+                ]
+
+            for entry in idle_entries:
+                self._close_entry(entry)
+
+            for key, entry in stale:
+                try:
+                    entry.tunnel.authenticate()
+                    entry.authenticated_at = time.monotonic()
+                except Exception as e:
+                    print(f'[pool] failed to refresh tunnel {key[1]} of {key[0]}:', e, file=sys.stderr)
+                    with self._lock:
+                        if self._entries.get(key) is entry and entry.leases == 0:
+                            del self._entries[key]
+                        else:
+                            entry = None
+                    if entry is not None:
+                        self._close_entry(entry)
+
+    @staticmethod
+    def _close_entry(entry: _PoolEntry):
+        try:
+            entry.tunnel.close()
+        except Exception as e:
+            print('[pool] failed to close tunnel:', e, file=sys.stderr)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+POSITIVE_TTL = 600
+NEGATIVE_TTL = 30
+
+_cache: Dict[Tuple[str, int], Tuple[float, Optional[float]]] = {}
+_cache_lock = threading.Lock()
+
+
+def probe(host: str, port: int, timeout: float = 1, use_cache: bool = True) -> Optional[float]:
+    key = (host, port)
+    if use_cache:
+        with _cache_lock:
+            entry = _cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+    started_at = time.monotonic()
+    try:
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.close()
+        latency = time.monotonic() - started_at
+    except OSError:
+        latency = None
+
+    # failures are cached shorter so that a transient outage does not stick
+    ttl = NEGATIVE_TTL if latency is None else POSITIVE_TTL
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + ttl, latency)
+
+    return latency
+
+
+def invalidate(host: Optional[str] = None, port: Optional[int] = None):
+    with _cache_lock:
+        if host is None:
+            _cache.clear()
+        else:
+            _cache.pop((host, port), None)
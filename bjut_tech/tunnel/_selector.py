@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Type
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, List, Optional, Tuple, Type
 
 from .direct import NoTunnel
 from .libziyuan import LibraryTunnel
 from .webvpn import WebvpnTunnel
+from .. import metrics
 
 if TYPE_CHECKING:
     from httpx import Client
@@ -17,6 +20,9 @@ _TUNNELS = [
     WebvpnTunnel
 ]
 
+_LATENCY_WEIGHT = 100  # priority points lost per second of connect latency
+_SELECTION_GRACE = 0.05
+
 
 class TunnelSelector:
 
@@ -25,19 +31,57 @@ class TunnelSelector:
         self._config = config
 
     def get_best(self) -> AbstractTunnel:
-        priorities = []
-        for i, tunnel_cls in enumerate(_TUNNELS):
-            priorities.append((i, tunnel_cls.get_priority()))
+        tunnel_cls = self.get_best_class()
+        print(f'Tunnel selected: [{tunnel_cls.get_priority()}] {tunnel_cls.get_name()}')
+        return tunnel_cls.construct(self._session, self._config)
+
+    @staticmethod
+    def get_best_class() -> Type[AbstractTunnel]:
+        ranking = TunnelSelector.rank()
+        if not ranking:
+            raise RuntimeError('No tunnel available')
+        metrics.TUNNEL_SELECTIONS.inc(tunnel=ranking[0][0].get_name(), reason='selector')
+        return ranking[0][0]
+
+    @staticmethod
+    def score(tunnel_cls: Type[AbstractTunnel], latency: float) -> float:
+        return tunnel_cls.get_priority() - latency * _LATENCY_WEIGHT
 
-        priorities.sort(key=lambda x: x[1], reverse=True)
+    @staticmethod
+    def rank() -> List[Tuple[Type[AbstractTunnel], float]]:
+        started_at = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=len(_TUNNELS))
+        futures = {executor.submit(tunnel_cls.measure_latency): tunnel_cls for tunnel_cls in _TUNNELS}
+
+        available = []
+        pending = set(futures)
+        deadline: Optional[float] = None
+        try:
+            while pending:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # slower probes had their chance, they keep warming the probe cache in background
+                    break
+
+                for future in done:
+                    latency = None if future.exception() else future.result()
+                    if latency is not None:
+                        available.append((futures[future], latency))
+                if not available:
+                    continue
 
-        for i, _ in priorities:
-            tunnel_cls = _TUNNELS[i]
-            if tunnel_cls.is_available():
-                print(f'Tunnel selected: [{tunnel_cls.get_priority()}] {tunnel_cls.get_name()}')
-                return tunnel_cls.construct(self._session, self._config)
+                best_score = max(TunnelSelector.score(*item) for item in available)
+                if all(futures[future].get_priority() <= best_score for future in pending):
+                    break
+                if deadline is None:
+                    # a better tunnel should answer about as fast as the first one did
+                    deadline = started_at + 2 * (time.monotonic() - started_at) + _SELECTION_GRACE
+        finally:
+            executor.shutdown(wait=False)
 
-        raise RuntimeError('No tunnel available')
+        available.sort(key=lambda item: TunnelSelector.score(*item), reverse=True)
+        return available
 
     @staticmethod
     def find(name: str) -> Type[AbstractTunnel]:
@@ -55,7 +99,4 @@ class TunnelSelector:
 
     @staticmethod
     def has_available() -> bool:
-        for tunnel_cls in _TUNNELS:
-            if tunnel_cls.is_available():
-                return True
-        return False
+        return len(TunnelSelector.rank()) > 0
@@ -1,34 +1,16 @@
 from __future__ import annotations
 
-import socket
-import time
-from functools import lru_cache
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
-from ._base import AbstractTunnel
+from ._base import AbstractTunnel, AsyncAbstractTunnel
+from ._probe import probe
 
 if TYPE_CHECKING:
-    from httpx import Client
+    from httpx import AsyncClient, Client
     from .._config import ConfigRegistry
 
 
-@lru_cache(maxsize=1)
-def availability_check(time_hash) -> bool:
-    del time_hash  # invalidate cache when time_hash changes
-
-    try:
-        # try to connect to a known server
-        sock = socket.create_connection(('172.20.4.15', 80), timeout=1)
-        sock.close()
-        return True
-    except OSError or TimeoutError:
-        return False
-
-
-class NoTunnel(AbstractTunnel):
-
-    def authenticate(self):
-        pass
+class _NoTunnelBase:
 
     def transform_url(self, url: str) -> str:
         return url
@@ -39,6 +21,9 @@ class NoTunnel(AbstractTunnel):
     def transform_cookie(self, **kwargs) -> dict:
         return kwargs
 
+    def recover_cookie(self, **kwargs) -> Optional[dict]:
+        return kwargs
+
     @classmethod
     def get_name(cls) -> str:
         return 'Direct'
@@ -49,8 +34,29 @@ class NoTunnel(AbstractTunnel):
 
     @classmethod
     def is_available(cls) -> bool:
-        return availability_check(time.time() // 600)
+        return cls.measure_latency() is not None
+
+    @classmethod
+    def measure_latency(cls, use_cache: bool = True) -> Optional[float]:
+        # try to connect to a known server
+        return probe('172.20.4.15', 80, use_cache=use_cache)
+
+
+class NoTunnel(_NoTunnelBase, AbstractTunnel):
+
+    def authenticate(self):
+        pass
 
     @classmethod
     def construct(cls, session: Client, config: ConfigRegistry) -> AbstractTunnel:
         return cls(session)
+
+
+class AsyncNoTunnel(_NoTunnelBase, AsyncAbstractTunnel):
+
+    async def authenticate(self):
+        pass
+
+    @classmethod
+    async def construct(cls, session: AsyncClient, config: ConfigRegistry) -> AsyncAbstractTunnel:
+        return cls(session)
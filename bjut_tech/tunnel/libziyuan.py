@@ -2,10 +2,11 @@ from __future__ import annotations
 
 import socket
 from functools import lru_cache
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterable, List, Optional
 from urllib.parse import urlparse
 
-from ._base import AbstractTunnel
+from ._base import AbstractTunnel, split_origin
+from .._flight import single_flight
 from ..auth import LibziyuanAuthentication
 from ..persistence import get_persistence
 
@@ -27,6 +28,64 @@ def availability_check(time_hash) -> bool:
         return False
 
 
+@lru_cache(maxsize=4096)
+def _transform_origin(origin: str) -> Optional[str]:
+    parsed_url = urlparse(origin)
+
+    is_https = parsed_url.scheme == 'https'
+    hostname = parsed_url.hostname
+    port = parsed_url.port
+
+    if hostname.endswith('libziyuan.bjut.edu.cn'):
+        # already webvpn url
+        return None
+    hostname = hostname.replace('-', '--').replace('.', '-')
+
+    if port is None:
+        if is_https:
+            hostname += '-s'
+    elif is_https:
+        hostname += f'-{port}-p-s'
+    else:
+        hostname += f'-{port}-p'
+
+    return f'http://{hostname}.libziyuan.bjut.edu.cn:8118'
+
+
+@lru_cache(maxsize=4096)
+def _recover_origin(origin: str) -> Optional[str]:
+    parsed_url = urlparse(origin)
+
+    if not parsed_url.netloc.endswith('libziyuan.bjut.edu.cn:8118'):
+        # not a webvpn url
+        return None
+
+    subdomain = parsed_url.netloc.replace('.libziyuan.bjut.edu.cn:8118', '')
+
+    parts = subdomain.split('-')
+    is_https = False
+    port = None
+    if parts and parts[-1] == 's':
+        is_https = True
+        parts.pop()
+    if parts and parts[-1] == 'p':
+        parts.pop()
+        if parts and parts[-1].isdigit():
+            port = int(parts[-1])
+            parts.pop()
+
+    hostname = '-'.join(parts)
+    hostname = hostname.replace('--', '\x00')
+    hostname = hostname.replace('-', '.')
+    hostname = hostname.replace('\x00', '-')
+
+    scheme = 'https' if is_https else 'http'
+    if port is not None:
+        return f'{scheme}://{hostname}:{port}'
+    else:
+        return f'{scheme}://{hostname}'
+
+
 class LibraryTunnel(AbstractTunnel):
 
     def __init__(self, session: Client, persistence: AbstractPersistenceProvider, username: str, password: str):
@@ -35,65 +94,34 @@ class LibraryTunnel(AbstractTunnel):
         self.auth = LibziyuanAuthentication(persistence, username, password)
         self.authenticate()
 
+    @single_flight()
     def authenticate(self):
         self.auth.authenticate(self._session)
 
-    def transform_url(self, url: str) -> str:
-        parsed_url = urlparse(url)
-
-        is_https = parsed_url.scheme == 'https'
-        hostname = parsed_url.hostname
-        port = parsed_url.port
+    def get_account(self) -> Optional[str]:
+        return self.auth.username
 
-        if hostname.endswith('libziyuan.bjut.edu.cn'):
-            # already webvpn url
+    def transform_url(self, url: str) -> str:
+        origin, remainder = split_origin(url)
+        transformed_origin = _transform_origin(origin)
+        if transformed_origin is None:
             return url
-        hostname = hostname.replace('-', '--').replace('.', '-')
-
-        if port is None:
-            if is_https:
-                hostname += '-s'
-        elif is_https:
-            hostname += f'-{port}-p-s'
-        else:
-            hostname += f'-{port}-p'
+        return transformed_origin + remainder
 
-        netloc = f'{hostname}.libziyuan.bjut.edu.cn:8118'
-        return parsed_url._replace(scheme='http', netloc=netloc).geturl()
+    def transform_urls(self, urls: Iterable[str]) -> List[str]:
+        transformed = []
+        for url in urls:
+            origin, remainder = split_origin(url)
+            transformed_origin = _transform_origin(origin)
+            transformed.append(url if transformed_origin is None else transformed_origin + remainder)
+        return transformed
 
     def recover_url(self, url: str) -> str:
-        parsed_url = urlparse(url)
-
-        if not parsed_url.netloc.endswith('libziyuan.bjut.edu.cn:8118'):
-            # not a webvpn url
+        origin, remainder = split_origin(url)
+        recovered_origin = _recover_origin(origin)
+        if recovered_origin is None:
             return url
-
-        subdomain = parsed_url.netloc.replace('.libziyuan.bjut.edu.cn:8118', '')
-
-        parts = subdomain.split('-')
-        is_https = False
-        port = None
-        if parts and parts[-1] == 's':
-            is_https = True
-            parts.pop()
-        if parts and parts[-1] == 'p':
-            parts.pop()
-            if parts and parts[-1].isdigit():
-                port = int(parts[-1])
-                parts.pop()
-
-        hostname = '-'.join(parts)
-        hostname = hostname.replace('--', '\x00')
-        hostname = hostname.replace('-', '.')
-        hostname = hostname.replace('\x00', '-')
-
-        scheme = 'https' if is_https else 'http'
-        if port is not None:
-            netloc = f"{hostname}:{port}"
-        else:
-            netloc = hostname
-
-        return parsed_url._replace(scheme=scheme, netloc=netloc).geturl()
+        return recovered_origin + remainder
 
     def transform_cookie(self, **kwargs) -> dict:
         if 'secure' in kwargs:
@@ -111,6 +139,26 @@ class LibraryTunnel(AbstractTunnel):
 
         return kwargs
 
+    def recover_cookie(self, **kwargs) -> Optional[dict]:
+        domain = kwargs.get('domain', '')
+        if not domain.endswith('libziyuan.bjut.edu.cn'):
+            return kwargs
+
+        if domain == '.libziyuan.bjut.edu.cn':
+            if '_-_' not in kwargs['name']:
+                # session of the tunnel itself
+                return None
+            kwargs['name'], original_domain = kwargs['name'].rsplit('_-_', 1)
+            kwargs['domain'] = '.' + original_domain
+            return kwargs
+
+        recovered_origin = _recover_origin(f'http://{domain}:8118')
+        if recovered_origin is None or domain == 'libziyuan.bjut.edu.cn':
+            return None
+        kwargs['domain'] = urlparse(recovered_origin).hostname
+        kwargs['secure'] = recovered_origin.startswith('https')
+        return kwargs
+
     @classmethod
     def get_name(cls) -> str:
         return 'Library WebVPN'
@@ -1,73 +1,96 @@
 from __future__ import annotations
 
-import socket
 import time
-from functools import lru_cache
-from typing import TYPE_CHECKING
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
 from urllib.parse import urlparse
 
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-
-from ._base import AbstractTunnel
-from ..auth import CasAuthentication
+from ._base import AbstractTunnel, AsyncAbstractTunnel, split_origin
+from ._probe import probe
+from ..client import async_prewarm, prewarm
+from ..metrics import instrument_login
+from .._flight import single_flight
+from .._transport import without_reauth
+from ..auth import AsyncCasAuthentication, CasAuthentication
+from ..persistence import NoopPersistenceProvider, get_persistence
 
 if TYPE_CHECKING:
-    from httpx import Client
+    from httpx import AsyncClient, Client, Response
+    from ..persistence import AbstractPersistenceProvider
     from .._config import ConfigRegistry
 
-
-@lru_cache(maxsize=1)
-def availability_check() -> bool:
-    try:
-        sock = socket.create_connection(('webvpn.bjut.edu.cn', 443), timeout=1)
-        sock.close()
-        return True
-    except OSError or TimeoutError:
-        return False
+_CODEC_CACHE_SIZE = 4096
 
 
-class WebvpnTunnel(AbstractTunnel):
+class _WebvpnTunnelBase:
+    base_url = 'https://webvpn.bjut.edu.cn'
+    iv = key = b'wrdvpnisthebest!'
 
-    def __init__(self, session: Client, username: str, password: str):
+    def __init__(self, session):
         super().__init__(session)
 
-        self.base_url = 'https://webvpn.bjut.edu.cn'
-        self.iv = self.key = b'wrdvpnisthebest!'
-        self.auth = CasAuthentication(self, username, password)
-        self.authenticate()
+        parsed_base_url = urlparse(self.base_url)
+        self._base_origin = f'{parsed_base_url.scheme}://{parsed_base_url.netloc}'
 
-    def refresh_info(self):
-        session = self.get_session()
-        url = f'{self.base_url}/user/info'
-        response = session.get(url, params={
-            '_t': round(time.time() * 1000)
-        }, follow_redirects=False)
+        # caches are only valid for the current (key, iv), see _update_info
+        self._origin_cache: Dict[str, str] = {}
+        self._host_cache: Dict[str, Optional[str]] = {}
+
+    def _get_info_request(self) -> dict:
+        return {
+            'url': f'{self.base_url}/user/info',
+            'params': {
+                '_t': round(time.time() * 1000)
+            },
+            'follow_redirects': False
+        }
+
+    def _update_info(self, response: Response):
         if response.status_code != 200:
             raise RuntimeError('Failed to get webvpn info')
         try:
             data = response.json()
-            self.iv = data['wrdvpnIV'].encode()
-            self.key = data['wrdvpnKey'].encode()
+            iv = data['wrdvpnIV'].encode()
+            key = data['wrdvpnKey'].encode()
         except KeyError:
-            pass
+            return
 
-    def check_authentication(self) -> bool:
-        try:
-            self.refresh_info()
-            return True
-        except RuntimeError:
-            return False
+        self._set_cipher(iv, key)
 
-    def authenticate(self):
-        if not self.check_authentication():
-            self.auth.authenticate_oauth(f'{self.base_url}/login?cas_login=true')
-        if not self.check_authentication():
-            raise RuntimeError('Failed to authenticate')
+    def _set_cipher(self, iv: bytes, key: bytes):
+        if iv != self.iv or key != self.key:
+            self.iv = iv
+            self.key = key
+            self._origin_cache = {}
+            self._host_cache = {}
+
+    def _has_session_cookie(self) -> bool:
+        hostname = urlparse(self.base_url).hostname
+        return any(cookie.domain.lstrip('.') == hostname for cookie in self.get_session().cookies.jar)
 
     def transform_url(self, url: str) -> str:
-        parsed_base_url = urlparse(self.base_url)
-        parsed_url = urlparse(url)
+        origin, remainder = split_origin(url)
+        prefix = self._origin_cache.get(origin)
+        if prefix is None:
+            prefix = self._transform_origin(origin)
+        return prefix + remainder
+
+    def transform_urls(self, urls: Iterable[str]) -> List[str]:
+        cache = self._origin_cache
+        transformed = []
+        for url in urls:
+            origin, remainder = split_origin(url)
+            prefix = cache.get(origin)
+            if prefix is None:
+                prefix = self._transform_origin(origin)
+            transformed.append(prefix + remainder)
+        return transformed
+
+    def _transform_origin(self, origin: str) -> str:
+        from Crypto.Cipher import AES
+        from Crypto.Util.Padding import pad
+
+        parsed_url = urlparse(origin)
         domain = parsed_url.hostname
 
         cipher = AES.new(self.key, AES.MODE_CFB, iv=self.iv, segment_size=128)
@@ -77,9 +100,12 @@ class WebvpnTunnel(AbstractTunnel):
         path = f'/{parsed_url.scheme}'
         if parsed_url.port:
             path += f'-{parsed_url.port}'
-        path += f'/{encoded}{parsed_url.path}'
+        prefix = f'{self._base_origin}{path}/{encoded}'
 
-        return parsed_url._replace(scheme=parsed_base_url.scheme, netloc=parsed_base_url.netloc, path=path).geturl()
+        if len(self._origin_cache) >= _CODEC_CACHE_SIZE:
+            self._origin_cache = {}
+        self._origin_cache[origin] = prefix
+        return prefix
 
     def recover_url(self, url: str) -> str:
         parsed_url = urlparse(url)
@@ -102,20 +128,11 @@ class WebvpnTunnel(AbstractTunnel):
         else:
             encoded_host, remainder_path = parts
 
-        iv_hex = encoded_host[:32]
-        encoded_host = encoded_host[32:]
-        if len(iv_hex) < 32:
-            return url
-        try:
-            iv = bytes.fromhex(iv_hex)
-            encoded_host = bytes.fromhex(encoded_host)
-            cipher = AES.new(self.key, AES.MODE_CFB, iv=iv, segment_size=128)
-            decrypted_domain = cipher.decrypt(encoded_host)
-            try:
-                domain = unpad(decrypted_domain, AES.block_size).decode('utf-8')
-            except ValueError:
-                domain = decrypted_domain.decode('utf-8')
-        except ValueError:
+        if encoded_host in self._host_cache:
+            domain = self._host_cache[encoded_host]
+        else:
+            domain = self._decode_host(encoded_host)
+        if domain is None:
             return url
 
         return parsed_url._replace(
@@ -124,10 +141,48 @@ class WebvpnTunnel(AbstractTunnel):
             path=f'/{remainder_path}'
         ).geturl()
 
+    def _decode_host(self, encoded_host: str) -> Optional[str]:
+        from Crypto.Cipher import AES
+        from Crypto.Util.Padding import unpad
+
+        domain = None
+        iv_hex = encoded_host[:32]
+        if len(iv_hex) == 32:
+            try:
+                iv = bytes.fromhex(iv_hex)
+                cipher = AES.new(self.key, AES.MODE_CFB, iv=iv, segment_size=128)
+                decrypted_domain = cipher.decrypt(bytes.fromhex(encoded_host[32:]))
+                try:
+                    domain = unpad(decrypted_domain, AES.block_size).decode('utf-8')
+                except ValueError:
+                    domain = decrypted_domain.decode('utf-8')
+            except ValueError:
+                pass
+
+        if len(self._host_cache) >= _CODEC_CACHE_SIZE:
+            self._host_cache = {}
+        self._host_cache[encoded_host] = domain
+        return domain
+
     def transform_cookie(self, **kwargs):
         # it seems this tunnel does not support setting cookies
         return kwargs
 
+    def recover_cookie(self, **kwargs) -> Optional[dict]:
+        if kwargs.get('domain', '').lstrip('.') == urlparse(self.base_url).hostname:
+            # session of the tunnel itself
+            return None
+        return kwargs
+
+    def get_account(self) -> Optional[str]:
+        return self.auth.username
+
+    def is_session_expired(self, url: str, location: Optional[str], status_code: int) -> bool:
+        if status_code == HTTPStatus.UNAUTHORIZED:
+            return True
+        # webvpn sends unauthenticated requests to its own login page
+        return location is not None and location.startswith(f'{self.base_url}/login')
+
     @classmethod
     def get_name(cls) -> str:
         return 'WebVPN'
@@ -138,8 +193,136 @@ class WebvpnTunnel(AbstractTunnel):
 
     @classmethod
     def is_available(cls) -> bool:
-        return availability_check()
+        return cls.measure_latency() is not None
+
+    @classmethod
+    def measure_latency(cls, use_cache: bool = True) -> Optional[float]:
+        return probe('webvpn.bjut.edu.cn', 443, use_cache=use_cache)
+
+
+class WebvpnTunnel(_WebvpnTunnelBase, AbstractTunnel):
+
+    def __init__(
+        self,
+        session: Client,
+        username: str,
+        password: str,
+        persistence: Optional[AbstractPersistenceProvider] = None
+    ):
+        super().__init__(session)
+
+        self.persistence = persistence or NoopPersistenceProvider()
+        self.persistence_key = f'temp/webvpn_session_{username}'
+
+        self.auth = CasAuthentication(self, username, password, self.persistence)
+        self.authenticate()
+
+    def refresh_info(self):
+        session = self.get_session()
+        response = session.get(**self._get_info_request())
+        self._update_info(response)
+
+    def check_authentication(self) -> bool:
+        try:
+            self.refresh_info()
+            return True
+        except RuntimeError:
+            return False
+
+    @single_flight()
+    @without_reauth
+    def authenticate(self):
+        # a fresh session has nothing to check, go straight to the persisted one
+        if self._has_session_cookie() and self.check_authentication():
+            return
+        if self._restore():
+            return
+
+        self._login()
+
+    @single_flight()
+    @without_reauth
+    def reauthenticate(self):
+        self._login()
+
+    @instrument_login('webvpn')
+    def _login(self):
+        with self.persistence.lock(self.persistence_key):
+            if self._restore():
+                return
+
+            # the handshake with webvpn overlaps the cas login that leads there
+            prewarm(self.get_session(), [self.base_url])
+            self.auth.authenticate_oauth(f'{self.base_url}/login?cas_login=true')
+            if not self.check_authentication():
+                raise RuntimeError('Failed to authenticate')
+
+            self.persistence.save(self.persistence_key, self.auth.seal_state({
+                'cookies': self.get_session().cookies.jar,
+                'iv': self.iv,
+                'key': self.key
+            }))
+
+    def _restore(self) -> bool:
+        state = self.persistence.load(self.persistence_key)
+        if not self.auth.check_state(state):
+            # left alone, a session of someone who knows the password is not ours to drop
+            return False
+
+        self.get_session().cookies.update(state['cookies'])
+        self._set_cipher(state['iv'], state['key'])
+        if self.check_authentication():
+            return True
+
+        self.persistence.delete(self.persistence_key)
+        return False
 
     @classmethod
     def construct(cls, session: Client, config: ConfigRegistry) -> AbstractTunnel:
-        return cls(session, config['CAS_USERNAME'], config['CAS_PASSWORD'])
+        # the persisted session and ticket sign in as the account, they are only written if asked for
+        persistence = get_persistence(config) if config.get('WEBVPN_PERSIST_SESSION', False) else None
+        return cls(session, config['CAS_USERNAME'], config['CAS_PASSWORD'], persistence)
+
+
+class AsyncWebvpnTunnel(_WebvpnTunnelBase, AsyncAbstractTunnel):
+
+    def __init__(self, session: AsyncClient, username: str, password: str):
+        super().__init__(session)
+
+        self.auth = AsyncCasAuthentication(self, username, password)
+
+    async def refresh_info(self):
+        session = self.get_session()
+        response = await session.get(**self._get_info_request())
+        self._update_info(response)
+
+    async def check_authentication(self) -> bool:
+        try:
+            await self.refresh_info()
+            return True
+        except RuntimeError:
+            return False
+
+    @single_flight()
+    @without_reauth
+    async def authenticate(self):
+        if not await self.check_authentication():
+            await self._login()
+
+    @single_flight()
+    @without_reauth
+    async def reauthenticate(self):
+        await self._login()
+
+    @instrument_login('webvpn')
+    async def _login(self):
+        async_prewarm(self.get_session(), [self.base_url])
+        await self.auth.authenticate_oauth(f'{self.base_url}/login?cas_login=true')
+        if not await self.check_authentication():
+            raise RuntimeError('Failed to authenticate')
+
+    @classmethod
+    async def construct(cls, session: AsyncClient, config: ConfigRegistry) -> AsyncAbstractTunnel:
+        tunnel = cls(session, config['CAS_USERNAME'], config['CAS_PASSWORD'])
+        await tunnel.authenticate()
+        return tunnel
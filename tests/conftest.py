@@ -0,0 +1,50 @@
+import anyio
+import httpx
+import pytest
+
+from bjut_tech.auth.cas import invalidate_tgt
+from bjut_tech.auth.jwglxt import invalidate_public_key
+from bjut_tech.testing import FakeCampus
+
+ACCOUNTS = {'alice': 'secret', 'bob': 'hunter2'}
+
+
+class AsyncCampusTransport(httpx.AsyncBaseTransport):
+    # FakeCampus is a wsgi app, the async clients reach it through a worker thread
+
+    def __init__(self, campus: FakeCampus):
+        self.wrapped = campus.transport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        response = await anyio.to_thread.run_sync(self.wrapped.handle_request, request)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=response.read(),
+            extensions=response.extensions
+        )
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+def campus():
+    # both caches are process wide, every test starts from a campus nobody is signed in to
+    invalidate_tgt()
+    invalidate_public_key()
+    return FakeCampus(accounts=ACCOUNTS, seed=0)
+
+
+@pytest.fixture
+def session(campus):
+    with httpx.Client(transport=campus.transport()) as client:
+        yield client
+
+
+@pytest.fixture
+def async_session(campus):
+    return httpx.AsyncClient(transport=AsyncCampusTransport(campus))
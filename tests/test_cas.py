@@ -0,0 +1,121 @@
+import httpx
+import pytest
+
+from bjut_tech.auth import AsyncCasAuthentication, CasAuthentication, CasServiceRegistry
+from bjut_tech.auth.cas import _tgt_cache, invalidate_tgt
+from bjut_tech.persistence import TemporaryFilePersistenceProvider
+from bjut_tech.tunnel import AsyncNoTunnel, NoTunnel
+
+JWGLXT_SERVICE = 'https://jwglxt.bjut.edu.cn/sso/jasiglogin'
+WEBVPN_SERVICE = 'https://webvpn.bjut.edu.cn/login?cas_login=true'
+
+
+def _new_session(campus) -> httpx.Client:
+    return httpx.Client(transport=campus.transport())
+
+
+def test_tgt_shared_between_services(campus):
+    first = CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret')
+    second = CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret')
+
+    assert first.authenticate(JWGLXT_SERVICE).url.path == '/xtgl/index_initMenu.html'
+    assert second.authenticate(JWGLXT_SERVICE).url.path == '/xtgl/index_initMenu.html'
+
+    stats = campus.stats()
+    assert stats['cas tgt issued'] == 1
+    assert stats['cas st issued'] == 2
+
+
+def test_tgt_per_account(campus):
+    CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret').authenticate(JWGLXT_SERVICE)
+    CasAuthentication(NoTunnel(_new_session(campus)), 'bob', 'hunter2').authenticate(JWGLXT_SERVICE)
+
+    assert campus.stats()['cas tgt issued'] == 2
+
+
+def test_revoked_tgt_replaced_once(campus):
+    auth = CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret')
+    first = auth.get_ticket_granting_ticket()
+
+    campus.expire_sessions()
+    auth.authenticate(JWGLXT_SERVICE)
+
+    assert auth.get_ticket_granting_ticket() != first
+    assert campus.stats()['cas tgt issued'] == 2
+
+
+def test_wrong_password(campus):
+    auth = CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'wrong')
+    with pytest.raises(ValueError):
+        auth.authenticate(JWGLXT_SERVICE)
+
+
+def test_oauth_signs_in(campus):
+    auth = CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret')
+    response = auth.authenticate_oauth(WEBVPN_SERVICE)
+
+    assert response.url.host == 'webvpn.bjut.edu.cn' and response.text == '<html><body>WebVPN portal</body></html>'
+    assert campus.stats()['cas tgt issued'] == 1
+
+
+def test_oauth_skips_ticket_while_signed_in(campus):
+    session = _new_session(campus)
+    auth = CasAuthentication(NoTunnel(session), 'alice', 'secret')
+    auth.authenticate_oauth(WEBVPN_SERVICE)
+
+    campus.reset_stats()
+    auth.authenticate_oauth(WEBVPN_SERVICE)
+
+    # the session still carries its CASTGC, no ticket is requested
+    assert campus.stats().get('cas.bjut.edu.cn POST', 0) == 0
+
+
+def test_oauth_replaces_revoked_tgt(campus):
+    session = _new_session(campus)
+    auth = CasAuthentication(NoTunnel(session), 'alice', 'secret')
+    auth.authenticate_oauth(WEBVPN_SERVICE)
+
+    campus.expire_sessions()
+    response = auth.authenticate_oauth(WEBVPN_SERVICE)
+
+    assert response.text == '<html><body>WebVPN portal</body></html>'
+    assert campus.stats()['cas tgt issued'] == 2
+
+
+def test_registry_services(campus):
+    registry = CasServiceRegistry(NoTunnel(_new_session(campus)), 'alice', 'secret')
+    with pytest.raises(ValueError):
+        registry.get('jwglxt')
+
+    registry.register('jwglxt', 'https://jwglxt.bjut.edu.cn', JWGLXT_SERVICE)
+    assert registry.authenticate('jwglxt').url.path == '/xtgl/index_initMenu.html'
+
+
+@pytest.mark.anyio
+async def test_async_shares_tgt(campus, async_session):
+    CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret').authenticate(JWGLXT_SERVICE)
+
+    auth = AsyncCasAuthentication(AsyncNoTunnel(async_session), 'alice', 'secret')
+    response = await auth.authenticate(JWGLXT_SERVICE)
+
+    assert response.url.path == '/xtgl/index_initMenu.html'
+    assert campus.stats()['cas tgt issued'] == 1
+
+
+def test_persisted_tgt_needs_the_password(campus, tmp_path):
+    persistence = TemporaryFilePersistenceProvider()
+    persistence.dir = str(tmp_path)
+    ticket = CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret', persistence) \
+        .get_ticket_granting_ticket()
+    state = persistence.load('temp/cas_tgc_alice')
+    assert state['ticket'] == ticket and 'secret' not in repr(state)
+
+    # a fresh process, only the persisted ticket is left
+    invalidate_tgt()
+    with pytest.raises(ValueError):
+        CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'wrong', persistence).get_ticket_granting_ticket()
+    assert _tgt_cache == {}
+
+    auth = CasAuthentication(NoTunnel(_new_session(campus)), 'alice', 'secret', persistence)
+    assert auth.get_ticket_granting_ticket() == ticket
+    assert campus.stats()['cas tgt issued'] == 1
@@ -0,0 +1,165 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from bjut_tech._config import ConfigRegistry
+from bjut_tech.client import (
+    DNS_CACHE,
+    DnsCache,
+    async_prewarm,
+    create_async_client,
+    create_client,
+    create_transport,
+    prewarm
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.ports.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def do_HEAD(self):
+        self.server.ports.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.ports = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_dns_cache_shares_lookups(monkeypatch):
+    lookups = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        lookups.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', port))]
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    cache = DnsCache()
+
+    assert cache.resolve('cas.bjut.edu.cn', 443) == ['10.0.0.1']
+    assert cache.resolve('cas.bjut.edu.cn', 443) == ['10.0.0.1']
+    assert cache.resolve('127.0.0.1', 443) == ['127.0.0.1']
+    assert lookups == ['cas.bjut.edu.cn']
+
+    cache.invalidate('cas.bjut.edu.cn')
+    cache.resolve('cas.bjut.edu.cn', 443)
+    assert len(lookups) == 2
+
+
+def test_client_reuses_connection(server):
+    url = f'http://localhost:{server.server_port}/'
+    DNS_CACHE.invalidate('localhost')
+
+    with create_client() as client:
+        for thread in prewarm(client, [url]):
+            thread.join()
+        assert DNS_CACHE.get('localhost', server.server_port) is not None
+        # connected already, nothing more to warm up
+        assert prewarm(client, [url]) == []
+
+        for _ in range(3):
+            assert client.get(url).text == 'ok'
+        assert client.headers['User-Agent'] == 'Mozilla/5.0'
+
+    assert len(server.ports) == 1
+
+
+def test_dns_cache_disabled(server):
+    config = ConfigRegistry().with_overrides({'DNS_CACHE_TTL': 0})
+    url = f'http://localhost:{server.server_port}/'
+    DNS_CACHE.invalidate('localhost')
+
+    with create_client(config) as client:
+        assert client.get(url).text == 'ok'
+    assert DNS_CACHE.get('localhost', server.server_port) is None
+
+
+def test_shared_transport_outlives_clients(server):
+    url = f'http://127.0.0.1:{server.server_port}/'
+    transport = create_transport()
+
+    first = create_client(transport=transport)
+    second = create_client(transport=transport)
+    assert first.get(url).text == 'ok'
+    first.close()
+    assert second.get(url).text == 'ok'
+    second.close()
+    transport.close()
+
+    assert len(server.ports) == 1
+
+
+def test_prewarm_skips_foreign_transports(server):
+    with httpx.Client() as client:
+        assert prewarm(client, [f'http://127.0.0.1:{server.server_port}/']) == []
+
+
+def _fail_lookup(host, port, *args, **kwargs):
+    raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+
+
+def test_unresolvable_host_is_a_connect_error(monkeypatch):
+    monkeypatch.setattr(socket, 'getaddrinfo', _fail_lookup)
+
+    with create_client() as client:
+        with pytest.raises(httpx.ConnectError):
+            client.get('https://nowhere.bjut.edu.cn/')
+
+
+def test_host_without_addresses_is_a_connect_error(monkeypatch):
+    monkeypatch.setattr(socket, 'getaddrinfo', lambda *args, **kwargs: [])
+
+    with create_client() as client:
+        with pytest.raises(httpx.ConnectError, match='No address'):
+            client.get('https://nowhere.bjut.edu.cn/')
+
+
+def test_refused_connection_is_a_connect_error(server):
+    port = server.server_port
+    server.shutdown()
+    server.server_close()
+
+    with create_client() as client:
+        with pytest.raises(httpx.ConnectError):
+            client.get(f'http://127.0.0.1:{port}/')
+
+
+@pytest.mark.anyio
+async def test_async_client(server, monkeypatch):
+    url = f'http://localhost:{server.server_port}/'
+    DNS_CACHE.invalidate('localhost')
+
+    async with create_async_client() as client:
+        await asyncio.gather(*async_prewarm(client, [url]))
+        assert async_prewarm(client, [url]) == []
+        for _ in range(3):
+            assert (await client.get(url)).text == 'ok'
+    assert len(server.ports) == 1
+
+    monkeypatch.setattr(socket, 'getaddrinfo', _fail_lookup)
+    async with create_async_client() as client:
+        with pytest.raises(httpx.ConnectError):
+            await client.get('https://nowhere.bjut.edu.cn/')
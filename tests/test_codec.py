@@ -0,0 +1,127 @@
+import time
+from fractions import Fraction
+from http.cookiejar import Cookie, CookieJar
+
+import dill
+import pytest
+
+from bjut_tech.persistence import AbstractCodec, TemporaryFilePersistenceProvider, register_codec
+from bjut_tech.persistence import _codec
+
+
+def _cookie(name: str, value: str, expires=None) -> Cookie:
+    return Cookie(
+        0, name, value, None, False, '.bjut.edu.cn', True, True, '/', True,
+        True, expires, expires is None, None, None, {'HttpOnly': None}, False
+    )
+
+
+def _jar(*cookies: Cookie) -> CookieJar:
+    jar = CookieJar()
+    for cookie in cookies:
+        jar.set_cookie(cookie)
+    return jar
+
+
+def _codec_id(data: bytes) -> int:
+    assert data.startswith(_codec._MAGIC)
+    return data[len(_codec._MAGIC)]
+
+
+def test_cookie_jar_round_trip():
+    jar = _jar(_cookie('wengine_vpn_ticket', 'abc'), _cookie('expired', 'x', int(time.time()) - 10))
+
+    data = _codec.encode(jar)
+    decoded = _codec.decode(data)
+
+    assert _codec_id(data) == _codec.CookieJarCodec.id
+    assert [(cookie.name, cookie.value, cookie.domain) for cookie in decoded] == [
+        ('wengine_vpn_ticket', 'abc', '.bjut.edu.cn')
+    ]
+    assert next(iter(decoded)).has_nonstandard_attr('HttpOnly')
+
+
+def test_json_round_trip_with_nested_values():
+    value = {'ticket': 'ST-1', 'expires': 1.5, 'raw': b'\x00\xff', 'cookies': _jar(_cookie('a', 'b')), 'list': [1]}
+
+    data = _codec.encode(value)
+    decoded = _codec.decode(data)
+
+    assert _codec_id(data) == _codec.JsonCodec.id
+    assert decoded['raw'] == b'\x00\xff'
+    assert [cookie.name for cookie in decoded['cookies']] == ['a']
+    assert (decoded['ticket'], decoded['expires'], decoded['list']) == ('ST-1', 1.5, [1])
+
+
+def test_other_values_fall_back_to_dill():
+    for value in [(1, 2), {1: 'int key'}, Fraction(1, 3)]:
+        data = _codec.encode(value)
+        assert _codec_id(data) == _codec.DillCodec.id
+        assert _codec.decode(data) == value
+
+
+def test_compression_only_when_smaller():
+    small = _codec.encode('x', 'zlib')
+    large = _codec.encode('x' * 10000, 'zlib')
+
+    assert small[len(_codec._MAGIC) + 1] == _codec.NoCompression.id
+    assert large[len(_codec._MAGIC) + 1] == _codec.ZlibCompression.id
+    assert len(large) < 1000
+    assert _codec.decode(large) == 'x' * 10000
+
+    with pytest.raises(ValueError):
+        _codec.encode('x', 'lz4')
+
+
+def test_legacy_dill_blob():
+    value = {'ticket': 'ST-1', 'cookies': _jar(_cookie('a', 'b'))}
+    decoded = _codec.decode(dill.dumps(value))
+
+    assert decoded['ticket'] == 'ST-1'
+    assert [cookie.name for cookie in decoded['cookies']] == ['a']
+
+
+def test_legacy_file_still_loads(tmp_path):
+    persistence = TemporaryFilePersistenceProvider()
+    persistence.dir = str(tmp_path)
+    (tmp_path / 'temp').mkdir()
+    (tmp_path / 'temp' / 'legacy.bin').write_bytes(dill.dumps(('old', 'format')))
+
+    assert persistence.load('temp/legacy') == ('old', 'format')
+
+
+def test_corrupt_blob_is_a_miss(tmp_path):
+    persistence = TemporaryFilePersistenceProvider()
+    persistence.dir = str(tmp_path)
+    (tmp_path / 'temp').mkdir()
+    (tmp_path / 'temp' / 'corrupt.bin').write_bytes(_codec._MAGIC + bytes((_codec.JsonCodec.id, 0)) + b'{')
+
+    with pytest.warns(UserWarning):
+        assert persistence.load('temp/corrupt') is None
+
+
+def test_register_codec(monkeypatch):
+    monkeypatch.setattr(_codec, '_CODECS', list(_codec._CODECS))
+
+    class FractionCodec(AbstractCodec):
+        id = 42
+        name = 'fraction'
+
+        def can_encode(self, obj) -> bool:
+            return isinstance(obj, Fraction)
+
+        def encode(self, obj: Fraction) -> bytes:
+            return f'{obj.numerator}/{obj.denominator}'.encode()
+
+        def decode(self, data: bytes) -> Fraction:
+            return Fraction(data.decode())
+
+    register_codec(FractionCodec())
+    data = _codec.encode(Fraction(1, 3), 'zlib')
+
+    assert _codec_id(data) == 42
+    assert _codec.decode(data) == Fraction(1, 3)
+    assert data[len(_codec._MAGIC) + 1] == _codec.NoCompression.id
+
+    with pytest.raises(ValueError):
+        register_codec(FractionCodec())
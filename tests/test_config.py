@@ -0,0 +1,61 @@
+import threading
+
+from bjut_tech._config import ConfigRegistry
+
+
+def test_override_is_scoped():
+    config = ConfigRegistry()
+    config.set_overrides({'PERSISTENCE_TYPE': 'temp'})
+
+    with config.override({'PERSISTENCE_TYPE': 'noop', 'PERSISTENCE_CACHE': True}):
+        assert config.get('PERSISTENCE_TYPE') == 'noop'
+        with config.override({'PERSISTENCE_TYPE': 'oss'}):
+            assert config.get('PERSISTENCE_TYPE') == 'oss'
+            assert config.get('PERSISTENCE_CACHE') is True
+        assert config.get('PERSISTENCE_TYPE') == 'noop'
+
+    assert config.get('PERSISTENCE_TYPE') == 'temp'
+    assert config.get_overrides() == {'PERSISTENCE_TYPE': 'temp'}
+
+
+def test_override_is_per_registry():
+    config = ConfigRegistry()
+    other = ConfigRegistry()
+
+    with config.override({'PERSISTENCE_TYPE': 'noop'}):
+        assert other.get('PERSISTENCE_TYPE', 'temp') == 'temp'
+        assert other.with_overrides({}).get('PERSISTENCE_TYPE', 'temp') == 'temp'
+        # the overrides in effect are carried over
+        assert config.with_overrides({}).get('PERSISTENCE_TYPE') == 'noop'
+
+
+def test_override_is_per_thread():
+    config = ConfigRegistry()
+    seen = []
+
+    with config.override({'PERSISTENCE_TYPE': 'noop'}):
+        thread = threading.Thread(target=lambda: seen.append(config.get('PERSISTENCE_TYPE', 'temp')))
+        thread.start()
+        thread.join()
+
+    assert seen == ['temp']
+
+
+def test_empty_override_unsets(monkeypatch):
+    monkeypatch.delenv('PERSISTENCE_TYPE', raising=False)
+    config = ConfigRegistry()
+    config.set_overrides({'PERSISTENCE_TYPE': 'noop'})
+
+    with config.override({'PERSISTENCE_TYPE': ''}):
+        assert config.get('PERSISTENCE_TYPE', 'temp') == 'temp'
+        assert 'PERSISTENCE_TYPE' not in config.get_overrides()
+
+
+def test_snapshot():
+    config = ConfigRegistry()
+    config.set_overrides({'PERSISTENCE_CACHE_SIZE': 8})
+    snapshot = config.snapshot()
+    config.set_overrides({'PERSISTENCE_CACHE_SIZE': 16})
+
+    assert snapshot.get('PERSISTENCE_CACHE_SIZE') == 8
+    assert snapshot.with_overrides({'PERSISTENCE_CACHE_SIZE': 32}).get('PERSISTENCE_CACHE_SIZE') == 32
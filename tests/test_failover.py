@@ -0,0 +1,100 @@
+import threading
+
+import httpx
+
+from bjut_tech._config import ConfigRegistry
+from bjut_tech.tunnel import FailoverTunnel, NoTunnel, TunnelHealthMonitor
+
+
+class _Tunnel(NoTunnel):
+    latency = 0.01
+    constructed = []
+
+    def __init__(self, session):
+        super().__init__(session)
+        self.closed = False
+        self.constructed.append(self)
+
+    def close(self):
+        self.closed = True
+
+    @classmethod
+    def measure_latency(cls, use_cache: bool = True):
+        return cls.latency
+
+    @classmethod
+    def construct(cls, session, config):
+        return cls(session)
+
+
+class Primary(_Tunnel):
+
+    @classmethod
+    def get_name(cls) -> str:
+        return 'Primary'
+
+    @classmethod
+    def get_priority(cls) -> int:
+        return 200
+
+
+class Backup(_Tunnel):
+
+    @classmethod
+    def get_name(cls) -> str:
+        return 'Backup'
+
+    @classmethod
+    def get_priority(cls) -> int:
+        return 100
+
+
+def _monitor(**kwargs) -> TunnelHealthMonitor:
+    monitor = TunnelHealthMonitor(tunnels=[Primary, Backup], **kwargs)
+    monitor.check()
+    return monitor
+
+
+def test_failover_reports_to_stderr(capsys):
+    monitor = _monitor()
+    tunnel = FailoverTunnel(httpx.Client(), ConfigRegistry(), monitor=monitor)
+    try:
+        assert isinstance(tunnel.get_active(), Primary)
+        assert isinstance(tunnel.failover(Backup), Backup)
+    finally:
+        tunnel.close()
+        monitor.stop()
+
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'Tunnel switched: Primary -> Backup' in captured.err
+
+
+def test_close_closes_all_tunnels():
+    monitor = _monitor()
+    tunnel = FailoverTunnel(httpx.Client(), ConfigRegistry(), monitor=monitor)
+    primary = tunnel.get_active()
+    backup = tunnel.failover(Backup)
+    tunnel.close()
+    monitor.stop()
+
+    assert primary.closed and backup.closed
+    assert tunnel.get_owner('https://www.bjut.edu.cn/') is backup
+
+
+def test_degradation_during_check_is_not_lost(monkeypatch):
+    monitor = TunnelHealthMonitor(interval=60, tunnels=[Primary, Backup])
+    rounds = []
+    second_round = threading.Event()
+
+    def check():
+        rounds.append(len(rounds))
+        if len(rounds) == 1:
+            # reported while the first round is still running
+            monitor._wakeup.set()
+        else:
+            second_round.set()
+
+    monkeypatch.setattr(monitor, 'check', check)
+    with monitor:
+        assert second_round.wait(5)
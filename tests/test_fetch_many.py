@@ -0,0 +1,118 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+from bjut_tech.tunnel import AsyncNoTunnel, NoTunnel, WebvpnTunnel
+
+JWGLXT = 'https://jwglxt.bjut.edu.cn'
+
+
+class Upstream:
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = self.peak = self.count = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        with self.lock:
+            self.active += 1
+            self.count += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            index = int(request.url.params['i'])
+            # later requests finish first
+            time.sleep(self.delay * (10 - index % 10))
+            if request.url.path == '/broken':
+                raise httpx.ConnectError('refused', request=request)
+            return httpx.Response(200, text=f'{request.method} {index}')
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def _urls(count: int, path: str = '/'):
+    return [f'https://www.bjut.edu.cn{path}?i={i}' for i in range(count)]
+
+
+def test_through_webvpn(campus, session):
+    tunnel = WebvpnTunnel(session, 'alice', 'secret')
+    tunnel.authenticate()
+
+    results = list(tunnel.fetch_many([
+        f'{JWGLXT}/xtgl/login_getPublicKey.html',
+        {'url': f'{JWGLXT}/xtgl/login_slogin.html', 'method': 'POST', 'data': {'yhm': 'alice'}},
+        f'{JWGLXT}/xtgl/index_initMenu.html'
+    ], ordered=True))
+
+    assert [result.index for result in results] == [0, 1, 2]
+    assert all(result.ok for result in results)
+    # urls come back in upstream form
+    assert [result.url for result in results] == [
+        f'{JWGLXT}/xtgl/login_getPublicKey.html',
+        f'{JWGLXT}/xtgl/login_slogin.html',
+        f'{JWGLXT}/xtgl/index_initMenu.html'
+    ]
+    assert 'modulus' in results[0].response.json()
+    # jwglxt itself is not signed in yet
+    assert results[2].response.status_code == 302
+    assert campus.stats()['jwglxt.bjut.edu.cn POST'] == 1
+
+
+def test_ordered_and_unordered():
+    upstream = Upstream()
+    tunnel = NoTunnel(httpx.Client(transport=httpx.MockTransport(upstream)))
+
+    ordered = list(tunnel.fetch_many(_urls(6), concurrency=6, ordered=True))
+    unordered = list(tunnel.fetch_many(_urls(6), concurrency=6))
+
+    assert [result.index for result in ordered] == list(range(6))
+    assert [result.response.text for result in ordered] == [f'GET {i}' for i in range(6)]
+    assert [result.index for result in unordered] != list(range(6))
+    assert sorted(result.index for result in unordered) == list(range(6))
+
+
+def test_errors_do_not_stop_the_others():
+    tunnel = NoTunnel(httpx.Client(transport=httpx.MockTransport(Upstream(0))))
+
+    results = list(tunnel.fetch_many(_urls(2) + _urls(1, '/broken'), ordered=True))
+
+    assert [result.ok for result in results] == [True, True, False]
+    assert isinstance(results[2].error, httpx.ConnectError)
+    assert results[2].url == 'https://www.bjut.edu.cn/broken?i=0'
+    assert 'ConnectError' in repr(results[2])
+
+
+def test_concurrency_is_bounded():
+    upstream = Upstream(0.002)
+    tunnel = NoTunnel(httpx.Client(transport=httpx.MockTransport(upstream)))
+
+    assert len(list(tunnel.fetch_many(_urls(30), concurrency=3))) == 30
+    assert upstream.peak <= 3
+
+    with pytest.raises(ValueError):
+        list(tunnel.fetch_many(_urls(1), concurrency=0))
+
+
+def test_leaving_early_skips_the_rest():
+    upstream = Upstream()
+    tunnel = NoTunnel(httpx.Client(transport=httpx.MockTransport(upstream)))
+
+    for _ in tunnel.fetch_many(_urls(50), concurrency=4):
+        break
+
+    assert upstream.count <= 8
+
+
+@pytest.mark.anyio
+async def test_async():
+    upstream = Upstream(0)
+    tunnel = AsyncNoTunnel(httpx.AsyncClient(transport=httpx.MockTransport(upstream)))
+
+    results = [result async for result in tunnel.fetch_many(_urls(5) + _urls(1, '/broken'), ordered=True)]
+
+    assert [result.index for result in results] == list(range(6))
+    assert [result.ok for result in results] == [True] * 5 + [False]
+    assert upstream.peak <= 8
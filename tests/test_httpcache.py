@@ -0,0 +1,133 @@
+import threading
+
+import httpx
+import pytest
+
+from bjut_tech.httpcache import ResponseCache
+from bjut_tech.persistence import TemporaryFilePersistenceProvider
+from bjut_tech.tunnel import AsyncNoTunnel, NoTunnel
+
+URL = 'https://jwglxt.bjut.edu.cn/jwglxt/xtgl/index_cxYhxxIndex.html'
+
+
+class Upstream:
+
+    def __init__(self, etag='"v1"'):
+        self.etag = etag
+        self.requests = []
+        self.gate = None
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.etag is not None and request.headers.get('If-None-Match') == self.etag:
+            return httpx.Response(304)
+        headers = {'Set-Cookie': 'JSESSIONID=fresh'}
+        if self.etag is not None:
+            headers['ETag'] = self.etag
+        return httpx.Response(200, headers=headers, content=f'page {len(self.requests)}'.encode())
+
+
+def _tunnel(upstream: Upstream, cache: ResponseCache, account: str = 'alice') -> NoTunnel:
+    tunnel = NoTunnel(httpx.Client(transport=httpx.MockTransport(upstream)))
+    tunnel.enable_cache(cache, account)
+    return tunnel
+
+
+def test_fresh_hit_is_served_locally():
+    upstream = Upstream()
+    session = _tunnel(upstream, ResponseCache({'jwglxt': 60})).get_session()
+
+    assert session.get(URL).text == 'page 1'
+    session.cookies.clear()
+    response = session.get(URL)
+
+    assert response.text == 'page 1'
+    assert len(upstream.requests) == 1
+    # replaying set-cookie would put a stale session back
+    assert 'set-cookie' not in response.headers
+    assert 'JSESSIONID' not in session.cookies
+
+
+def test_revalidates_with_validators():
+    upstream = Upstream()
+    session = _tunnel(upstream, ResponseCache({'jwglxt': 0})).get_session()
+
+    assert session.get(URL).text == 'page 1'
+    assert session.get(URL).text == 'page 1'
+    assert upstream.requests[1].headers['If-None-Match'] == '"v1"'
+
+    upstream.etag = '"v2"'
+    assert session.get(URL).text == 'page 3'
+    assert session.get(URL, headers={'Cache-Control': 'no-cache'}).text == 'page 3'
+    assert len(upstream.requests) == 4
+
+
+def test_bypasses_uncacheable_requests():
+    upstream = Upstream(etag=None)
+    session = _tunnel(upstream, ResponseCache({'jwglxt': 0})).get_session()
+
+    # no validator, nothing to revalidate with
+    session.get(URL)
+    session.get(URL)
+    session.post(URL)
+    session.get(URL, headers={'If-None-Match': '"mine"'})
+    session.get('https://cas.bjut.edu.cn/login')
+
+    assert len(upstream.requests) == 5
+
+
+def test_accounts_are_kept_apart():
+    upstream = Upstream()
+    cache = ResponseCache({'jwglxt': 60})
+
+    assert _tunnel(upstream, cache, 'alice').get_session().get(URL).text == 'page 1'
+    assert _tunnel(upstream, cache, 'bob').get_session().get(URL).text == 'page 2'
+    assert _tunnel(upstream, cache, 'alice').get_session().get(URL).text == 'page 1'
+
+    with pytest.raises(RuntimeError):
+        _tunnel(upstream, cache).enable_cache(cache, 'alice')
+
+
+def test_persisted_entries_survive_a_restart(tmp_path):
+    persistence = TemporaryFilePersistenceProvider()
+    persistence.dir = str(tmp_path)
+    upstream = Upstream()
+
+    _tunnel(upstream, ResponseCache({'jwglxt': 60}, persistence)).get_session().get(URL)
+    response = _tunnel(upstream, ResponseCache({'jwglxt': 60}, persistence)).get_session().get(URL)
+
+    assert response.text == 'page 1'
+    assert len(upstream.requests) == 1
+
+
+def test_concurrent_misses_are_coalesced():
+    upstream = Upstream()
+    upstream.gate = threading.Event()
+    session = _tunnel(upstream, ResponseCache({'jwglxt': 60})).get_session()
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(session.get(URL).text)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while not upstream.requests:
+        pass
+    upstream.gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['page 1'] * 4
+    assert len(upstream.requests) == 1
+
+
+@pytest.mark.anyio
+async def test_async_hit():
+    upstream = Upstream()
+    tunnel = AsyncNoTunnel(httpx.AsyncClient(transport=httpx.MockTransport(upstream)))
+    tunnel.enable_cache(ResponseCache({'jwglxt': 60}), 'alice')
+
+    async with tunnel.get_session() as session:
+        assert (await session.get(URL)).text == 'page 1'
+        assert (await session.get(URL)).text == 'page 1'
+    assert len(upstream.requests) == 1
@@ -0,0 +1,77 @@
+import httpx
+import pytest
+
+from bjut_tech.auth import AsyncJwglxtAuthentication, JwglxtAuthentication
+from bjut_tech.tunnel import AsyncNoTunnel, NoTunnel, WebvpnTunnel
+
+BASE_URL = 'https://jwglxt.bjut.edu.cn'
+
+
+def _redirect(location: str) -> httpx.Response:
+    request = httpx.Request('POST', f'{BASE_URL}/xtgl/login_slogin.html')
+    return httpx.Response(302, headers={'Location': location}, request=request)
+
+
+def test_login(campus, session):
+    auth = JwglxtAuthentication(NoTunnel(session), BASE_URL, 'alice', 'secret')
+    auth.authenticate()
+
+    assert auth.check()
+    # key and login page, then the post, the redirect proves the login without another check
+    assert campus.stats()['jwglxt.bjut.edu.cn POST'] == 1
+
+
+def test_login_through_webvpn(session):
+    tunnel = WebvpnTunnel(session, 'alice', 'secret')
+    auth = JwglxtAuthentication(tunnel, BASE_URL, 'alice', 'secret')
+    auth.authenticate()
+
+    assert auth.check()
+
+
+def test_wrong_password(campus, session):
+    auth = JwglxtAuthentication(NoTunnel(session), BASE_URL, 'alice', 'wrong')
+    with pytest.raises(RuntimeError):
+        auth.authenticate()
+    assert not auth.check()
+
+
+@pytest.mark.parametrize('location, expected', [
+    (f'{BASE_URL}/xtgl/index_initMenu.html', True),
+    ('/xtgl/index_initMenu.html', True),
+    (f'{BASE_URL}/xtgl/login_slogin.html', False),
+    ('https://cas.bjut.edu.cn/login', False),
+    ('https://jwglxt.bjut.edu.cn.example.com/xtgl/index_initMenu.html', False)
+])
+def test_check_login_response(session, location, expected):
+    auth = JwglxtAuthentication(NoTunnel(session), BASE_URL, 'alice', 'secret')
+    assert auth._check_login_response(_redirect(location)) is expected
+
+
+def test_unrecognized_redirect_is_checked(campus, session):
+    # a redirect out of the system does not count as a login, the session is checked instead
+    def redirect_elsewhere(response: httpx.Response):
+        if response.request.method == 'POST':
+            response.headers['Location'] = 'https://cas.bjut.edu.cn/login'
+
+    session.event_hooks['response'].append(redirect_elsewhere)
+    auth = JwglxtAuthentication(NoTunnel(session), BASE_URL, 'alice', 'secret')
+    auth.authenticate()
+
+    assert campus.stats()['jwglxt.bjut.edu.cn POST'] == 1
+    assert campus.stats()['jwglxt.bjut.edu.cn GET'] == 4
+
+
+@pytest.mark.anyio
+async def test_async_login(async_session):
+    auth = AsyncJwglxtAuthentication(AsyncNoTunnel(async_session), BASE_URL, 'alice', 'secret')
+    await auth.authenticate()
+
+    assert await auth.check()
+
+
+@pytest.mark.anyio
+async def test_async_wrong_password(async_session):
+    auth = AsyncJwglxtAuthentication(AsyncNoTunnel(async_session), BASE_URL, 'alice', 'wrong')
+    with pytest.raises(RuntimeError):
+        await auth.authenticate()
@@ -0,0 +1,160 @@
+import threading
+from http.cookiejar import CookieJar
+
+from bjut_tech._config import ConfigRegistry
+from bjut_tech.persistence import AbstractPersistenceProvider, CachedPersistenceProvider, get_persistence
+from bjut_tech.persistence._codec import encode_cookies
+
+
+class MemoryPersistenceProvider(AbstractPersistenceProvider):
+
+    def __init__(self):
+        self.data = {}
+        self.saving = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+
+    def load(self, name: str):
+        data = self.data.get(name)
+        return None if data is None else self._deserialize(data)
+
+    def save(self, name: str, obj):
+        self.saving.set()
+        self.proceed.wait()
+        self.data[name] = self._serialize(obj)
+
+    def delete(self, name: str):
+        self.data.pop(name, None)
+
+
+def test_save_keeps_a_copy():
+    backend = MemoryPersistenceProvider()
+    persistence = CachedPersistenceProvider(backend, write_behind=True, flush_interval=60)
+
+    obj = {'token': 'a'}
+    persistence.save('session', obj)
+    obj['token'] = 'b'
+    assert persistence.load('session') == {'token': 'a'}
+
+    loaded = persistence.load('session')
+    loaded['token'] = 'c'
+    assert persistence.load('session') == {'token': 'a'}
+
+    persistence.flush()
+    assert backend.load('session') == {'token': 'a'}
+
+
+def test_cookie_jar_is_not_shared():
+    backend = MemoryPersistenceProvider()
+    persistence = CachedPersistenceProvider(backend)
+
+    jar = CookieJar()
+    persistence.save('cookies', jar)
+    assert persistence.load('cookies') is not jar
+    assert encode_cookies(persistence.load('cookies')) == encode_cookies(jar)
+
+
+def test_delete_drops_pending_write():
+    backend = MemoryPersistenceProvider()
+    persistence = CachedPersistenceProvider(backend, write_behind=True, flush_interval=60)
+
+    persistence.save('session', 1)
+    persistence.delete('session')
+    persistence.flush()
+
+    assert persistence.load('session') is None
+    assert 'session' not in backend.data
+
+
+def test_delete_waits_for_write_under_way():
+    backend = MemoryPersistenceProvider()
+    persistence = CachedPersistenceProvider(backend, write_behind=True, flush_interval=60)
+    persistence.save('session', 1)
+
+    backend.proceed.clear()
+    flusher = threading.Thread(target=persistence.flush)
+    flusher.start()
+    assert backend.saving.wait(5)
+
+    deleter = threading.Thread(target=persistence.delete, args=('session',))
+    deleter.start()
+    backend.proceed.set()
+    flusher.join(5)
+    deleter.join(5)
+
+    # the delete came last, the write that was already running must not bring the value back
+    assert 'session' not in backend.data
+    assert persistence.load('session') is None
+
+
+def test_evicted_pending_write_is_not_read_stale():
+    backend = MemoryPersistenceProvider()
+    backend.save('a', 'old')
+    persistence = CachedPersistenceProvider(backend, max_size=2, write_behind=True, flush_interval=60)
+
+    persistence.save('a', 'new')
+    persistence.save('b', 1)
+    persistence.save('c', 2)
+
+    assert persistence.load('a') == 'new'
+    persistence.save('d', 3)
+    persistence.save('e', 4)
+    assert persistence.load_many(['a', 'b']) == {'a': 'new', 'b': 1}
+
+    persistence.flush()
+    assert backend.load('a') == 'new'
+
+
+def test_expired_pending_write_is_not_read_stale():
+    backend = MemoryPersistenceProvider()
+    backend.save('a', 'old')
+    persistence = CachedPersistenceProvider(backend, ttl=0, write_behind=True, flush_interval=60)
+
+    persistence.save('a', 'new')
+    assert persistence.load('a') == 'new'
+    assert persistence.load_many(['a']) == {'a': 'new'}
+
+
+def test_write_under_way_is_not_read_stale():
+    backend = MemoryPersistenceProvider()
+    backend.save('a', 'old')
+    persistence = CachedPersistenceProvider(backend, max_size=1, write_behind=True, flush_interval=60)
+    persistence.save('a', 'new')
+    persistence.save('b', 1)
+
+    backend.saving.clear()
+    backend.proceed.clear()
+    flusher = threading.Thread(target=persistence.flush)
+    flusher.start()
+    try:
+        assert backend.saving.wait(5)
+        assert persistence.load('a') == 'new'
+    finally:
+        backend.proceed.set()
+        flusher.join(5)
+
+
+def test_flush_writes_latest_value():
+    backend = MemoryPersistenceProvider()
+    persistence = CachedPersistenceProvider(backend, write_behind=True, flush_interval=60)
+
+    persistence.save('session', 1)
+    persistence.save('session', 2)
+    persistence.close()
+
+    assert backend.load('session') == 2
+
+
+def test_get_persistence_shares_cached_provider():
+    config = ConfigRegistry().with_overrides({
+        'PERSISTENCE_TYPE': 'noop',
+        'PERSISTENCE_CACHE': True,
+        'PERSISTENCE_CACHE_TTL': 17
+    })
+
+    persistence = get_persistence(config)
+    assert isinstance(persistence, CachedPersistenceProvider)
+    assert get_persistence(config.with_overrides({})) is persistence
+    assert get_persistence(config.with_overrides({'PERSISTENCE_CACHE_TTL': 18})) is not persistence
+    uncached = get_persistence(config.with_overrides({'PERSISTENCE_CACHE': False}))
+    assert not isinstance(uncached, CachedPersistenceProvider)
@@ -0,0 +1,147 @@
+import threading
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import oss2
+import pytest
+
+from bjut_tech.persistence import OssPersistenceProvider, TemporaryFilePersistenceProvider
+
+
+class FakeBucket:
+    # just enough of oss2.Bucket for the lease lock, on a clock of its own
+
+    def __init__(self):
+        self.objects = {}
+        self.now = 1_000_000_000.0
+        self._lock = threading.Lock()
+
+    def put_object(self, key, data, headers=None):
+        with self._lock:
+            if key in self.objects and (headers or {}).get('x-oss-forbid-overwrite') == 'true':
+                raise oss2.exceptions.ServerError(409, {}, b'', {'Code': 'FileAlreadyExists'})
+            self.objects[key] = (data.encode() if isinstance(data, str) else data, int(self.now))
+
+    def get_object(self, key):
+        with self._lock:
+            if key not in self.objects:
+                raise oss2.exceptions.NoSuchKey(404, {}, b'', {'Code': 'NoSuchKey'})
+            data, last_modified = self.objects[key]
+            return SimpleNamespace(
+                read=lambda: data,
+                last_modified=last_modified,
+                headers={'date': formatdate(self.now, usegmt=True)}
+            )
+
+    def delete_object(self, key):
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def batch_delete_objects(self, keys):
+        for key in keys:
+            self.delete_object(key)
+
+    def list_objects_v2(self, prefix='', **kwargs):
+        with self._lock:
+            keys = sorted(key for key in self.objects if key.startswith(prefix))
+        return SimpleNamespace(
+            object_list=[SimpleNamespace(key=key) for key in keys],
+            prefix_list=[],
+            is_truncated=False,
+            next_continuation_token=''
+        )
+
+
+@pytest.fixture
+def bucket():
+    return FakeBucket()
+
+
+@pytest.fixture
+def oss(bucket):
+    persistence = OssPersistenceProvider(oss2.AnonymousAuth(), 'https://oss.example.com', 'bucket')
+    persistence.bucket = bucket
+    return persistence
+
+
+def _lock_objects(bucket):
+    return sorted(key for key in bucket.objects if '.lock.' in key)
+
+
+def test_lock_and_release(oss, bucket):
+    with oss.lock('state'):
+        assert _lock_objects(bucket) == ['state.bin.lock.1']
+        with pytest.raises(TimeoutError):
+            with oss.lock('state', timeout=0):
+                pass
+
+    assert _lock_objects(bucket) == ['state.bin.lock.1', 'state.bin.lock.2']
+    with oss.lock('state', timeout=0):
+        # older generations are cleaned up by the next holder
+        assert _lock_objects(bucket) == ['state.bin.lock.3']
+
+
+def test_expired_lease_taken_over(oss, bucket):
+    with oss.lock('state', ttl=10):
+        bucket.now += 5
+        with pytest.raises(TimeoutError):
+            with oss.lock('state', timeout=0):
+                pass
+
+        bucket.now += 10
+        assert oss._try_lock('state.bin.lock.', 'next', 60) == 2
+        assert _lock_objects(bucket) == ['state.bin.lock.2']
+
+    # the first holder lost its lease, releasing must not free the lock of the one after it
+    assert _lock_objects(bucket) == ['state.bin.lock.2']
+    with pytest.raises(TimeoutError):
+        with oss.lock('state', timeout=0):
+            pass
+
+
+def test_takeover_has_one_winner(oss, bucket):
+    bucket.put_object('state.bin.lock.1', '{"owner": "crashed", "ttl": 1}')
+    bucket.now += 60
+
+    winners = [oss._try_lock('state.bin.lock.', owner, 60) for owner in ('a', 'b')]
+    assert winners == [2, None]
+
+
+def test_recreated_generation_does_not_count(oss, bucket):
+    with oss.lock('state'):
+        # a contender that listed long ago recreates a generation that was cleaned up
+        bucket.put_object('state.bin.lock.0', '{"owner": null}')
+        assert oss._try_lock('state.bin.lock.', 'late', 60) is None
+
+
+def test_lock_excludes_threads(oss):
+    inside = []
+    overlaps = []
+
+    def work():
+        with oss.lock('state', timeout=30):
+            inside.append(1)
+            overlaps.append(len(inside))
+            time.sleep(0.01)
+            inside.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == [1, 1, 1]
+
+
+def test_temp_lock(tmp_path):
+    persistence = TemporaryFilePersistenceProvider()
+    persistence.dir = str(tmp_path)
+
+    with persistence.lock('state'):
+        with pytest.raises(TimeoutError):
+            with persistence.lock('state', timeout=0.1):
+                pass
+    with persistence.lock('state', timeout=0.1):
+        pass
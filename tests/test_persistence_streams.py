@@ -0,0 +1,216 @@
+import hashlib
+import os
+import threading
+from types import SimpleNamespace
+
+import oss2
+import pytest
+
+from bjut_tech.persistence import (
+    CachedPersistenceProvider,
+    NoopPersistenceProvider,
+    OssPersistenceProvider,
+    TemporaryFilePersistenceProvider
+)
+
+PAYLOAD = os.urandom(100_000)
+
+
+class MultipartBucket:
+    # just enough of oss2.Bucket for streamed objects
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+        self.fail_part = None
+        self._lock = threading.Lock()
+
+    def put_object(self, key, data, headers=None):
+        self.calls.append('put_object')
+        self._store(key, bytes(data))
+
+    def init_multipart_upload(self, key):
+        self.calls.append('init_multipart_upload')
+        with self._lock:
+            upload_id = str(len(self.uploads) + 1)
+            self.uploads[upload_id] = {}
+        return SimpleNamespace(upload_id=upload_id)
+
+    def upload_part(self, key, upload_id, part_number, data):
+        if part_number == self.fail_part:
+            raise oss2.exceptions.ServerError(500, {}, b'', {'Code': 'InternalError'})
+        with self._lock:
+            self.uploads[upload_id][part_number] = data
+        return SimpleNamespace(etag=hashlib.md5(data).hexdigest())
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.calls.append('complete_multipart_upload')
+        with self._lock:
+            uploaded = self.uploads.pop(upload_id)
+        assert [part.part_number for part in parts] == sorted(uploaded)
+        self._store(key, b''.join(uploaded[part.part_number] for part in parts))
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.calls.append('abort_multipart_upload')
+        with self._lock:
+            self.uploads.pop(upload_id, None)
+
+    def head_object(self, key):
+        with self._lock:
+            if key not in self.objects:
+                raise oss2.exceptions.NotFound(404, {}, b'', {'Code': 'NoSuchKey'})
+            data, etag = self.objects[key]
+        return SimpleNamespace(content_length=len(data), etag=etag)
+
+    def get_object(self, key, byte_range=None, headers=None):
+        self.calls.append('get_object')
+        with self._lock:
+            data, etag = self.objects[key]
+        if headers and headers.get('If-Match') != f'"{etag}"':
+            raise oss2.exceptions.PreconditionFailed(412, {}, b'', {'Code': 'PreconditionFailed'})
+        start, end = byte_range
+        return SimpleNamespace(read=lambda: data[start:end + 1])
+
+    def _store(self, key, data):
+        with self._lock:
+            self.objects[key] = (data, hashlib.md5(data).hexdigest().upper())
+
+
+@pytest.fixture
+def temp(tmp_path):
+    persistence = TemporaryFilePersistenceProvider()
+    persistence.dir = str(tmp_path)
+    return persistence
+
+
+@pytest.fixture
+def bucket():
+    return MultipartBucket()
+
+
+@pytest.fixture
+def oss(bucket):
+    persistence = OssPersistenceProvider(
+        oss2.AnonymousAuth(), 'https://oss.example.com', 'bucket', part_size=16384, upload_workers=2
+    )
+    persistence.bucket = bucket
+    return persistence
+
+
+def _write(persistence, name, data, chunk_size=7000):
+    with persistence.open_write(name) as f:
+        for i in range(0, len(data), chunk_size):
+            f.write(data[i:i + chunk_size])
+
+
+def _read(persistence, name):
+    f = persistence.open_read(name)
+    if f is None:
+        return None
+    with f:
+        return f.read()
+
+
+def test_temp_round_trip(temp, tmp_path):
+    assert _read(temp, 'temp/blob') is None
+    _write(temp, 'temp/blob', PAYLOAD)
+
+    assert _read(temp, 'temp/blob') == PAYLOAD
+    assert os.listdir(tmp_path / 'temp') == ['blob.bin']
+
+
+def test_temp_replaces_only_on_clean_close(temp, tmp_path):
+    _write(temp, 'temp/blob', b'old')
+
+    with pytest.raises(RuntimeError):
+        with temp.open_write('temp/blob') as f:
+            f.write(b'new')
+            raise RuntimeError
+
+    writer = temp.open_write('temp/blob')
+    writer.write(b'new')
+    # an open reader keeps the contents it opened
+    reader = temp.open_read('temp/blob')
+    assert _read(temp, 'temp/blob') == b'old'
+    writer.close()
+
+    assert reader.read() == b'old'
+    reader.close()
+    assert _read(temp, 'temp/blob') == b'new'
+    assert os.listdir(tmp_path / 'temp') == ['blob.bin']
+
+
+def test_noop():
+    persistence = NoopPersistenceProvider()
+    _write(persistence, 'temp/blob', PAYLOAD)
+    assert persistence.open_read('temp/blob') is None
+
+
+def test_cached_streams_see_saved_objects(temp):
+    persistence = CachedPersistenceProvider(temp, write_behind=True, flush_interval=60)
+
+    persistence.save('temp/state', {'v': 1})
+    # a pending write reaches the backend before it is read as a stream
+    assert temp._deserialize(_read(persistence, 'temp/state')) == {'v': 1}
+
+    persistence.save('temp/state', {'v': 2})
+    _write(persistence, 'temp/state', temp._serialize({'v': 3}))
+    persistence.flush()
+    # the stream supersedes both the cached and the pending value
+    assert persistence.load('temp/state') == {'v': 3}
+    assert temp.load('temp/state') == {'v': 3}
+    persistence.close()
+
+
+def test_oss_small_object_in_one_request(oss, bucket):
+    _write(oss, 'blob', b'small')
+
+    assert bucket.calls == ['put_object']
+    assert _read(oss, 'blob') == b'small'
+    assert _read(oss, 'missing') is None
+
+
+def test_oss_multipart_round_trip(oss, bucket):
+    _write(oss, 'blob', PAYLOAD)
+
+    assert bucket.calls == ['init_multipart_upload', 'complete_multipart_upload']
+    assert _read(oss, 'blob') == PAYLOAD
+
+    f = oss.open_read('blob')
+    f.seek(50_000)
+    assert f.read(10) == PAYLOAD[50_000:50_010]
+    f.close()
+
+
+def test_oss_reader_is_pinned_to_its_version(oss):
+    _write(oss, 'blob', PAYLOAD)
+    f = oss.open_read('blob')
+    assert f.read(10) == PAYLOAD[:10]
+
+    _write(oss, 'blob', b'replaced')
+    with pytest.raises(oss2.exceptions.PreconditionFailed):
+        f.read()
+    f.close()
+
+
+def test_oss_failed_part_aborts(oss, bucket):
+    _write(oss, 'blob', b'old')
+    bucket.fail_part = 2
+
+    with pytest.raises(oss2.exceptions.ServerError):
+        _write(oss, 'blob', PAYLOAD)
+
+    assert 'abort_multipart_upload' in bucket.calls
+    assert bucket.uploads == {}
+    assert _read(oss, 'blob') == b'old'
+
+
+def test_oss_error_in_block_aborts(oss, bucket):
+    with pytest.raises(RuntimeError):
+        with oss.open_write('blob') as f:
+            f.write(PAYLOAD)
+            raise RuntimeError
+
+    assert bucket.calls[-1] == 'abort_multipart_upload'
+    assert _read(oss, 'blob') is None
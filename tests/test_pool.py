@@ -0,0 +1,80 @@
+import threading
+
+import httpx
+
+from bjut_tech._config import ConfigRegistry
+from bjut_tech.tunnel import TunnelPool, TunnelSelector, WebvpnTunnel
+
+
+def _pool(campus, **kwargs) -> TunnelPool:
+    return TunnelPool(ConfigRegistry(), lambda: httpx.Client(transport=campus.transport()), **kwargs)
+
+
+def test_reuses_tunnel_per_password(campus):
+    with _pool(campus) as pool:
+        with pool.lease('alice', 'secret', 'WebVPN') as first:
+            pass
+        with pool.lease('alice', 'secret', 'WebVPN') as second:
+            assert second is first
+
+        campus.accounts = {**campus.accounts, 'alice': 'changed'}
+        with pool.lease('alice', 'changed', 'WebVPN') as changed:
+            assert changed is not first
+            assert changed.auth.password == 'changed'
+        # the idle session of the old password is gone
+        assert first.get_session().is_closed
+        assert len(pool._entries) == 1
+
+
+def test_drops_locks_and_semaphores_when_unused(campus):
+    with _pool(campus, max_size=1) as pool:
+        for username, password in (('alice', 'secret'), ('bob', 'hunter2')):
+            with pool.lease(username, password, 'WebVPN'):
+                assert username in pool._account_semaphores
+        assert pool._key_locks == {}
+        assert pool._account_semaphores == {}
+        assert len(pool._entries) == 1
+
+
+def test_concurrent_leases_share_one_login(campus):
+    results = []
+    barrier = threading.Barrier(4)
+
+    with _pool(campus) as pool:
+        def worker():
+            barrier.wait()
+            with pool.lease('alice', 'secret', 'WebVPN') as tunnel:
+                results.append(tunnel)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len({id(tunnel) for tunnel in results}) == 1
+        assert pool._key_locks == {}
+
+
+def test_best_tunnel_is_resolved_once(campus, monkeypatch):
+    selections = []
+
+    def get_best_class():
+        selections.append(1)
+        return WebvpnTunnel
+
+    monkeypatch.setattr(TunnelSelector, 'get_best_class', staticmethod(get_best_class))
+
+    with _pool(campus, selection_ttl=60) as pool:
+        for _ in range(3):
+            with pool.lease('alice', 'secret') as tunnel:
+                assert isinstance(tunnel, WebvpnTunnel)
+        assert len(selections) == 1
+
+        pool.selection_ttl = 0
+        pool._selected = None
+        with pool.lease('alice', 'secret'):
+            pass
+        with pool.lease('alice', 'secret'):
+            pass
+        assert len(selections) == 3
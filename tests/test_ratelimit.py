@@ -0,0 +1,132 @@
+import httpx
+import pytest
+
+from bjut_tech import metrics, ratelimit
+from bjut_tech._config import ConfigRegistry
+from bjut_tech._transport import RateLimitTransport
+from bjut_tech.ratelimit import RateLimiter, TokenBucket, backoff_delay
+from bjut_tech.tunnel import NoTunnel
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(ratelimit, 'backoff_delay', lambda attempt, retry_after=None: delays.append(attempt) or 0)
+    return delays
+
+
+def _responder(*statuses):
+    statuses = list(statuses)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(statuses.pop(0) if statuses else 200)
+
+    return handler, requests
+
+
+def _get_transport(handler, limiter: RateLimiter) -> RateLimitTransport:
+    tunnel = NoTunnel(httpx.Client(transport=httpx.MockTransport(handler)))
+    return RateLimitTransport(httpx.MockTransport(handler), tunnel, limiter)
+
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv('RATE_LIMIT', raising=False)
+    limiter = RateLimiter()
+    limiter.configure(ConfigRegistry())
+    assert not limiter.is_enabled()
+
+    handler, requests = _responder(429)
+    transport = _get_transport(handler, limiter)
+    response = transport.handle_request(httpx.Request('GET', 'https://cas.bjut.edu.cn/login'))
+
+    assert response.status_code == 429
+    assert len(requests) == 1
+
+
+def test_enabled_through_config():
+    limiter = RateLimiter()
+    limiter.configure(ConfigRegistry().with_overrides({'RATE_LIMIT': True, 'RATE_LIMIT_RETRIES': 5}))
+    assert limiter.is_enabled()
+    assert limiter.retries == 5
+
+
+def test_retries_throttled_requests(sleeps):
+    limiter = RateLimiter(limits={'cas.bjut.edu.cn': 1000}, enabled=True)
+    handler, requests = _responder(429, 503)
+    transport = _get_transport(handler, limiter)
+
+    retries = metrics.HTTP_RETRIES.get(host='cas.bjut.edu.cn', status='429')
+    response = transport.handle_request(httpx.Request('GET', 'https://cas.bjut.edu.cn/login'))
+
+    assert response.status_code == 200
+    assert len(requests) == 3
+    assert sleeps == [0, 1]
+    assert metrics.HTTP_RETRIES.get(host='cas.bjut.edu.cn', status='429') == retries + 1
+
+
+def test_gives_up_after_retries(sleeps):
+    limiter = RateLimiter(limits={'cas.bjut.edu.cn': 1000}, retries=2, enabled=True)
+    handler, requests = _responder(429, 429, 429, 429)
+    transport = _get_transport(handler, limiter)
+
+    response = transport.handle_request(httpx.Request('GET', 'https://cas.bjut.edu.cn/login'))
+    assert response.status_code == 429
+    assert len(requests) == 3
+
+
+def test_locked_is_not_retried(sleeps):
+    limiter = RateLimiter(limits={'cas.bjut.edu.cn': 1000}, enabled=True)
+    handler, requests = _responder(423)
+    transport = _get_transport(handler, limiter)
+
+    response = transport.handle_request(httpx.Request('GET', 'https://cas.bjut.edu.cn/login'))
+    assert response.status_code == 423
+    assert len(requests) == 1
+    # but it still slows the host down
+    assert limiter.get_bucket('cas.bjut.edu.cn').rate < 1000 * 0.25
+
+
+def test_post_is_not_retried(sleeps):
+    limiter = RateLimiter(limits={'cas.bjut.edu.cn': 1000}, enabled=True)
+    handler, requests = _responder(429, 503)
+    transport = _get_transport(handler, limiter)
+
+    request = httpx.Request('POST', 'https://cas.bjut.edu.cn/v1/tickets', data={'username': 'alice'})
+    assert transport.handle_request(request).status_code == 429
+    request = httpx.Request('PUT', 'https://cas.bjut.edu.cn/v1/x', content=b'x')
+    assert transport.handle_request(request).status_code == 200
+    assert len(requests) == 3
+    assert sleeps == [0]
+
+
+def test_backoff_delay():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt) <= min(30, 0.5 * 2 ** attempt)
+    assert backoff_delay(0, '7') >= 7
+    assert backoff_delay(0, '3600') <= 30
+    # http dates are not honoured, the jittered delay applies
+    assert backoff_delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT') <= 0.5
+
+
+def test_bucket_adapts():
+    bucket = TokenBucket(20)
+    assert bucket.rate == 5
+
+    bucket.on_throttled()
+    assert bucket.rate == pytest.approx(3.5)
+    # a burst of throttled responses only counts once
+    bucket.on_throttled()
+    assert bucket.rate == pytest.approx(3.5)
+
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == 20
+
+
+def test_bucket_paces():
+    bucket = TokenBucket(4)
+    assert bucket.reserve() == 0
+    # one token per second at the initial rate
+    assert bucket.reserve() == pytest.approx(1, abs=0.05)
@@ -0,0 +1,71 @@
+import os
+import stat
+
+import httpx
+import pytest
+
+from bjut_tech._config import ConfigRegistry
+from bjut_tech.auth.cas import invalidate_tgt
+from bjut_tech.persistence import NoopPersistenceProvider, TemporaryFilePersistenceProvider
+from bjut_tech.tunnel import WebvpnTunnel
+
+
+def _config(**overrides) -> ConfigRegistry:
+    return ConfigRegistry().with_overrides({
+        'CAS_USERNAME': 'alice',
+        'CAS_PASSWORD': 'secret',
+        'PERSISTENCE_TYPE': 'temp',
+        'PERSISTENCE_CACHE': False,
+        **overrides
+    })
+
+
+def _temp(tmp_path) -> TemporaryFilePersistenceProvider:
+    persistence = TemporaryFilePersistenceProvider()
+    persistence.dir = str(tmp_path / 'bjut-tech')
+    return persistence
+
+
+def test_login(campus, session):
+    tunnel = WebvpnTunnel(session, 'alice', 'secret')
+
+    assert tunnel.check_authentication()
+    assert campus.stats()['webvpn sessions'] == 1
+
+
+def test_session_not_persisted_by_default(session):
+    tunnel = WebvpnTunnel.construct(session, _config())
+    assert isinstance(tunnel.persistence, NoopPersistenceProvider)
+
+
+def test_session_persisted_when_enabled(campus, session, tmp_path, monkeypatch):
+    monkeypatch.setattr(TemporaryFilePersistenceProvider, 'construct', classmethod(lambda cls, config: _temp(tmp_path)))
+
+    tunnel = WebvpnTunnel.construct(session, _config(WEBVPN_PERSIST_SESSION=True))
+    assert isinstance(tunnel.persistence, TemporaryFilePersistenceProvider)
+
+    # a second client resumes the stored session instead of signing in again
+    with httpx.Client(transport=campus.transport()) as other_session:
+        WebvpnTunnel.construct(other_session, _config(WEBVPN_PERSIST_SESSION=True))
+    assert campus.stats()['webvpn sessions'] == 1
+
+    path = tunnel.persistence.get_path(tunnel.persistence_key)
+    assert stat.S_IMODE((tmp_path / 'bjut-tech').stat().st_mode) == 0o700
+    assert stat.S_IMODE((tmp_path / 'bjut-tech' / 'temp').stat().st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_persisted_session_needs_the_password(campus, session, tmp_path, monkeypatch):
+    monkeypatch.setattr(TemporaryFilePersistenceProvider, 'construct', classmethod(lambda cls, config: _temp(tmp_path)))
+    tunnel = WebvpnTunnel.construct(session, _config(WEBVPN_PERSIST_SESSION=True))
+    state = tunnel.persistence.load(tunnel.persistence_key)
+
+    invalidate_tgt()
+    with httpx.Client(transport=campus.transport()) as other_session:
+        with pytest.raises(ValueError):
+            WebvpnTunnel.construct(other_session, _config(WEBVPN_PERSIST_SESSION=True, CAS_PASSWORD='wrong'))
+        assert not other_session.cookies
+
+    # the owner's session is left in place
+    assert tunnel.persistence.load(tunnel.persistence_key)['key'] == state['key']
+    assert campus.stats()['webvpn sessions'] == 1